@@ -41,6 +41,8 @@ class CampaignAssistantApp:
         try:
             self.retriever = CampaignRetriever(models_directory=models_directory)
             self.assistant = CampaignAssistant(retriever=self.retriever)
+            # Load the models while the user types the first question
+            self.assistant.warm_up(background=True)
         except Exception as e:
             print(f"Erro ao inicializar componentes: {str(e)}")
             sys.exit(1)
@@ -51,12 +53,13 @@ class CampaignAssistantApp:
         
         print("Assistente de Campanha D&D inicializado e pronto para ajudar!")
     
-    def process_query(self, query, explain=True):
+    def process_query(self, query, explain=True, on_token=None):
         """Process a user query with explanation.
         
         Args:
             query: User query string
             explain: Whether to provide explanations
+            on_token: Optional callback receiving the answer text as it is generated
             
         Returns:
             Response dictionary with answer and explanations
@@ -79,12 +82,35 @@ class CampaignAssistantApp:
                     "context": []
                 }
             
-            # Step 2: Generate answer
+            # Step 2: Generate answer from the chunks retrieved above
             start_time = time.time()
-            response = self.assistant.answer_query(query, include_context=True, include_sources=True)
+            first_token = {}
+            stream_callback = None
+            if on_token is not None:
+                def stream_callback(text):
+                    first_token.setdefault("time", time.time() - start_time)
+                    on_token(text)
+            
+            response = self.assistant.answer_from_chunks(
+                query, retrieved_chunks, include_context=True, include_sources=True,
+                on_token=stream_callback
+            )
             generation_time = time.time() - start_time
             
-            print(f"Resposta gerada em {generation_time:.2f}s")
+            if first_token:
+                # Close the answer that was streamed to the terminal
+                print("\n" + "-" * 60)
+            if response and response.get("cached"):
+                print(f"Resposta recuperada do cache em {generation_time:.2f}s")
+            elif first_token:
+                print(f"Resposta gerada em {generation_time:.2f}s (primeiro token em {first_token['time']:.2f}s)")
+            else:
+                print(f"Resposta gerada em {generation_time:.2f}s")
+            
+            if response and "context_tokens" in response:
+                usage = response["context_tokens"]
+                print(f"Contexto: {usage['used']} tokens usados, {usage['dropped']} descartados, "
+                      f"{usage['duplicates']} duplicados removidos")
             
             # Verificar se uma resposta foi gerada
             if not response or "answer" not in response or not response["answer"]:
@@ -94,16 +120,26 @@ class CampaignAssistantApp:
                     "context": [chunk["text"] for chunk in retrieved_chunks]
                 }
             
+            timings = {"retrieval": retrieval_time, "generation": generation_time}
+            if first_token:
+                timings["first_token"] = first_token["time"]
+            response["timings"] = timings
+            
             # Step 3: Generate explanations if requested
             if explain:
                 try:
                     print("Gerando explicações...")
                     
                     start_time = time.time()
-                    explanation = create_simple_explanation(query, retrieved_chunks, response["answer"])
+                    explanation = create_simple_explanation(
+                        query, retrieved_chunks, response["answer"],
+                        models_directory=self.retriever.models_directory,
+                        charts="background", output_dir=self.output_dir
+                    )
                     explanation_time = time.time() - start_time
                     
                     print(f"Explicações geradas em {explanation_time:.2f}s")
+                    timings["explanation"] = explanation_time
                     
                     # Add explanations to response
                     response["explanations"] = explanation
@@ -150,6 +186,11 @@ class CampaignAssistantApp:
                     self.show_help()
                     continue
                 
+                # Check for cache statistics command
+                if query.lower() in ('stats', 'estatisticas'):
+                    self.show_stats()
+                    continue
+                
                 # Process regular query
                 explain = True  # Default to showing explanations
                 
@@ -162,13 +203,31 @@ class CampaignAssistantApp:
                     continue
                 
                 try:   
-                    response = self.process_query(query, explain)
+                    # Print the answer live as it is generated
+                    streamed = []
+                    
+                    def print_token(text):
+                        if not streamed:
+                            print("\n📜 RESPOSTA:")
+                            print("-" * 60)
+                        streamed.append(text)
+                        print(text, end="", flush=True)
                     
-                    # Display the answer
-                    print("\n📜 RESPOSTA:")
-                    print("-" * 60)
-                    print(response.get("answer", "Erro: Nenhuma resposta gerada"))
-                    print("-" * 60)
+                    response = self.process_query(query, explain, on_token=print_token)
+                    
+                    # Display the answer, unless it was already streamed
+                    if streamed and response.get("streaming_failed"):
+                        print("\n⚠️ A geração foi interrompida e a resposta acima está incompleta.")
+                        print(f"Motivo: {response.get('generation_error')}")
+                        print("\n📜 RESPOSTA ALTERNATIVA:")
+                        print("-" * 60)
+                        print(response["answer"])
+                        print("-" * 60)
+                    elif not streamed or "error" in response:
+                        print("\n📜 RESPOSTA:")
+                        print("-" * 60)
+                        print(response.get("answer", "Erro: Nenhuma resposta gerada"))
+                        print("-" * 60)
                     
                     # Display error if present
                     if "error" in response:
@@ -189,7 +248,10 @@ class CampaignAssistantApp:
                         # Inform about visualizations
                         if "visualizations" in response["explanations"]:
                             print("\n🖼️ VISUALIZAÇÕES:")
-                            print(f"As visualizações foram salvas no diretório '{self.output_dir}'.")
+                            if response["explanations"].get("charts") == "background":
+                                print(f"As visualizações estão sendo geradas em segundo plano no diretório '{self.output_dir}'.")
+                            else:
+                                print(f"As visualizações foram salvas no diretório '{self.output_dir}'.")
                             for vis_type, path in response["explanations"]["visualizations"].items():
                                 if path:
                                     print(f"- {vis_type}: {path}")
@@ -257,12 +319,36 @@ class CampaignAssistantApp:
         except Exception as e:
             print(f"\nErro ao exibir explicações: {str(e)}")
     
+    def show_stats(self):
+        """Display the query embedding and semantic cache statistics."""
+        stats = self.retriever.query_cache.stats()
+        print("\n📊 CACHE DE CONSULTAS:")
+        print("-" * 60)
+        print(f"- Acertos: {stats['hits']} (disco: {stats['disk_hits']})")
+        print(f"- Falhas: {stats['misses']}")
+        print(f"- Taxa de acerto: {stats['hit_rate']:.1%}")
+        print(f"- Entradas em memória: {stats['memory_entries']}, em disco: {stats['disk_entries']}")
+        
+        semantic_cache = self.retriever.semantic_cache
+        print("\n📊 CACHE DE PERGUNTAS REFORMULADAS:")
+        print("-" * 60)
+        if semantic_cache is None:
+            print("- Desativado")
+            return
+        stats = semantic_cache.stats()
+        print(f"- Acertos: {stats['hits']}")
+        print(f"- Falhas: {stats['misses']}")
+        print(f"- Taxa de acerto: {stats['hit_rate']:.1%}")
+        print(f"- Perguntas guardadas: {stats['entries']} (removidas: {stats['evictions']})")
+        print(f"- Similaridade mínima: {stats['threshold']}")
+    
     def show_help(self):
         """Display help information."""
         print("\n📋 COMANDOS DISPONÍVEIS:")
         print("-" * 60)
         print("- [sua pergunta]     Pergunte qualquer coisa sobre sua campanha")
         print("- noexp [pergunta]   Pergunte sem mostrar explicações")
+        print("- stats              Mostra estatísticas dos caches de consultas")
         print("- help / ajuda       Mostra esta informação de ajuda")
         print("- exit / sair        Sai do assistente")
         print("\nExemplos:")
@@ -0,0 +1,139 @@
+"""
+Recall@k vs. latency report for the approximate index types.
+Every index type is compared with the brute-force flat index on the same
+vectors. Run from the dnd_assistant directory:
+
+    python -m benchmarks.index_recall                     # campaign chunks
+    python -m benchmarks.index_recall --synthetic 100000  # random clustered vectors
+"""
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import faiss
+
+from retrieval.index_factory import METRICS, build_index, normalize, set_search_params
+
+# Query-time parameter sweeps for each index type
+SWEEPS = {
+    "flat": [None],
+    "ivf_flat": [1, 4, 8, 16, 32],
+    "ivf_pq": [1, 4, 8, 16, 32],
+    "hnsw": [16, 32, 64, 128],
+}
+
+def synthetic_embeddings(num_vectors, dimension=768, num_clusters=100, seed=42):
+    """Clustered random vectors, roughly shaped like sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dimension)).astype('float32')
+    labels = rng.integers(0, num_clusters, num_vectors)
+    noise = rng.standard_normal((num_vectors, dimension)).astype('float32')
+    return centers[labels] + 0.3 * noise
+
+def campaign_embeddings(processed_directory="data/processed"):
+    """Embed the processed campaign chunks with the indexing model."""
+    from sentence_transformers import SentenceTransformer
+    from create_embeddings import EMBEDDING_MODEL, load_chunks
+
+    chunks = load_chunks(processed_directory)
+    model = SentenceTransformer(EMBEDDING_MODEL)
+    return model.encode([chunk["text"] for chunk in chunks]).astype('float32')
+
+def make_queries(embeddings, num_queries, seed=0):
+    """Perturbed copies of corpus vectors, used as queries."""
+    rng = np.random.default_rng(seed)
+    picked = embeddings[rng.integers(0, len(embeddings), num_queries)]
+    noise = rng.standard_normal(picked.shape).astype('float32')
+    return picked + 0.1 * noise * embeddings.std()
+
+def recall_at_k(found, truth):
+    """Fraction of the true top-k neighbours found by the approximate search."""
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+def run_benchmark(embeddings, queries, top_k=5, index_types=None, metric="l2"):
+    """Build every index type and measure recall@k and latency.
+
+    With metric="cosine" the ground truth is exact cosine similarity and
+    queries are normalized, as CampaignRetriever does.
+
+    Returns:
+        List of result dictionaries, one per index type and parameter value
+    """
+    ids = np.arange(len(embeddings))
+    results = []
+
+    if metric == "cosine":
+        queries = normalize(queries)
+        baseline = faiss.IndexFlatIP(embeddings.shape[1])
+        baseline.add(normalize(embeddings))
+    else:
+        baseline = faiss.IndexFlatL2(embeddings.shape[1])
+        baseline.add(embeddings)
+    _, truth = baseline.search(queries, top_k)
+
+    for index_type in index_types or SWEEPS:
+        start_time = time.time()
+        index, built_type = build_index(embeddings, ids, index_type=index_type, metric=metric)
+        build_time = time.time() - start_time
+
+        for value in SWEEPS[built_type]:
+            if built_type == "hnsw":
+                set_search_params(index, ef_search=value)
+            else:
+                set_search_params(index, nprobe=value)
+
+            start_time = time.time()
+            _, found = index.search(queries, top_k)
+            latency = (time.time() - start_time) / len(queries)
+
+            results.append({
+                "index_type": built_type,
+                "param": value,
+                "build_seconds": build_time,
+                "recall_at_k": recall_at_k(found, truth),
+                "ms_per_query": latency * 1000
+            })
+    return results
+
+def print_report(results, top_k):
+    """Print the results as a table."""
+    print(f"\n{'index':<10}{'param':>8}{'build (s)':>12}{f'recall@{top_k}':>12}{'ms/query':>12}")
+    print("-" * 54)
+    for row in results:
+        param = "-" if row["param"] is None else row["param"]
+        print(f"{row['index_type']:<10}{param:>8}{row['build_seconds']:>12.2f}"
+              f"{row['recall_at_k']:>12.3f}{row['ms_per_query']:>12.4f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k vs. latency of the FAISS index types.")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Use N synthetic vectors instead of the campaign chunks")
+    parser.add_argument("--dimension", type=int, default=768, help="Dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--top-k", type=int, default=5, help="Neighbours per query")
+    parser.add_argument("--metric", choices=METRICS, default="cosine", help="Similarity measure")
+    parser.add_argument("--output", default="output/index_recall.json", help="JSON report path")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        embeddings = synthetic_embeddings(args.synthetic, args.dimension)
+    else:
+        embeddings = campaign_embeddings()
+    queries = make_queries(embeddings, args.queries)
+
+    print(f"Benchmarking {len(embeddings)} vectors of dimension {embeddings.shape[1]}...")
+    results = run_benchmark(embeddings, queries, top_k=args.top_k, metric=args.metric)
+    print_report(results, args.top_k)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({"num_vectors": len(embeddings), "top_k": args.top_k, "metric": args.metric,
+                   "results": results}, f, indent=2)
+    print(f"\nReport saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Accuracy parity and latency of the ONNX int8 encoder against PyTorch.
+Each backend runs in its own process, so the reported peak RSS is that of
+the backend alone. The check fails (exit status 1) when the ONNX vectors
+drift too far from the PyTorch ones. Run from the dnd_assistant directory
+after exporting the model with python -m retrieval.onnx_encoder:
+
+    python -m benchmarks.onnx_parity
+    python -m benchmarks.onnx_parity --min-cosine 0.98 --min-overlap 0.9
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from retrieval.manifest import DEFAULT_EMBEDDING_MODEL, load_manifest
+from retrieval.onnx_encoder import ONNX_DIRECTORY
+
+QUERIES = [
+    "Quem é Zephyros?",
+    "Quais são as regiões importantes da campanha?",
+    "O que aconteceu na última sessão?",
+    "Onde fica a cidade de Valória?",
+    "Quais magias o mago conhece?",
+    "Quem governa o reino?",
+    "Que itens mágicos os jogadores encontraram?",
+    "Qual é a história da Torre Negra?",
+]
+
+def _measure_backend(backend, model_name, onnx_directory, texts, queries, batch_size):
+    """Encode the texts and queries with one backend, in a fresh process.
+
+    Returns:
+        Dictionary with the embeddings, latencies and peak RSS
+    """
+    from retrieval.encoding import load_encoder
+
+    start_time = time.time()
+    encoder = load_encoder(model_name, backend, onnx_directory)
+    load_time = time.time() - start_time
+
+    encoder.encode(queries[:1])  # Warm-up
+    latencies = []
+    query_embeddings = []
+    for query in queries:
+        start_time = time.perf_counter()
+        query_embeddings.append(encoder.encode([query])[0])
+        latencies.append(time.perf_counter() - start_time)
+
+    start_time = time.time()
+    text_embeddings = encoder.encode(texts, batch_size=batch_size)
+    encode_time = time.time() - start_time
+
+    return {
+        "backend": backend,
+        "load_seconds": load_time,
+        "query_ms_p50": float(np.percentile(latencies, 50) * 1000),
+        "query_ms_p95": float(np.percentile(latencies, 95) * 1000),
+        "texts_per_second": len(texts) / encode_time if encode_time else 0.0,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "text_embeddings": np.asarray(text_embeddings, dtype='float32'),
+        "query_embeddings": np.asarray(query_embeddings, dtype='float32')
+    }
+
+def _unit(vectors):
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+def cosine_agreement(reference, candidate):
+    """Row-wise cosine similarity between two sets of embeddings."""
+    return (_unit(reference) * _unit(candidate)).sum(axis=1)
+
+def top_k_overlap(corpus, reference_queries, candidate_queries, top_k):
+    """Mean overlap of the top-k chunks found for the same queries.
+
+    The corpus is the PyTorch-encoded chunks, as in an index built with
+    create_embeddings.py, searched by queries from each backend.
+    """
+    corpus = _unit(corpus)
+    overlaps = []
+    for reference, candidate in zip(_unit(reference_queries), _unit(candidate_queries)):
+        expected = set(np.argsort(-(corpus @ reference))[:top_k])
+        found = set(np.argsort(-(corpus @ candidate))[:top_k])
+        overlaps.append(len(expected & found) / len(expected))
+    return float(np.mean(overlaps))
+
+def campaign_texts(processed_directory="data/processed"):
+    from create_embeddings import load_chunks
+    return [chunk["text"] for chunk in load_chunks(processed_directory)]
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX int8 vs. PyTorch embedding parity and latency.")
+    parser.add_argument("--models-directory", default="models", help="Directory with the manifest and onnx/")
+    parser.add_argument("--top-k", type=int, default=5, help="Neighbours compared per query")
+    parser.add_argument("--batch-size", type=int, default=32, help="Batch size for chunk encoding")
+    parser.add_argument("--min-cosine", type=float, default=0.99,
+                        help="Minimum mean cosine agreement between the backends")
+    parser.add_argument("--min-overlap", type=float, default=0.9, help="Minimum mean top-k overlap")
+    parser.add_argument("--output", default="output/onnx_parity.json", help="JSON report path")
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.models_directory) or {}
+    model_name = manifest.get("embedding_model", DEFAULT_EMBEDDING_MODEL)
+    onnx_directory = os.path.join(args.models_directory, ONNX_DIRECTORY)
+    texts = campaign_texts()
+    # Chunk openings make extra queries that look like the corpus
+    queries = QUERIES + [text[:80] for text in texts[:42]]
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for backend in ("torch", "onnx"):
+        print(f"Measuring {backend} backend...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results[backend] = executor.submit(_measure_backend, backend, model_name, onnx_directory,
+                                               texts, queries, args.batch_size).result()
+
+    torch_run, onnx_run = results["torch"], results["onnx"]
+    chunk_agreement = cosine_agreement(torch_run["text_embeddings"], onnx_run["text_embeddings"])
+    query_agreement = cosine_agreement(torch_run["query_embeddings"], onnx_run["query_embeddings"])
+    overlap = top_k_overlap(torch_run["text_embeddings"], torch_run["query_embeddings"],
+                            onnx_run["query_embeddings"], args.top_k)
+
+    report = {
+        "model": model_name,
+        "num_texts": len(texts),
+        "num_queries": len(queries),
+        "top_k": args.top_k,
+        "cosine_mean": float(np.concatenate([chunk_agreement, query_agreement]).mean()),
+        "cosine_min": float(np.concatenate([chunk_agreement, query_agreement]).min()),
+        "top_k_overlap": overlap,
+        "backends": {backend: {key: value for key, value in run.items() if not key.endswith("_embeddings")}
+                     for backend, run in results.items()}
+    }
+
+    print(f"\n{'backend':<10}{'load (s)':>10}{'p50 ms':>10}{'p95 ms':>10}{'texts/s':>10}{'RSS MB':>10}")
+    print("-" * 60)
+    for backend, row in report["backends"].items():
+        print(f"{backend:<10}{row['load_seconds']:>10.2f}{row['query_ms_p50']:>10.2f}"
+              f"{row['query_ms_p95']:>10.2f}{row['texts_per_second']:>10.1f}{row['peak_rss_mb']:>10.0f}")
+    print(f"\nCosine agreement: mean {report['cosine_mean']:.4f}, min {report['cosine_min']:.4f}")
+    print(f"Top-{args.top_k} overlap: {overlap:.3f}")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to {args.output}")
+
+    if report["cosine_mean"] < args.min_cosine or overlap < args.min_overlap:
+        print("Parity check FAILED: the ONNX backend does not match PyTorch closely enough.")
+        sys.exit(1)
+    print("Parity check passed.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Memory, latency and recall of the compressed index types.
+Recall is measured against an exact brute-force search (IndexFlatIP or
+IndexFlatL2) over the same vectors. Run from the dnd_assistant directory:
+
+    python -m benchmarks.quantization                     # campaign chunks
+    python -m benchmarks.quantization --synthetic 100000  # random clustered vectors
+"""
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import faiss
+
+from benchmarks.index_recall import campaign_embeddings, make_queries, recall_at_k, synthetic_embeddings
+from retrieval.index_factory import METRICS, RerankedBinaryIndex, build_index, normalize
+
+STORAGE_TYPES = ("flat", "sq_fp16", "sq_int8", "binary")
+
+# Re-ranking shortlist sizes tried for the binary index
+RERANK_FACTORS = [1, 4, 16, 32]
+
+def index_bytes(index):
+    """Size of an index once serialized, close to its resident memory."""
+    return len(faiss.serialize_index(index))
+
+def run_benchmark(embeddings, queries, top_k=5, storage_types=STORAGE_TYPES, metric="cosine"):
+    """Build every storage type and measure memory, latency and recall@k.
+
+    Returns:
+        List of result dictionaries, one per storage type and re-rank factor
+    """
+    ids = np.arange(len(embeddings))
+    vectors = normalize(embeddings) if metric == "cosine" else embeddings
+    if metric == "cosine":
+        queries = normalize(queries)
+
+    # Exact neighbours, independent of which storage types are benchmarked
+    if metric == "cosine":
+        baseline = faiss.IndexFlatIP(vectors.shape[1])
+    else:
+        baseline = faiss.IndexFlatL2(vectors.shape[1])
+    baseline.add(np.ascontiguousarray(vectors, dtype='float32'))
+    _, truth = baseline.search(np.ascontiguousarray(queries, dtype='float32'), top_k)
+
+    results = []
+    for storage_type in storage_types:
+        start_time = time.time()
+        index, built_type = build_index(embeddings, ids, index_type=storage_type, metric=metric)
+        build_time = time.time() - start_time
+        memory = index_bytes(index)
+
+        runs = [(None, index, 0)]
+        if built_type == "binary":
+            # The float16 re-ranking vectors live on disk, only the shortlist is read
+            rerank_vectors = vectors.astype('float16')
+            runs = [(factor, RerankedBinaryIndex(index, rerank_vectors, metric, rerank_factor=factor),
+                     rerank_vectors.nbytes) for factor in RERANK_FACTORS]
+
+        for factor, searcher, disk in runs:
+            start_time = time.time()
+            _, found = searcher.search(queries, top_k)
+            latency = (time.time() - start_time) / len(queries)
+            results.append({
+                "storage_type": built_type,
+                "rerank_factor": factor,
+                "build_seconds": build_time,
+                "memory_bytes": memory,
+                "bytes_per_vector": memory / len(embeddings),
+                "disk_bytes": disk,
+                "recall_at_k": recall_at_k(found, truth),
+                "ms_per_query": latency * 1000
+            })
+    return results
+
+def print_report(results, top_k):
+    """Print the results as a table."""
+    print(f"\n{'storage':<10}{'rerank':>8}{'memory (MB)':>14}{'B/vector':>10}"
+          f"{f'recall@{top_k}':>12}{'ms/query':>12}")
+    print("-" * 66)
+    for row in results:
+        factor = "-" if row["rerank_factor"] is None else row["rerank_factor"]
+        print(f"{row['storage_type']:<10}{factor:>8}{row['memory_bytes'] / 2**20:>14.2f}"
+              f"{row['bytes_per_vector']:>10.1f}{row['recall_at_k']:>12.3f}{row['ms_per_query']:>12.4f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory, latency and recall of compressed index storage.")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Use N synthetic vectors instead of the campaign chunks")
+    parser.add_argument("--dimension", type=int, default=768, help="Dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--top-k", type=int, default=5, help="Neighbours per query")
+    parser.add_argument("--metric", choices=METRICS, default="cosine", help="Similarity measure")
+    parser.add_argument("--output", default="output/quantization.json", help="JSON report path")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        embeddings = synthetic_embeddings(args.synthetic, args.dimension)
+    else:
+        embeddings = campaign_embeddings()
+    queries = make_queries(embeddings, args.queries)
+
+    print(f"Benchmarking {len(embeddings)} vectors of dimension {embeddings.shape[1]}...")
+    results = run_benchmark(embeddings, queries, top_k=args.top_k, metric=args.metric)
+    print_report(results, args.top_k)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({"num_vectors": len(embeddings), "dimension": int(embeddings.shape[1]),
+                   "top_k": args.top_k, "metric": args.metric, "results": results}, f, indent=2)
+    print(f"\nReport saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Startup benchmark for app.py.
+Measures, in a fresh interpreter, how long it takes to import the app and
+to construct CampaignAssistantApp (models load lazily in the background),
+and lists the slowest imports. Run from the dnd_assistant directory:
+
+    python -m benchmarks.startup --budget 1.0
+"""
+
+import sys
+import json
+import argparse
+import subprocess
+
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.CampaignAssistantApp()
+ready = time.perf_counter()
+print(json.dumps({"import_seconds": imported - start, "ready_seconds": ready - start}))
+"""
+
+def measure_startup():
+    """Time the app startup in a fresh interpreter.
+
+    Returns:
+        Dictionary with import_seconds and ready_seconds
+    """
+    result = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"App failed to start:\n{result.stdout}{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def slowest_imports(limit=10):
+    """Top-level packages imported by app.py, sorted by cumulative import time.
+
+    Returns:
+        List of (package, seconds) tuples
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                            capture_output=True, text=True)
+    by_package = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        if package != "app":
+            by_package[package] = max(by_package.get(package, 0), int(cumulative) / 1e6)
+    timings = sorted(by_package.items(), key=lambda item: item[1], reverse=True)
+    return timings[:limit]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app.py startup time.")
+    parser.add_argument("--budget", type=float, default=1.0,
+                        help="Maximum seconds until the prompt is ready (default: 1.0)")
+    parser.add_argument("--runs", type=int, default=3, help="Number of fresh interpreters to time")
+    args = parser.parse_args()
+
+    runs = [measure_startup() for _ in range(args.runs)]
+    import_seconds = min(run["import_seconds"] for run in runs)
+    ready_seconds = min(run["ready_seconds"] for run in runs)
+
+    print(f"Import app.py:        {import_seconds:.3f}s")
+    print(f"Ready for input:      {ready_seconds:.3f}s (budget {args.budget:.3f}s)")
+
+    print("\nSlowest imports:")
+    for name, seconds in slowest_imports():
+        print(f"  {name:<30}{seconds:.3f}s")
+
+    if ready_seconds > args.budget:
+        print("\nStartup is over budget!")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
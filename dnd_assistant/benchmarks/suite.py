@@ -0,0 +1,521 @@
+"""
+Reproducible benchmark suite on synthetic campaigns of 1k, 100k and 1M chunks.
+For every corpus size it measures ingestion throughput (process_data),
+embedding throughput and query encoding latency (on a sample of the chunks,
+encoding a million chunks on a CPU takes hours), end-to-end
+CampaignRetriever.retrieve latency over an index of a sample of the chunks
+(hybrid fusion, caches and score threshold included), and for every index
+type the build time, p50/p95/p99 search latency, recall@k against the flat
+index and peak RSS. Each stage runs in a fresh process, so its RSS is its own.
+The index vectors are clustered random vectors of the model's dimension.
+
+Results are written as JSON; --baseline compares them with an earlier run
+and exits with status 1 when something regressed. Run from the
+dnd_assistant directory:
+
+    python -m benchmarks.suite                                # 1k and 100k chunks
+    python -m benchmarks.suite --sizes 1k 100k 1m --work-directory /data/bench
+    python -m benchmarks.suite --baseline output/benchmark_suite_v1.json
+    python -m benchmarks.suite --generation-queries 20        # also time GPT-2 answers
+
+The 1m corpus needs about 5 GB of disk and 8 GB of RAM for the flat index.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from retrieval.index_factory import (DEFAULT_RERANK_FACTOR, INDEX_TYPES, METRICS, RerankedBinaryIndex,
+                                     build_index, normalize, set_search_params)
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+# Query-time parameters, the create_embeddings.py defaults
+NPROBE = 8
+EF_SEARCH = 64
+
+# Metrics compared with --baseline, and whether a higher value is better
+STAGE_METRICS = {
+    "ingestion": {"chunks_per_second": True},
+    "embedding": {"texts_per_second": True, "query_ms_p95": False},
+    "bm25": {"build_seconds": False, "search_ms_p95": False},
+    "retrieval": {"search_ms_p95": False, "cached_ms_p95": False, "rephrased_ms_p95": False},
+}
+INDEX_METRICS = {"build_seconds": False, "search_ms_p95": False, "recall_at_k": True, "peak_rss_mb": False}
+
+def peak_rss_mb():
+    """Peak resident memory of this process (ru_maxrss is in KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+def percentiles(latencies):
+    """p50/p95/p99 of a list of seconds, in milliseconds."""
+    values = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {f"ms_p{p}": float(v) for p, v in zip((50, 95, 99), values)}
+
+def run_isolated(function, *args):
+    """Run a stage in a fresh interpreter and return its result dictionary."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(function, *args).result()
+
+def _ingest(raw_directory, processed_directory, workers):
+    from process_data import process_campaign_files
+
+    corpus_bytes = sum(os.path.getsize(os.path.join(raw_directory, name)) for name in os.listdir(raw_directory))
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        chunks = process_campaign_files(raw_directory, processed_directory, workers=workers)
+        seconds = time.perf_counter() - start_time
+    return {
+        "chunks": chunks,
+        "corpus_mb": corpus_bytes / 2**20,
+        "seconds": seconds,
+        "chunks_per_second": chunks / seconds,
+        "mb_per_second": corpus_bytes / 2**20 / seconds,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def _sample_chunks(processed_directory, count, seed=0):
+    """Evenly spread sample of the chunk records of a processed corpus.
+
+    The records are streamed twice, to count them and to pick the sample,
+    so only the sample is held in memory.
+    """
+    from retrieval.chunk_format import iter_chunk_files
+
+    total = sum(1 for _ in iter_chunk_files(processed_directory))
+    rng = np.random.default_rng(seed)
+    picked = set(rng.choice(total, min(count, total), replace=False).tolist())
+    return [record for i, record in enumerate(iter_chunk_files(processed_directory)) if i in picked]
+
+def _embed(processed_directory, model_name, sample_size, num_queries, workers, threads):
+    from retrieval.encoding import encode_texts, load_encoder
+
+    texts = [chunk["text"] for chunk in _sample_chunks(processed_directory, sample_size)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        encode_texts(texts, model_name, workers=workers, threads_per_worker=threads)
+        seconds = time.perf_counter() - start_time
+
+    model = load_encoder(model_name)
+    queries = [" ".join(text.split()[:8]) for text in texts[:num_queries]]
+    model.encode(queries[:1])  # Warm-up
+    latencies = []
+    for query in queries:
+        start_time = time.perf_counter()
+        model.encode([query])
+        latencies.append(time.perf_counter() - start_time)
+
+    result = {"model": model_name, "sample_size": len(texts), "seconds": seconds,
+              "texts_per_second": len(texts) / seconds, "peak_rss_mb": peak_rss_mb()}
+    result.update({f"query_{key}": value for key, value in percentiles(latencies).items()})
+    return result
+
+class _StreamedChunks:
+    """Chunk ID -> chunk pairs of a processed corpus, read from disk on each pass.
+
+    Stands in for the ChunkStore when building the BM25 index, so only the
+    postings are held in memory, as in create_embeddings.
+    """
+
+    def __init__(self, processed_directory):
+        self.processed_directory = processed_directory
+
+    def items(self):
+        from retrieval.chunk_format import iter_chunk_files
+
+        return enumerate(iter_chunk_files(self.processed_directory))
+
+def _bm25(processed_directory, num_queries, top_k):
+    from retrieval.sparse import BM25Index
+
+    start_time = time.perf_counter()
+    index = BM25Index.build(_StreamedChunks(processed_directory))
+    build_seconds = time.perf_counter() - start_time
+
+    latencies = []
+    for chunk in _sample_chunks(processed_directory, num_queries):
+        query = " ".join(chunk["text"].split()[:8])
+        start_time = time.perf_counter()
+        index.search(query, top_k)
+        latencies.append(time.perf_counter() - start_time)
+
+    result = {"build_seconds": build_seconds, "peak_rss_mb": peak_rss_mb()}
+    result.update({f"search_{key}": value for key, value in percentiles(latencies).items()})
+    return result
+
+def _retrieve(processed_directory, models_directory, model_name, sample_size, num_queries, top_k,
+              index_type, metric, score_threshold):
+    """Time CampaignRetriever.retrieve over an index of a sample of the chunks.
+
+    Each query is timed three times: new (encoding, dense and BM25 search,
+    fusion and threshold), repeated (query embedding cache) and with a
+    trailing "?" (a rephrasing, for the semantic cache).
+    """
+    from create_embeddings import create_and_save_embeddings
+    from retrieval.rag import CampaignRetriever
+
+    chunks = _sample_chunks(processed_directory, sample_size, seed=2)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        create_and_save_embeddings(iter(chunks), model_name=model_name, output_directory=models_directory,
+                                   index_type=index_type, metric=metric)
+        build_seconds = time.perf_counter() - start_time
+        retriever = CampaignRetriever(models_directory, top_k=top_k, persist_query_cache=False,
+                                      score_threshold=score_threshold)
+        retriever.warm_up()
+
+    rng = np.random.default_rng(0)
+    picked = rng.choice(len(chunks), min(num_queries, len(chunks)), replace=False)
+    queries = [" ".join(chunks[int(i)]["text"].split()[:8]) for i in picked]
+
+    def timed(queries):
+        latencies = []
+        returned = 0
+        for query in queries:
+            start_time = time.perf_counter()
+            returned += len(retriever.retrieve(query, return_scores=True))
+            latencies.append(time.perf_counter() - start_time)
+        return latencies, returned / len(queries)
+
+    new, results_per_query = timed(queries)
+    repeated, _ = timed(queries)
+    rephrased, _ = timed([f"{query}?" for query in queries])
+
+    semantic = retriever.semantic_cache.stats() if retriever.semantic_cache else None
+    result = {"sample_size": len(chunks), "index_type": index_type, "hybrid": retriever.sparse_index is not None,
+              "score_threshold": score_threshold, "build_seconds": build_seconds,
+              "results_per_query": results_per_query,
+              "query_cache_hit_rate": retriever.query_cache.stats()["hit_rate"],
+              "semantic_cache_hit_rate": semantic["hit_rate"] if semantic else None,
+              "peak_rss_mb": peak_rss_mb()}
+    for name, latencies in (("search", new), ("cached", repeated), ("rephrased", rephrased)):
+        result.update({f"{name}_{key}": value for key, value in percentiles(latencies).items()})
+    return result
+
+def write_synthetic_vectors(path, num_vectors, dimension, num_clusters=100, seed=42, block_size=50_000):
+    """Write clustered random vectors to a .npy file, one block at a time."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dimension)).astype('float32')
+    vectors = np.lib.format.open_memmap(path, mode='w+', dtype='float32', shape=(num_vectors, dimension))
+    for start in range(0, num_vectors, block_size):
+        count = min(block_size, num_vectors - start)
+        labels = rng.integers(0, num_clusters, count)
+        vectors[start:start + count] = centers[labels] + 0.3 * rng.standard_normal((count, dimension))
+    vectors.flush()
+    return path
+
+def write_synthetic_queries(path, vectors_path, num_queries, seed=0):
+    """Perturbed copies of corpus vectors, as in benchmarks.index_recall."""
+    vectors = np.load(vectors_path, mmap_mode='r')
+    rng = np.random.default_rng(seed)
+    picked = np.asarray(vectors[np.sort(rng.integers(0, len(vectors), num_queries))])
+    noise = rng.standard_normal(picked.shape).astype('float32')
+    np.save(path, (picked + 0.1 * noise * picked.std()).astype('float32'))
+    return path
+
+def _index_mode(vectors_path, queries_path, index_type, metric, top_k, truth):
+    embeddings = np.load(vectors_path, mmap_mode='r')
+    queries = np.load(queries_path)
+    if metric == "cosine":
+        queries = normalize(queries)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        index, built_type = build_index(embeddings, np.arange(len(embeddings)), index_type=index_type,
+                                        metric=metric)
+        build_seconds = time.perf_counter() - start_time
+    set_search_params(index, nprobe=NPROBE, ef_search=EF_SEARCH)
+    if built_type == "binary":
+        rerank_vectors = (normalize(embeddings) if metric == "cosine" else np.asarray(embeddings)).astype('float16')
+        index = RerankedBinaryIndex(index, rerank_vectors, metric, rerank_factor=DEFAULT_RERANK_FACTOR)
+
+    # One query at a time, like CampaignRetriever.retrieve
+    latencies = []
+    found = np.empty((len(queries), top_k), dtype='int64')
+    for i, query in enumerate(queries):
+        start_time = time.perf_counter()
+        found[i] = index.search(query.reshape(1, -1), top_k)[1][0]
+        latencies.append(time.perf_counter() - start_time)
+
+    result = {"index_type": index_type, "built_type": built_type, "build_seconds": build_seconds,
+              "peak_rss_mb": peak_rss_mb(), "found": found}
+    result.update({f"search_{key}": value for key, value in percentiles(latencies).items()})
+    if truth is not None:
+        result["recall_at_k"] = sum(len(set(f) & set(t)) for f, t in zip(found, truth)) / truth.size
+    return result
+
+def _generation(processed_directory, num_queries, top_k):
+    from retrieval.rag import CampaignAssistant
+
+    # No retriever is needed, silence the missing index message
+    with contextlib.redirect_stdout(io.StringIO()):
+        assistant = CampaignAssistant(models_directory=processed_directory, answer_cache_size=0)
+        assistant.warm_up(background=False)
+
+    chunks = _sample_chunks(processed_directory, num_queries * top_k, seed=1)
+    latencies = []
+    for i in range(num_queries):
+        context = chunks[i * top_k:(i + 1) * top_k]
+        query = f"O que se sabe sobre {context[0]['text'].split()[1]}?"
+        start_time = time.perf_counter()
+        assistant.answer_from_chunks(query, context)
+        latencies.append(time.perf_counter() - start_time)
+
+    result = {"queries": num_queries, "context_chunks": top_k, "peak_rss_mb": peak_rss_mb()}
+    result.update({f"answer_{key}": value for key, value in percentiles(latencies).items()})
+    return result
+
+def run_size(size, work_directory, args):
+    """Run every stage on a synthetic campaign of the given number of chunks.
+
+    Returns:
+        Result dictionary for this corpus size
+    """
+    from process_data import create_synthetic_campaign
+
+    raw_directory = os.path.join(work_directory, f"raw_{size}")
+    processed_directory = os.path.join(work_directory, f"processed_{size}")
+    if not os.path.isdir(raw_directory):
+        create_synthetic_campaign(raw_directory, size)
+    shutil.rmtree(processed_directory, ignore_errors=True)
+
+    result = {"size": size}
+    print(f"[{size}] Ingestion...")
+    result["ingestion"] = run_isolated(_ingest, raw_directory, processed_directory, args.workers)
+
+    if not args.skip_embedding:
+        print(f"[{size}] Embedding {args.embed_sample} chunks with {args.model}...")
+        result["embedding"] = run_isolated(_embed, processed_directory, args.model, args.embed_sample,
+                                           args.queries // 10 or 1, args.encode_workers, args.encode_threads)
+
+    print(f"[{size}] BM25 index...")
+    result["bm25"] = run_isolated(_bm25, processed_directory, args.queries, args.top_k)
+
+    if not args.skip_embedding:
+        print(f"[{size}] Retrieval over {args.retrieve_sample} chunks...")
+        models_directory = os.path.join(work_directory, f"models_{size}")
+        shutil.rmtree(models_directory, ignore_errors=True)
+        result["retrieval"] = run_isolated(_retrieve, processed_directory, models_directory, args.model,
+                                           args.retrieve_sample, args.queries // 10 or 1, args.top_k,
+                                           args.retrieve_index_type, args.metric, args.score_threshold)
+        shutil.rmtree(models_directory, ignore_errors=True)
+
+    vectors_path = write_synthetic_vectors(os.path.join(work_directory, f"vectors_{size}.npy"),
+                                           result["ingestion"]["chunks"], args.dimension)
+    queries_path = write_synthetic_queries(os.path.join(work_directory, f"queries_{size}.npy"),
+                                           vectors_path, args.queries)
+
+    # The flat index goes first, its results are the exact top-k for recall
+    truth = None
+    result["indexes"] = []
+    for index_type in ["flat"] + [t for t in args.index_types if t != "flat"]:
+        print(f"[{size}] {index_type} index...")
+        row = run_isolated(_index_mode, vectors_path, queries_path, index_type, args.metric, args.top_k, truth)
+        found = row.pop("found")
+        if truth is None:
+            truth = found
+            row["recall_at_k"] = 1.0
+        if index_type in args.index_types:
+            result["indexes"].append(row)
+    os.remove(vectors_path)
+    os.remove(queries_path)
+    return result
+
+def environment():
+    """Versions and hardware the results were measured with."""
+    import faiss
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "git_commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "faiss": getattr(faiss, "__version__", None)
+    }
+
+def _flatten(size_result):
+    """Tracked metrics of one corpus size.
+
+    Returns:
+        Dictionary mapping names like "hnsw.search_ms_p95" to (value,
+        higher is better) pairs
+    """
+    values = {}
+    for stage, metrics in STAGE_METRICS.items():
+        for key, higher_is_better in metrics.items():
+            if key in (size_result.get(stage) or {}):
+                values[f"{stage}.{key}"] = (size_result[stage][key], higher_is_better)
+    for row in size_result.get("indexes", []):
+        for key, higher_is_better in INDEX_METRICS.items():
+            values[f"{row['index_type']}.{key}"] = (row[key], higher_is_better)
+    return values
+
+def compare(report, baseline, tolerance):
+    """Compare tracked metrics with a baseline report.
+
+    Returns:
+        List of (size, metric, baseline value, new value, relative change,
+        regressed) tuples for the metrics present in both reports
+    """
+    previous_sizes = {result["size"]: result for result in baseline.get("results", [])}
+    rows = []
+    for result in report["results"]:
+        if result["size"] not in previous_sizes:
+            continue
+        previous = _flatten(previous_sizes[result["size"]])
+        for name, (value, higher_is_better) in _flatten(result).items():
+            before = previous.get(name, (None,))[0]
+            if not before:
+                continue
+            change = (value - before) / abs(before)
+            regressed = -change > tolerance if higher_is_better else change > tolerance
+            rows.append((result["size"], name, before, value, change, regressed))
+    return rows
+
+def print_report(report):
+    """Print the results as tables."""
+    for result in report["results"]:
+        ingestion = result["ingestion"]
+        print(f"\n=== {result['size']} chunks ({ingestion['chunks']} produced, {ingestion['corpus_mb']:.1f} MB) ===")
+        print(f"Ingestion: {ingestion['chunks_per_second']:.0f} chunks/s, {ingestion['mb_per_second']:.1f} MB/s")
+        if "embedding" in result:
+            embedding = result["embedding"]
+            print(f"Embedding: {embedding['texts_per_second']:.1f} chunks/s, query p50 "
+                  f"{embedding['query_ms_p50']:.1f} ms, p95 {embedding['query_ms_p95']:.1f} ms")
+        bm25 = result["bm25"]
+        print(f"BM25: build {bm25['build_seconds']:.2f}s, search p50 {bm25['search_ms_p50']:.2f} ms, "
+              f"p95 {bm25['search_ms_p95']:.2f} ms")
+        if "retrieval" in result:
+            retrieval = result["retrieval"]
+            print(f"Retrieval ({retrieval['index_type']}, {retrieval['sample_size']} chunks): new p50 "
+                  f"{retrieval['search_ms_p50']:.1f} ms, p95 {retrieval['search_ms_p95']:.1f} ms; repeated p95 "
+                  f"{retrieval['cached_ms_p95']:.2f} ms; rephrased p95 {retrieval['rephrased_ms_p95']:.1f} ms "
+                  f"(semantic cache hit rate {retrieval['semantic_cache_hit_rate'] or 0:.0%})")
+        print(f"\n{'index':<10}{'built':<10}{'build (s)':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+              f"{'recall':>8}{'RSS MB':>9}")
+        print("-" * 74)
+        for row in result["indexes"]:
+            print(f"{row['index_type']:<10}{row['built_type']:<10}{row['build_seconds']:>10.2f}"
+                  f"{row['search_ms_p50']:>9.3f}{row['search_ms_p95']:>9.3f}{row['search_ms_p99']:>9.3f}"
+                  f"{row['recall_at_k']:>8.3f}{row['peak_rss_mb']:>9.0f}")
+    if report.get("generation"):
+        generation = report["generation"]
+        print(f"\nGeneration: p50 {generation['answer_ms_p50']:.0f} ms, p95 {generation['answer_ms_p95']:.0f} ms, "
+              f"p99 {generation['answer_ms_p99']:.0f} ms")
+
+def save_report(report, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def parse_size(value):
+    if value.lower() in SIZES:
+        return SIZES[value.lower()]
+    return int(value)
+
+def main():
+    from retrieval.manifest import DEFAULT_EMBEDDING_MODEL
+
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, embedding and retrieval on synthetic campaigns.")
+    parser.add_argument("--sizes", nargs="+", type=parse_size, default=[SIZES["1k"], SIZES["100k"]],
+                        help="Corpus sizes in chunks: 1k, 100k, 1m or a number (default: 1k 100k)")
+    parser.add_argument("--index-types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES),
+                        help="Index types to build (default: all)")
+    parser.add_argument("--metric", choices=METRICS, default="cosine", help="Similarity measure")
+    parser.add_argument("--dimension", type=int, default=768, help="Dimension of the index vectors")
+    parser.add_argument("--queries", type=int, default=1000, help="Search queries per index")
+    parser.add_argument("--top-k", type=int, default=5, help="Results per query")
+    parser.add_argument("--workers", type=int, default=None, help="Ingestion worker processes")
+    parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL, help="Embedding model")
+    parser.add_argument("--embed-sample", type=int, default=512, help="Chunks encoded to measure embedding")
+    parser.add_argument("--encode-workers", type=int, default=None, help="Embedding worker processes")
+    parser.add_argument("--encode-threads", type=int, default=2, help="Math library threads per embedding worker")
+    parser.add_argument("--retrieve-sample", type=int, default=2000,
+                        help="Chunks indexed to measure end-to-end retrieval")
+    parser.add_argument("--retrieve-index-type", choices=INDEX_TYPES, default="flat",
+                        help="Index type of the end-to-end retrieval stage")
+    parser.add_argument("--score-threshold", type=float, default=None,
+                        help="Score threshold of the end-to-end retrieval stage")
+    parser.add_argument("--skip-embedding", action="store_true",
+                        help="Don't load the embedding model (skips embedding and retrieval)")
+    parser.add_argument("--generation-queries", type=int, default=0,
+                        help="Also time this many generated answers (loads GPT-2)")
+    parser.add_argument("--work-directory", default=None,
+                        help="Keep the synthetic corpora here and reuse them (default: a temporary directory)")
+    parser.add_argument("--output", default="output/benchmark_suite.json", help="JSON report path")
+    parser.add_argument("--baseline", default=None, help="Earlier report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Relative change counted as a regression (default: 0.25)")
+    args = parser.parse_args()
+
+    # Read it before the output file is overwritten, they may be the same
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    report = {
+        "environment": environment(),
+        "config": {"index_types": args.index_types, "metric": args.metric, "dimension": args.dimension,
+                   "queries": args.queries, "top_k": args.top_k, "nprobe": NPROBE, "ef_search": EF_SEARCH,
+                   "embed_sample": args.embed_sample, "retrieve_sample": args.retrieve_sample,
+                   "retrieve_index_type": args.retrieve_index_type, "score_threshold": args.score_threshold},
+        "results": []
+    }
+
+    work_directory = args.work_directory or tempfile.mkdtemp(prefix="campaign_bench_")
+    try:
+        for size in args.sizes:
+            report["results"].append(run_size(size, work_directory, args))
+            # Partial results survive an interrupted 1m run
+            save_report(report, args.output)
+
+        if args.generation_queries:
+            print("Generation...")
+            processed_directory = os.path.join(work_directory, f"processed_{args.sizes[0]}")
+            report["generation"] = run_isolated(_generation, processed_directory, args.generation_queries,
+                                                args.top_k)
+            save_report(report, args.output)
+    finally:
+        if not args.work_directory:
+            shutil.rmtree(work_directory, ignore_errors=True)
+
+    print_report(report)
+    print(f"\nReport saved to {args.output}")
+
+    if baseline is not None:
+        rows = compare(report, baseline, args.tolerance)
+        print(f"\nComparison with {args.baseline} (commit {baseline['environment'].get('git_commit')}):")
+        print(f"{'size':>8}  {'metric':<34}{'before':>12}{'after':>12}{'change':>9}")
+        for size, name, before, after, change, regressed in rows:
+            print(f"{size:>8}  {name:<34}{before:>12.3f}{after:>12.3f}{change:>+9.1%}"
+                  f"{'  REGRESSION' if regressed else ''}")
+        if any(row[-1] for row in rows):
+            print(f"Regressions beyond {args.tolerance:.0%} found.")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,77 +1,341 @@
 import os
 import json
-import pickle
+import argparse
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import faiss
 
+from explainer.tfidf import build_tfidf_model, save_tfidf_model
+from retrieval.chunk_format import LEGACY_CHUNKS_SUFFIX, chunks_path, content_hash, iter_chunk_files
+from retrieval.chunk_store import CHUNK_STORE_FILE, ChunkStore, ChunkStoreWriter
+from retrieval.encoding import ENCODER_BACKENDS, backend_label, encode_texts
+from retrieval.index_factory import (DEFAULT_RERANK_FACTOR, INDEX_TYPES, METRICS, build_index, normalize,
+                                     set_search_params, supports_removal, write_rerank_vectors)
+from retrieval.manifest import DEFAULT_EMBEDDING_MODEL, build_hash, load_manifest, save_manifest
+from retrieval.onnx_encoder import ONNX_DIRECTORY
+from retrieval.sparse import SPARSE_INDEX_DIRECTORY, BM25Index
+
 def load_chunks(processed_directory):
-    """Load processed chunks with metadata."""
-    chunks = []
-    for filename in os.listdir(processed_directory):
-        if filename.endswith('_chunks.txt'):
-            source = filename.replace('_chunks.txt', '.txt')
+    """Yield processed chunk records from the JSON Lines chunk files.
+    
+    Chunk files written by older versions (_chunks.txt, separated by
+    "\n\n---\n\n") are still read when no .jsonl file exists for them.
+    """
+    yield from iter_chunk_files(processed_directory)
+    
+    for filename in sorted(os.listdir(processed_directory)):
+        if filename.endswith(LEGACY_CHUNKS_SUFFIX):
+            source = filename[:-len(LEGACY_CHUNKS_SUFFIX)] + '.txt'
+            if os.path.exists(chunks_path(processed_directory, source)):
+                continue
             with open(os.path.join(processed_directory, filename), 'r', encoding='utf-8') as f:
                 content = f.read()
                 # Split by the separator we used when saving
                 chunk_texts = content.split("\n\n---\n\n")
                 for chunk_text in chunk_texts:
                     if chunk_text.strip():  # Skip empty chunks
-                        chunks.append({"text": chunk_text.strip(), "source": source})
-    return chunks
+                        yield {"text": chunk_text.strip(), "source": source}
 
-def create_and_save_embeddings(chunks, model_name="all-MiniLM-L6-v2", output_directory="models"):
-    """Create embeddings for chunks and save them along with FAISS index."""
+EMBEDDING_MODEL = DEFAULT_EMBEDDING_MODEL
+CHUNK_IDS_FILE = "chunk_ids.json"
+
+def chunk_hash(chunk):
+    """Content hash identifying a chunk across rebuilds."""
+    return chunk.get("hash") or content_hash(chunk["source"], chunk["text"])
+
+def _save_index_and_metadata(index, staged_store_path, next_id, hash_to_id, manifest, output_directory):
+    """Write the FAISS index, chunk store, BM25 and TF-IDF models, ID mapping and manifest.
+    
+    Args:
+        staged_store_path: Chunk store written for this index, moved into place
+            once the index is saved
+    """
+    faiss.write_index(index, os.path.join(output_directory, "faiss_index.bin"))
+    
+    # Chunk texts and sources, looked up by index ID
+    store_path = os.path.join(output_directory, CHUNK_STORE_FILE)
+    os.replace(staged_store_path, store_path)
+    chunks = ChunkStore(store_path)
+    
+    # BM25 keyword index over the same IDs, cheap enough to rebuild every time
+    BM25Index.build(chunks).save(os.path.join(output_directory, SPARSE_INDEX_DIRECTORY))
+    
+    # Corpus-wide TF-IDF used by the retrieval explainer
+    save_tfidf_model(build_tfidf_model(chunks), output_directory)
+    
+    with open(os.path.join(output_directory, CHUNK_IDS_FILE), 'w', encoding='utf-8') as f:
+        json.dump({"next_id": next_id, "ids": hash_to_id}, f)
+    
+    # Written last, CampaignRetriever checks the other files against it
+    manifest["chunk_count"] = int(index.ntotal)
+    manifest["build_hash"] = build_hash(manifest["embedding_model"], hash_to_id)
+    save_manifest(output_directory, manifest)
+
+def create_and_save_embeddings(chunks, model_name=EMBEDDING_MODEL, output_directory="models",
+                               index_type="flat", nlist=None, hnsw_m=32, pq_m=None,
+                               nprobe=8, ef_search=64, metric="cosine",
+                               rerank_factor=DEFAULT_RERANK_FACTOR, encode_workers=None,
+                               encode_threads=2, batch_size=32, encoder_backend="torch"):
+    """Create embeddings for chunks and save them along with FAISS index.
+    
+    The chunks can be any iterable of dictionaries with text and source,
+    including the generator returned by process_data.iter_campaign_chunks.
+    They are streamed: each chunk goes to the chunk store on disk and its
+    text to the encoder as it is read, and only the content hashes seen so
+    far are kept to drop exact duplicates.
+    
+    Every chunk gets a stable ID in the index, keyed by its content hash, so
+    later runs of update_embeddings only encode what changed.
+    
+    Args:
+        chunks: Iterable of chunk dictionaries with text and source
+        model_name: Sentence-transformers model used for the embeddings
+        output_directory: Directory where the index and metadata are saved
+        index_type: One of retrieval.index_factory.INDEX_TYPES
+        nlist: Number of IVF lists (IVF types only, default derived from corpus size)
+        hnsw_m: Number of neighbours per HNSW node
+        pq_m: Number of PQ sub-quantizers (IVF-PQ only)
+        nprobe: IVF lists visited per query
+        ef_search: HNSW search depth per query
+        metric: "cosine" stores L2-normalized vectors in an inner-product
+            index, so scores are cosine similarities; "l2" stores raw vectors
+        rerank_factor: Candidates re-ranked per result (binary index only)
+        encode_workers: Embedding worker processes (default: cores / encode_threads)
+        encode_threads: Math library threads per embedding worker
+        batch_size: Chunks per embedding batch
+        encoder_backend: "torch", or "onnx" to encode with the model exported
+            to <output_directory>/onnx. The manifest records it with its
+            quantization ("onnx-int8" or "onnx-fp32")
+        
+    Returns:
+        Tuple of (embeddings, FAISS index)
+    """
     os.makedirs(output_directory, exist_ok=True)
+    onnx_directory = os.path.join(output_directory, ONNX_DIRECTORY)
+    encoder_label = backend_label(encoder_backend, onnx_directory)
     
-    if not chunks:
+    staged_path = os.path.join(output_directory, CHUNK_STORE_FILE + ".staged")
+    writer = ChunkStoreWriter(staged_path)
+    hash_to_id = {}
+    
+    def unique_texts():
+        for chunk in chunks:
+            h = chunk_hash(chunk)
+            if h in hash_to_id:
+                continue
+            hash_to_id[h] = len(hash_to_id)
+            writer.add(hash_to_id[h], chunk)
+            yield chunk["text"]
+    
+    # Generate embeddings, streamed to a temporary file as batches finish
+    print(f"Generating embeddings with {model_name}...")
+    embeddings = encode_texts(unique_texts(), model_name, workers=encode_workers,
+                              threads_per_worker=encode_threads, batch_size=batch_size,
+                              backend=encoder_backend, onnx_directory=onnx_directory)
+    num_chunks = len(hash_to_id)
+    if not num_chunks:
+        writer.abort()
         print("No chunks to process. Please run process_data.py first.")
         return None, None
+    writer.close()
+    print(f"Encoded {num_chunks} chunks")
     
-    # Load model
-    print(f"Loading embedding model: {model_name}")
-    model = SentenceTransformer("neuralmind/bert-base-portuguese-cased")
+    # Create FAISS index
+    print(f"Creating FAISS index ({index_type}, {metric})...")
+    index, built_type = build_index(embeddings, np.arange(num_chunks), index_type=index_type,
+                                    nlist=nlist, hnsw_m=hnsw_m, pq_m=pq_m, metric=metric)
+    set_search_params(index, nprobe=nprobe, ef_search=ef_search)
     
-    # Extract texts for embedding
-    texts = [chunk["text"] for chunk in chunks]
+    # The binary index only keeps sign bits, the shortlist is re-ranked from disk
+    if built_type == "binary":
+        vectors = normalize(embeddings) if metric == "cosine" else embeddings
+        write_rerank_vectors(output_directory, np.arange(num_chunks), vectors, num_chunks, replace=True)
     
-    # Generate embeddings
-    print(f"Generating embeddings for {len(texts)} chunks...")
-    embeddings = model.encode(texts, show_progress_bar=True)
+    manifest = {
+        "embedding_model": model_name,
+        "encoder_backend": encoder_label,
+        "dimension": int(embeddings.shape[1]),
+        "normalized": metric == "cosine",
+        "metric": metric,
+        "index_type": built_type,
+        "requested_index_type": index_type,
+        "nprobe": nprobe,
+        "ef_search": ef_search,
+        "rerank_factor": rerank_factor
+    }
+    _save_index_and_metadata(index, staged_path, num_chunks, hash_to_id, manifest, output_directory)
     
-    # Save embeddings and chunks
-    with open(os.path.join(output_directory, "chunks.pkl"), 'wb') as f:
-        pickle.dump(chunks, f)
+    print(f"Saved {num_chunks} chunks and {built_type} FAISS index to {output_directory}")
     
-    # Create FAISS index
-    print("Creating FAISS index...")
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(np.array(embeddings).astype('float32'))
+    return embeddings, index
+
+def update_embeddings(chunks, model_name=EMBEDDING_MODEL, output_directory="models",
+                      index_type="flat", metric="cosine", encode_workers=None, encode_threads=2,
+                      batch_size=32, encoder_backend="torch", **index_params):
+    """Update an existing index so it matches the given chunks.
     
-    # Save FAISS index
-    faiss.write_index(index, os.path.join(output_directory, "faiss_index.bin"))
+    Only chunks whose content hash is new are encoded; vectors of chunks that
+    no longer exist are removed. Falls back to a full rebuild when there is no
+    incremental state from a previous run, when the model, encoder backend,
+    index type or metric changes or when the index cannot remove vectors (HNSW).
+    
+    The chunks are streamed into a new chunk store first, so the new ones
+    are encoded from disk and the corpus never has to fit in memory.
+    
+    Returns:
+        Tuple of (embeddings of the newly encoded chunks, FAISS index)
+    """
+    faiss_path = os.path.join(output_directory, "faiss_index.bin")
+    ids_path = os.path.join(output_directory, CHUNK_IDS_FILE)
+    store_path = os.path.join(output_directory, CHUNK_STORE_FILE)
+    onnx_directory = os.path.join(output_directory, ONNX_DIRECTORY)
+    manifest = load_manifest(output_directory)
+    
+    def rebuild(reason, source=chunks):
+        print(f"{reason}, building the index from scratch.")
+        return create_and_save_embeddings(source, model_name, output_directory,
+                                          index_type=index_type, metric=metric,
+                                          encode_workers=encode_workers, encode_threads=encode_threads,
+                                          batch_size=batch_size, encoder_backend=encoder_backend,
+                                          **index_params)
+    
+    if manifest is None or not all(os.path.exists(p) for p in (faiss_path, ids_path, store_path)):
+        return rebuild("No incremental state found")
+    if manifest.get("embedding_model", DEFAULT_EMBEDDING_MODEL) != model_name:
+        return rebuild(f"Embedding model changed from {manifest.get('embedding_model')} to {model_name}")
+    # Vectors from different backends (or ONNX quantizations) must not be mixed
+    encoder_label = backend_label(encoder_backend, onnx_directory)
+    index_backend = manifest.get("encoder_backend", "torch")
+    if index_backend != encoder_label:
+        return rebuild(f"Encoder backend changed from {index_backend} to {encoder_label}")
+    if manifest.get("requested_index_type") != index_type:
+        return rebuild(f"Index type changed from {manifest.get('requested_index_type')} to {index_type}")
+    # Indexes built before metrics were selectable hold raw L2 vectors
+    if manifest.get("metric", "l2") != metric:
+        return rebuild(f"Metric changed from {manifest.get('metric', 'l2')} to {metric}")
+    
+    index = faiss.read_index(faiss_path)
+    
+    # Query-time parameters can change without a rebuild
+    for key in ("nprobe", "ef_search", "rerank_factor"):
+        if index_params.get(key) is not None:
+            manifest[key] = index_params[key]
+    set_search_params(index, nprobe=manifest.get("nprobe"), ef_search=manifest.get("ef_search"))
+    
+    with open(ids_path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    old_ids = state["ids"]
+    next_id = state["next_id"]
+    
+    # Known chunks keep their IDs, new ones get fresh IDs; exact duplicates are dropped
+    # Not the ".staged" file of create_and_save_embeddings, a rebuild reads from this one
+    staged_path = store_path + ".update"
+    writer = ChunkStoreWriter(staged_path)
+    hash_to_id = {}
+    added = []
+    for chunk in chunks:
+        h = chunk_hash(chunk)
+        if h in hash_to_id:
+            continue
+        if h in old_ids:
+            hash_to_id[h] = old_ids[h]
+        else:
+            hash_to_id[h] = next_id
+            added.append(next_id)
+            next_id += 1
+        writer.add(hash_to_id[h], chunk)
     
-    print(f"Saved {len(chunks)} chunks and FAISS index to {output_directory}")
+    if not hash_to_id:
+        writer.abort()
+        print("No chunks to process. Please run process_data.py first.")
+        return None, None
+    writer.close()
+    staged = ChunkStore(staged_path)
+    
+    removed = [old_ids[h] for h in old_ids if h not in hash_to_id]
+    
+    if not removed and not added:
+        os.remove(staged_path)
+        print("Index is up to date, nothing to re-encode.")
+        manifest.setdefault("embedding_model", model_name)
+        manifest["chunk_count"] = int(index.ntotal)
+        manifest["build_hash"] = build_hash(model_name, old_ids)
+        save_manifest(output_directory, manifest)
+        return np.empty((0, index.d), dtype='float32'), index
+    
+    if removed and not supports_removal(manifest["index_type"]):
+        # Nothing was encoded yet, the staged store already holds every chunk
+        staged_chunks = (chunk for _, chunk in staged.items())
+        result = rebuild(f"{manifest['index_type']} index cannot remove vectors", staged_chunks)
+        os.remove(staged_path)
+        return result
     
-    # Save mapping from index to chunk metadata
-    index_to_chunk = {i: {"text": chunks[i]["text"], "source": chunks[i]["source"]} 
-                      for i in range(len(chunks))}
+    print(f"Updating index: {len(added)} new/changed chunks, {len(removed)} removed")
     
-    with open(os.path.join(output_directory, "index_to_chunk.json"), 'w', encoding='utf-8') as f:
-        json.dump(index_to_chunk, f, ensure_ascii=False, indent=2)
+    if removed:
+        index.remove_ids(np.array(removed, dtype='int64'))
+    
+    embeddings = np.empty((0, index.d), dtype='float32')
+    if added:
+        new_ids = np.array(added, dtype='int64')
+        embeddings = encode_texts((staged.get(chunk_id)["text"] for chunk_id in added), model_name,
+                                  workers=encode_workers, threads_per_worker=encode_threads,
+                                  batch_size=batch_size, backend=encoder_backend,
+                                  onnx_directory=onnx_directory, dimension=index.d)
+        vectors = normalize(embeddings) if metric == "cosine" else np.array(embeddings).astype('float32')
+        index.add_with_ids(vectors, new_ids)
+        if manifest["index_type"] == "binary":
+            write_rerank_vectors(output_directory, new_ids, vectors, next_id)
+    
+    _save_index_and_metadata(index, staged_path, next_id, hash_to_id, manifest, output_directory)
+    
+    print(f"Saved {len(hash_to_id)} chunks and FAISS index to {output_directory}")
     
     return embeddings, index
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create embeddings and the FAISS index.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat",
+                        help="FAISS index type (default: flat)")
+    parser.add_argument("--metric", choices=METRICS, default="cosine",
+                        help="Similarity: cosine of normalized vectors or raw L2 distance (default: cosine)")
+    parser.add_argument("--nlist", type=int, default=None, help="Number of IVF lists")
+    parser.add_argument("--nprobe", type=int, default=8, help="IVF lists visited per query")
+    parser.add_argument("--ef-search", type=int, default=64, help="HNSW search depth per query")
+    parser.add_argument("--rerank-factor", type=int, default=DEFAULT_RERANK_FACTOR,
+                        help="Candidates re-ranked with float vectors per result (binary index)")
+    parser.add_argument("--encode-workers", type=int, default=None,
+                        help="Embedding worker processes (default: cores / --encode-threads)")
+    parser.add_argument("--encode-threads", type=int, default=2,
+                        help="Math library threads per embedding worker")
+    parser.add_argument("--batch-size", type=int, default=32, help="Chunks per embedding batch")
+    parser.add_argument("--encoder-backend", choices=ENCODER_BACKENDS, default="torch",
+                        help="Encode with sentence-transformers or the ONNX export in models/onnx")
+    parser.add_argument("--full", action="store_true", help="Rebuild the index from scratch")
+    parser.add_argument("--raw-directory", default=None,
+                        help="Ingest .txt files from this directory directly, in parallel, "
+                             "instead of reading the chunk files in data/processed")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for --raw-directory (default: all cores)")
+    args = parser.parse_args()
+    
     processed_directory = "data/processed"
     output_directory = "models"
     
-    chunks = load_chunks(processed_directory)
-    print(f"Loaded {len(chunks)} chunks")
+    # Chunks are streamed into the embedding stage as they are read
+    if args.raw_directory:
+        from process_data import iter_campaign_chunks
+        chunks = iter_campaign_chunks(args.raw_directory, workers=args.workers)
+    else:
+        chunks = load_chunks(processed_directory)
     
-    if chunks:
-        embeddings, index = create_and_save_embeddings(chunks, output_directory=output_directory)
+    build = create_and_save_embeddings if args.full else update_embeddings
+    embeddings, index = build(chunks, output_directory=output_directory,
+                              index_type=args.index_type, metric=args.metric, nlist=args.nlist,
+                              nprobe=args.nprobe, ef_search=args.ef_search,
+                              rerank_factor=args.rerank_factor, encode_workers=args.encode_workers,
+                              encode_threads=args.encode_threads, batch_size=args.batch_size,
+                              encoder_backend=args.encoder_backend)
+    if index is not None:
         print("Embeddings and FAISS index created successfully!")
     else:
-        print("No chunks found. Please run process_data.py first to generate chunks.")
\ No newline at end of file
+        print("No chunks found. Please run process_data.py first to generate chunks.")
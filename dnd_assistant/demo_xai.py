@@ -46,7 +46,7 @@ def run_demo_query(assistant, retriever, query):
     # Step 2: Generate answer
     print("\n2. GERANDO RESPOSTA...")
     start_time = time.time()
-    response = assistant.answer_query(query, include_context=True, include_sources=True)
+    response = assistant.answer_from_chunks(query, chunks, include_context=True, include_sources=True)
     generation_time = time.time() - start_time
     
     print(f"✓ Resposta gerada em {generation_time:.2f}s")
@@ -54,7 +54,9 @@ def run_demo_query(assistant, retriever, query):
     # Step 3: Generate explanations
     print("\n3. GERANDO EXPLICAÇÕES XAI...")
     start_time = time.time()
-    explanation = create_simple_explanation(query, chunks, response["answer"])
+    explanation = create_simple_explanation(query, chunks, response["answer"],
+                                            models_directory=retriever.models_directory,
+                                            charts="sync")
     explanation_time = time.time() - start_time
     
     print(f"✓ Explicações geradas em {explanation_time:.2f}s")
@@ -143,6 +145,7 @@ def main():
         print("\nInicializando componentes...")
         retriever = CampaignRetriever()
         assistant = CampaignAssistant(retriever=retriever)
+        assistant.warm_up(background=True)
         print("Componentes inicializados com sucesso!")
     except Exception as e:
         print(f"Erro ao inicializar: {str(e)}")
@@ -0,0 +1,146 @@
+"""
+Answer-to-context attribution for the generation explainer.
+The context chunks are indexed once per query by their word n-grams
+(shingles); every answer n-gram is then a single dictionary lookup, and
+matches are extended word by word up to the end of their sentence, so
+attributing an answer takes time linear in the answer and context lengths.
+"""
+
+from bisect import bisect_right
+
+from retrieval.context import SENTENCE_END
+from retrieval.text import WORD, fold_accents
+
+def _words(text):
+    """Accent-folded words of a text with their character offsets."""
+    return [(fold_accents(match.group()), match.start(), match.end()) for match in WORD.finditer(text)]
+
+def _sentence_spans(text):
+    """Character (start, end) of every sentence, split like the context packer."""
+    spans = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        spans.append((start, match.start()))
+        start = match.end()
+    spans.append((start, len(text)))
+    return spans
+
+def _sentence_of_words(words, sentence_spans):
+    """Index of the sentence containing each word."""
+    starts = [start for start, _ in sentence_spans]
+    return [bisect_right(starts, word_start) - 1 for _, word_start, _ in words]
+
+class AttributionIndex:
+    """Shingle index over the context chunks of one query."""
+
+    def __init__(self, context_chunks, ngram_size=3):
+        """Index the context chunks.
+
+        Args:
+            context_chunks: Retrieved chunks (dictionaries with text and source)
+            ngram_size: Number of consecutive words that must match
+        """
+        self.chunks = context_chunks
+        self.ngram_size = ngram_size
+        self.words = []
+        self.sentences = []
+        self.sentence_of_word = []
+        # Shingle -> list of (chunk index, word position)
+        self.shingles = {}
+
+        for chunk_index, chunk in enumerate(context_chunks):
+            words = _words(chunk["text"])
+            sentences = _sentence_spans(chunk["text"])
+            self.words.append(words)
+            self.sentences.append(sentences)
+            self.sentence_of_word.append(_sentence_of_words(words, sentences))
+
+            terms = [word for word, _, _ in words]
+            for position in range(len(terms) - ngram_size + 1):
+                shingle = tuple(terms[position:position + ngram_size])
+                self.shingles.setdefault(shingle, []).append((chunk_index, position))
+
+    def _extend(self, answer_terms, answer_sentence_of_word, answer_position, chunk_index, context_position):
+        """Number of words matching from the given answer and context positions.
+
+        A span never crosses a sentence boundary, in the answer or the context.
+        """
+        context_words = self.words[chunk_index]
+        context_sentence_of_word = self.sentence_of_word[chunk_index]
+        answer_sentence = answer_sentence_of_word[answer_position]
+        context_sentence = context_sentence_of_word[context_position]
+        length = 1
+        while (answer_position + length < len(answer_terms)
+               and context_position + length < len(context_words)
+               and answer_sentence_of_word[answer_position + length] == answer_sentence
+               and context_sentence_of_word[context_position + length] == context_sentence
+               and answer_terms[answer_position + length] == context_words[context_position + length][0]):
+            length += 1
+        return length
+
+    def attribute(self, answer):
+        """Map answer spans to the context they were copied from.
+
+        Each answer position is looked up once; the longest match found is
+        reported as one span and the scan resumes after it.
+
+        Args:
+            answer: Generated answer
+
+        Returns:
+            List of span dictionaries in answer order, with the answer and
+            context character offsets, the matched chunk and sentence
+        """
+        answer_words = _words(answer)
+        answer_terms = [word for word, _, _ in answer_words]
+        answer_sentences = _sentence_spans(answer)
+        answer_sentence_of_word = _sentence_of_words(answer_words, answer_sentences)
+
+        spans = []
+        position = 0
+        while position <= len(answer_terms) - self.ngram_size:
+            shingle = tuple(answer_terms[position:position + self.ngram_size])
+            occurrences = self.shingles.get(shingle)
+            if not occurrences:
+                position += 1
+                continue
+
+            # Longest continuation, the first (best ranked) chunk on ties
+            length, chunk_index, context_position = max(
+                (self._extend(answer_terms, answer_sentence_of_word, position, chunk_index, context_position),
+                 -chunk_index, -context_position)
+                for chunk_index, context_position in occurrences
+            )
+            chunk_index, context_position = -chunk_index, -context_position
+            if length < self.ngram_size:
+                # The shingle itself spans a sentence boundary
+                position += 1
+                continue
+            chunk = self.chunks[chunk_index]
+            context_words = self.words[chunk_index]
+            last = position + length - 1
+            context_last = context_position + length - 1
+
+            answer_start, answer_end = answer_words[position][1], answer_words[last][2]
+            context_start, context_end = context_words[context_position][1], context_words[context_last][2]
+            sentence_index = self.sentence_of_word[chunk_index][context_position]
+            sentence_start, sentence_end = self.sentences[chunk_index][sentence_index]
+            answer_sentence_start, answer_sentence_end = answer_sentences[answer_sentence_of_word[position]]
+
+            spans.append({
+                "answer_start": answer_start,
+                "answer_end": answer_end,
+                "answer_text": answer[answer_start:answer_end],
+                "answer_sentence": answer[answer_sentence_start:answer_sentence_end].strip(),
+                "chunk_index": chunk_index,
+                "chunk_id": chunk.get("id"),
+                "source": chunk["source"],
+                "sentence_index": sentence_index,
+                "context_sentence": chunk["text"][sentence_start:sentence_end].strip(),
+                "context_start": context_start,
+                "context_end": context_end,
+                "words": length
+            })
+            position += length
+
+        return spans
@@ -0,0 +1,90 @@
+"""
+Query term highlighting for retrieved chunks.
+The pattern is compiled once per query and reused for every chunk. Query
+words are escaped and every letter matches its accented forms, so "valoria"
+highlights "Valória" and the offsets refer to the original text. Singular
+and plural forms that the BM25 index treats as one term ("região" and
+"regiões") highlight each other.
+"""
+
+import re
+import unicodedata
+
+from retrieval.text import STOPWORDS, WORD, fold_accents, stem
+
+def _accent_variants():
+    """Map each base letter to itself and its accented Latin forms."""
+    variants = {}
+    # Latin-1 Supplement and Latin Extended-A hold the accented letters
+    for code in range(0xC0, 0x180):
+        char = chr(code)
+        base = fold_accents(char)
+        if len(base) == 1 and base.isalpha() and base != char.lower() and unicodedata.category(char).startswith("L"):
+            variants.setdefault(base, set()).add(char.lower())
+    return {base: base + "".join(sorted(forms)) for base, forms in variants.items()}
+
+ACCENT_VARIANTS = _accent_variants()
+
+def _term_pattern(term):
+    """Regex source matching a folded term with or without its accents."""
+    parts = []
+    for char in term:
+        forms = ACCENT_VARIANTS.get(char)
+        parts.append(f"[{re.escape(forms)}]" if forms else re.escape(char))
+    return "".join(parts)
+
+def _surface_forms(term):
+    """Folded words that stem to the same term as a folded query word."""
+    base = stem(term)
+    forms = {term, base, base + "s"}
+    for suffix, replacement in (("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ns", "m")):
+        if base.endswith(replacement):
+            forms.add(base[:-len(replacement)] + suffix)
+    return {form for form in forms if stem(form) == base}
+
+class QueryHighlighter:
+    """Marks the words of a query in chunk texts."""
+
+    def __init__(self, query):
+        """Compile the pattern for a query.
+
+        Args:
+            query: User query
+        """
+        self.terms = sorted({word for word in WORD.findall(fold_accents(query)) if word not in STOPWORDS})
+        # Longest forms first, so a form is not cut short by one of its prefixes
+        forms = sorted({form for term in self.terms for form in _surface_forms(term)},
+                       key=lambda form: (-len(form), form))
+        self.pattern = None
+        if forms:
+            alternatives = "|".join(_term_pattern(form) for form in forms)
+            self.pattern = re.compile(rf"\b(?:{alternatives})\b", re.IGNORECASE)
+
+    def find(self, text):
+        """Offsets of the query words in a text.
+
+        Returns:
+            List of dictionaries with the start and end character offsets
+            and the matched (folded) term
+        """
+        if self.pattern is None:
+            return []
+        return [{"start": match.start(), "end": match.end(), "term": fold_accents(match.group())}
+                for match in self.pattern.finditer(text)]
+
+    def highlight(self, text):
+        """Highlight the query words in a text.
+
+        Returns:
+            Dictionary with the text, query words wrapped in asterisks for
+            the CLI, and the match offsets in the original text
+        """
+        matches = self.find(text)
+        parts = []
+        position = 0
+        for match in matches:
+            parts.append(text[position:match["start"]])
+            parts.append(f"**{text[match['start']:match['end']]}**")
+            position = match["end"]
+        parts.append(text[position:])
+        return {"text": "".join(parts), "matches": matches}
@@ -0,0 +1,82 @@
+"""
+Corpus-wide TF-IDF model for the retrieval explainer.
+Fitted once by create_embeddings.py over every chunk, so the IDF weights
+reflect the whole campaign and explaining a query only needs a transform.
+"""
+
+import os
+import pickle
+
+import numpy as np
+
+from retrieval.text import tokenize
+
+TFIDF_FILE = "tfidf.pkl"
+
+# Loaded models, keyed by path and modification time
+_loaded = {}
+
+def build_tfidf_model(chunks_by_id):
+    """Fit a TF-IDF vectorizer over all chunks.
+
+    Args:
+        chunks_by_id: Dictionary or ChunkStore mapping index ID to chunk;
+            the texts are streamed into the vectorizer
+
+    Returns:
+        Dictionary with the vectorizer, its feature names, the L2-normalized
+        chunk matrix and the matrix row of every chunk ID (-1 if none)
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    ids = []
+
+    def texts():
+        for chunk_id, chunk in chunks_by_id.items():
+            ids.append(chunk_id)
+            yield chunk["text"]
+
+    # Same Portuguese-aware terms as the BM25 index
+    vectorizer = TfidfVectorizer(analyzer=tokenize)
+    matrix = vectorizer.fit_transform(texts())
+
+    row_of_id = np.full(max(ids) + 1 if ids else 0, -1, dtype='int64')
+    row_of_id[ids] = np.arange(len(ids))
+
+    return {
+        "vectorizer": vectorizer,
+        "feature_names": vectorizer.get_feature_names_out(),
+        "matrix": matrix.tocsr(),
+        "row_of_id": row_of_id
+    }
+
+def save_tfidf_model(model, models_directory):
+    """Write a model built by build_tfidf_model."""
+    path = os.path.join(models_directory, TFIDF_FILE)
+    with open(path + ".tmp", 'wb') as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+def load_tfidf_model(models_directory="models"):
+    """Load the TF-IDF model, or None if it was not built.
+
+    The model is kept in memory and only reloaded when the file changes.
+    """
+    path = os.path.join(models_directory, TFIDF_FILE)
+    if not os.path.exists(path):
+        return None
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    if key not in _loaded:
+        _loaded.clear()
+        with open(path, 'rb') as f:
+            _loaded[key] = pickle.load(f)
+    return _loaded[key]
+
+def chunk_rows(model, retrieved_chunks):
+    """TF-IDF rows for retrieved chunks, precomputed ones when available."""
+    row_of_id = model["row_of_id"]
+    rows = [row_of_id[chunk["id"]] if 0 <= chunk.get("id", -1) < len(row_of_id) else -1
+            for chunk in retrieved_chunks]
+    if all(row >= 0 for row in rows):
+        return model["matrix"][rows]
+    return model["vectorizer"].transform([chunk["text"] for chunk in retrieved_chunks])
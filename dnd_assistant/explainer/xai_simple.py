@@ -3,22 +3,212 @@ Simplified XAI module for the D&D Campaign Assistant.
 This provides basic explanations for retrievals and answers.
 """
 
-import re
 import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.feature_extraction.text import TfidfVectorizer
 import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from explainer.attribution import AttributionIndex
+from explainer.highlight import QueryHighlighter
+from explainer.tfidf import chunk_rows, load_tfidf_model
+from retrieval.text import WORD, tokenize
+
+# matplotlib and scikit-learn are imported where they are used, they take
+# longer to import than the rest of the app takes to start
+
+CHART_MODES = ("background", "sync", "none")
+
+# Charts kept in the output directory; the least recently written are deleted
+# beyond this, since every distinct question writes new files
+MAX_CHARTS = 200
+CHART_PREFIXES = ("chunk_similarities_", "term_importance_")
+
+# Single worker thread rendering charts off the request path, created on first use
+_chart_executor = None
+_chart_executor_lock = threading.Lock()
+
+# Outcome of the finished background renders ("ready", "skipped" or
+# "failed: <error>"), by chart_key
+_chart_outcomes = {}
+_chart_outcomes_lock = threading.Lock()
+
+def _new_figure():
+    """Create a figure on the non-interactive Agg canvas.
+
+    pyplot is not used: its global figure state is not thread-safe and it
+    would pick an interactive backend when a display is available.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    
+    figure = Figure(figsize=(10, 6))
+    FigureCanvasAgg(figure)
+    return figure, figure.add_subplot()
+
+def _save_figure(figure, output_path):
+    """Save a figure as PNG, or discard it when there is no output path."""
+    if not output_path:
+        return None
+    figure.tight_layout()
+    # Write to a temporary file so a reader never sees a half-written chart
+    temp_path = output_path + ".tmp"
+    figure.savefig(temp_path, format="png")
+    os.replace(temp_path, output_path)
+    return output_path
+
+def chart_paths(query, retrieved_chunks, output_dir="output"):
+    """Chart file paths for a query and its retrieved chunks.
+    
+    The names are derived from the query and the chunks, so sessions asking
+    different questions never write to the same files.
+    
+    Returns:
+        Dictionary mapping chart name to file path
+    """
+    content = query + "\0" + "\0".join(
+        f"{chunk.get('id', '')}:{chunk['source']}" for chunk in retrieved_chunks
+    )
+    key = hashlib.sha1(content.encode('utf-8')).hexdigest()[:12]
+    return {
+        "similarity": os.path.join(output_dir, f"chunk_similarities_{key}.png"),
+        "term_importance": os.path.join(output_dir, f"term_importance_{key}.png")
+    }
+
+def drawable_charts(retrieval_explanation, paths):
+    """The chart paths the explanation has data for; the others become None.
+    
+    A failed retrieval explanation has no similarities and no term weights,
+    so nothing would be drawn at those paths.
+    """
+    data = {"similarity": "chunk_similarities", "term_importance": "term_weights"}
+    return {name: path if retrieval_explanation.get(data[name]) else None for name, path in paths.items()}
+
+def chart_key(paths):
+    """Key of a set of chart paths in the render outcomes, or None if it has none."""
+    drawn = sorted(path for path in paths.values() if path)
+    return "\0".join(drawn) or None
+
+def prune_charts(output_dir, max_charts=MAX_CHARTS):
+    """Delete the oldest chart files beyond max_charts.
+    
+    Returns:
+        Number of files deleted
+    """
+    charts = []
+    for name in os.listdir(output_dir):
+        if name.startswith(CHART_PREFIXES) and name.endswith(".png"):
+            path = os.path.join(output_dir, name)
+            try:
+                charts.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                continue
+    charts.sort()
+    deleted = 0
+    for _, path in charts[:max(len(charts) - max_charts, 0)]:
+        try:
+            os.remove(path)
+            deleted += 1
+        except FileNotFoundError:
+            pass
+    return deleted
+
+def render_charts(retrieval_explanation, paths, max_charts=MAX_CHARTS):
+    """Render the retrieval charts of an explanation.
+    
+    Args:
+        retrieval_explanation: Output from SimpleRetrieverExplainer.explain_retrieval
+        paths: Output from chart_paths; charts whose path is None are not drawn
+        max_charts: Chart files kept in the output directory (see prune_charts)
+        
+    Returns:
+        Dictionary mapping chart name to the saved file path (None if not drawn)
+    """
+    saved = {name: None for name in paths}
+    drawn = [path for path in paths.values() if path]
+    if not drawn:
+        return saved
+    output_dir = os.path.dirname(drawn[0]) or "."
+    os.makedirs(output_dir, exist_ok=True)
+    explainer = SimpleRetrieverExplainer()
+    if paths.get("similarity"):
+        saved["similarity"] = explainer.visualize_similarities(retrieval_explanation, paths["similarity"])
+    if paths.get("term_importance"):
+        saved["term_importance"] = explainer.visualize_term_importance(retrieval_explanation,
+                                                                       paths["term_importance"])
+    prune_charts(output_dir, max_charts)
+    return saved
+
+def _record_chart_outcome(paths, future):
+    """Done callback of a background render: record its outcome, print errors."""
+    error = future.exception()
+    if error is not None:
+        print(f"Error rendering charts {chart_key(paths)}: {error}")
+        outcome = f"failed: {error}"
+    elif any(future.result().values()):
+        outcome = "ready"
+    else:
+        outcome = "skipped"
+    with _chart_outcomes_lock:
+        _chart_outcomes[chart_key(paths)] = outcome
+        # Only recent renders matter to chart_status
+        while len(_chart_outcomes) > MAX_CHARTS:
+            del _chart_outcomes[next(iter(_chart_outcomes))]
+
+def render_charts_in_background(retrieval_explanation, paths):
+    """Queue render_charts on the background worker.
+    
+    The outcome is reported by chart_status; a failed render is printed too.
+    
+    Returns:
+        Future resolving to the render_charts result
+    """
+    global _chart_executor
+    with _chart_executor_lock:
+        if _chart_executor is None:
+            _chart_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="charts")
+    with _chart_outcomes_lock:
+        _chart_outcomes.pop(chart_key(paths), None)
+    future = _chart_executor.submit(render_charts, retrieval_explanation, paths)
+    future.add_done_callback(lambda done: _record_chart_outcome(paths, done))
+    return future
+
+def chart_status(paths):
+    """State of the charts at the given paths (None paths are not drawn).
+    
+    Returns:
+        "ready" when the files exist, "failed: <error>" when the background
+        render failed, "skipped" when there was nothing to draw, otherwise
+        "pending"
+    """
+    key = chart_key(paths)
+    if key is None:
+        return "skipped"
+    with _chart_outcomes_lock:
+        outcome = _chart_outcomes.get(key)
+    if outcome is not None and outcome != "ready":
+        return outcome
+    if all(os.path.exists(path) for path in paths.values() if path):
+        return "ready"
+    return "pending"
 
 class SimpleRetrieverExplainer:
     """Explains why certain chunks were retrieved for a query."""
     
-    def __init__(self):
-        """Initialize the retrieval explainer."""
-        self.vectorizer = TfidfVectorizer(stop_words='english')
+    def __init__(self, models_directory="models"):
+        """Initialize the retrieval explainer.
+        
+        Args:
+            models_directory: Directory with the TF-IDF model built by create_embeddings.py
+        """
+        self.models_directory = models_directory
     
     def explain_retrieval(self, query, retrieved_chunks):
         """Explain why chunks were retrieved for a query.
         
+        Uses the corpus-wide TF-IDF model when it exists (only a transform per
+        query), otherwise fits one on the query and retrieved chunks.
+        
         Args:
             query: The user query
             retrieved_chunks: List of retrieved text chunks
@@ -29,41 +219,38 @@ class SimpleRetrieverExplainer:
         if not retrieved_chunks:
             return {"explanation": "No chunks were retrieved."}
         
-        # Combine query and chunks for vectorization
-        all_texts = [query] + [chunk["text"] for chunk in retrieved_chunks]
+        model = load_tfidf_model(self.models_directory)
         
-        # Vectorize using TF-IDF
         try:
-            tfidf_matrix = self.vectorizer.fit_transform(all_texts)
+            if model is not None:
+                query_vector = model["vectorizer"].transform([query])
+                chunk_matrix = chunk_rows(model, retrieved_chunks)
+                feature_names = model["feature_names"]
+            else:
+                # Fallback if create_embeddings.py has not built the model yet
+                from sklearn.feature_extraction.text import TfidfVectorizer
+                vectorizer = TfidfVectorizer(analyzer=tokenize)
+                tfidf_matrix = vectorizer.fit_transform([query] + [chunk["text"] for chunk in retrieved_chunks])
+                query_vector = tfidf_matrix[0]
+                chunk_matrix = tfidf_matrix[1:]
+                feature_names = vectorizer.get_feature_names_out()
         except ValueError:
             # Fallback if vectorization fails
             return {"explanation": "Could not generate explanation due to text processing error."}
         
-        # Get feature names
-        feature_names = self.vectorizer.get_feature_names_out()
-        
-        # Extract important terms from query and chunks
-        query_vector = tfidf_matrix[0].toarray()[0]
-        important_terms = []
+        # Extract important terms from the query (non-zero entries of its sparse row)
+        query_vector = query_vector.tocsr()
+        order = np.argsort(-query_vector.data)[:5]  # Get top 5 terms
+        top_terms = [(str(feature_names[query_vector.indices[i]]), float(query_vector.data[i]))
+                     for i in order]
         
-        for i, value in enumerate(query_vector):
-            if value > 0:
-                important_terms.append((feature_names[i], value))
-        
-        # Sort by importance
-        important_terms.sort(key=lambda x: x[1], reverse=True)
-        top_terms = important_terms[:5]  # Get top 5 terms
-        
-        # Get most similar chunks
-        chunk_similarities = []
-        for i in range(1, len(all_texts)):
-            chunk_vector = tfidf_matrix[i].toarray()[0]
-            similarity = np.dot(query_vector, chunk_vector) / (np.linalg.norm(query_vector) * np.linalg.norm(chunk_vector) + 1e-8)
-            chunk_similarities.append({
-                "index": i-1,
-                "source": retrieved_chunks[i-1]["source"],
-                "similarity": float(similarity)
-            })
+        # Rows are L2-normalized, so the dot product is the cosine similarity
+        similarities = (chunk_matrix @ query_vector.T).toarray().ravel()
+        chunk_similarities = [{
+            "index": i,
+            "source": chunk["source"],
+            "similarity": float(similarity)
+        } for i, (chunk, similarity) in enumerate(zip(retrieved_chunks, similarities))]
         
         # Sort by similarity
         chunk_similarities.sort(key=lambda x: x["similarity"], reverse=True)
@@ -85,34 +272,8 @@ class SimpleRetrieverExplainer:
         Returns:
             Text with highlighted terms
         """
-        # Lowercase query and split into words
-        query_words = set(re.findall(r'\b\w+\b', query.lower()))
-        
-        # Remove common words (simple stopwords)
-        stopwords = {'o', 'a', 'os', 'as', 'um', 'uma', 'uns', 'umas', 'de', 'do', 'da', 'dos', 'das', 
-                    'em', 'no', 'na', 'nos', 'nas', 'por', 'para', 'com', 'e', 'ou', 'que', 'quem', 
-                    'quando', 'como', 'onde', 'qual', 'quais', 'the', 'a', 'an', 'and', 'or', 'but', 
-                    'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 
-                    'does', 'did', 'to', 'at', 'in', 'on', 'by', 'with', 'about', 'for'}
-        
-        query_words = query_words - stopwords
-        
-        # If no meaningful words left, return original text
-        if not query_words:
-            return chunk_text
-        
-        # Create a pattern to match any of the query words
-        pattern = r'\b(' + '|'.join(query_words) + r')\b'
-        
-        # Replace occurrences with highlighted version (using asterisks for CLI)
-        highlighted_text = re.sub(
-            pattern, 
-            r'**\1**', 
-            chunk_text, 
-            flags=re.IGNORECASE
-        )
-        
-        return highlighted_text
+        # Build a QueryHighlighter once per query when highlighting several chunks
+        return QueryHighlighter(query).highlight(chunk_text)["text"]
     
     def visualize_similarities(self, explanation, output_path=None):
         """Create a bar chart of chunk similarities.
@@ -127,25 +288,18 @@ class SimpleRetrieverExplainer:
         if "chunk_similarities" not in explanation or not explanation["chunk_similarities"]:
             return None
         
-        plt.figure(figsize=(10, 6))
-        
         sources = [item["source"] for item in explanation["chunk_similarities"]]
         similarities = [item["similarity"] for item in explanation["chunk_similarities"]]
         
-        plt.bar(range(len(sources)), similarities, color='skyblue')
-        plt.xticks(range(len(sources)), sources, rotation=45, ha='right')
-        plt.xlabel("Source")
-        plt.ylabel("Similarity Score")
-        plt.title("Relevance of Retrieved Chunks")
-        plt.tight_layout()
+        figure, ax = _new_figure()
+        ax.bar(range(len(sources)), similarities, color='skyblue')
+        ax.set_xticks(range(len(sources)))
+        ax.set_xticklabels(sources, rotation=45, ha='right')
+        ax.set_xlabel("Source")
+        ax.set_ylabel("Similarity Score")
+        ax.set_title("Relevance of Retrieved Chunks")
         
-        if output_path:
-            plt.savefig(output_path)
-            plt.close()
-            return output_path
-        else:
-            plt.close()
-            return None
+        return _save_figure(figure, output_path)
     
     def visualize_term_importance(self, explanation, output_path=None):
         """Create a horizontal bar chart of term importance.
@@ -160,25 +314,18 @@ class SimpleRetrieverExplainer:
         if "term_weights" not in explanation or not explanation["term_weights"]:
             return None
         
-        plt.figure(figsize=(10, 6))
-        
         terms = [item[0] for item in explanation["term_weights"]]
         weights = [item[1] for item in explanation["term_weights"]]
         
+        figure, ax = _new_figure()
         y_pos = range(len(terms))
-        plt.barh(y_pos, weights, color='lightgreen')
-        plt.yticks(y_pos, terms)
-        plt.xlabel("Term Weight")
-        plt.title("Important Terms in Your Query")
-        plt.tight_layout()
+        ax.barh(y_pos, weights, color='lightgreen')
+        ax.set_yticks(y_pos)
+        ax.set_yticklabels(terms)
+        ax.set_xlabel("Term Weight")
+        ax.set_title("Important Terms in Your Query")
         
-        if output_path:
-            plt.savefig(output_path)
-            plt.close()
-            return output_path
-        else:
-            plt.close()
-            return None
+        return _save_figure(figure, output_path)
 
 
 class SimpleGenerationExplainer:
@@ -197,47 +344,29 @@ class SimpleGenerationExplainer:
             answer: Generated answer
             
         Returns:
-            Dictionary with explanation
+            Dictionary with explanation, the first connection of each answer
+            sentence, every attributed span and the fraction of answer words
+            copied from the context
         """
-        # Combine all context text
-        full_context = " ".join([chunk["text"] for chunk in context_chunks])
-        
-        # Find key phrases from the answer that appear in the context
-        # This is a very simple approach - just looking for 3+ word matches
-        answer_sentences = answer.split(". ")
-        context_sentences = full_context.split(". ")
+        # Shingle index over the context, built once for this answer
+        spans = AttributionIndex(context_chunks).attribute(answer)
         
+        # One connection per answer sentence, the first span found in it
         connections = []
-        for ans_sent in answer_sentences:
-            ans_words = ans_sent.split()
-            if len(ans_words) < 3:  # Skip very short sentences
+        seen_sentences = set()
+        for span in spans:
+            if span["answer_sentence"] in seen_sentences:
                 continue
-                
-            # Check for 3-word phrases from answer in context
-            for i in range(len(ans_words) - 2):
-                phrase = " ".join(ans_words[i:i+3]).lower()
-                if phrase in full_context.lower():
-                    # Find which context chunk it came from
-                    source_chunk = None
-                    for chunk in context_chunks:
-                        if phrase in chunk["text"].lower():
-                            source_chunk = chunk
-                            break
-                    
-                    # Find the full context sentence containing this phrase
-                    context_sentence = ""
-                    for sent in context_sentences:
-                        if phrase in sent.lower():
-                            context_sentence = sent
-                            break
-                    
-                    connections.append({
-                        "answer_text": ans_sent,
-                        "matched_phrase": phrase,
-                        "context_sentence": context_sentence,
-                        "source": source_chunk["source"] if source_chunk else "Unknown"
-                    })
-                    break  # Found a match for this answer sentence, move to next one
+            seen_sentences.add(span["answer_sentence"])
+            connections.append({
+                "answer_text": span["answer_sentence"],
+                "matched_phrase": span["answer_text"].lower(),
+                "context_sentence": span["context_sentence"],
+                "source": span["source"]
+            })
+        
+        answer_words = len(WORD.findall(answer))
+        attributed_words = sum(span["words"] for span in spans)
         
         # Count sources used
         source_counts = {}
@@ -256,29 +385,40 @@ class SimpleGenerationExplainer:
         return {
             "explanation": "The answer was generated by combining information from the retrieved context.",
             "connections": connections[:5],  # Limit to top 5 connections for clarity
+            "attributions": spans,
+            "coverage": attributed_words / answer_words if answer_words else 0.0,
             "sources_by_usage": sources_by_usage
         }
 
 # Simple function to create a dummy explanation when real XAI is too complex
-def create_simple_explanation(query, retrieved_chunks, answer):
+def create_simple_explanation(query, retrieved_chunks, answer, models_directory="models",
+                              charts="background", output_dir="output"):
     """Create a simplified explanation of the retrieval and answer.
     
     Args:
-        query: User query
+        query: User query string
         retrieved_chunks: Retrieved chunks with metadata
         answer: Generated answer
+        models_directory: Directory with the TF-IDF model
+        charts: "background" to render the charts on a worker thread and
+            return immediately, "sync" to render them before returning, or
+            "none" to skip them (render_charts can draw them later)
+        output_dir: Directory where the charts are saved
         
     Returns:
-        Dictionary with explanation text and visualizations
+        Dictionary with explanation text and visualizations. Only the charts
+        the explanation has data for get a path. With background charts,
+        "chart_status" is "pending" until the files are written ("skipped"
+        if there is nothing to draw); call
+        chart_status(explanation["chart_paths"]) to follow it
     """
+    if charts not in CHART_MODES:
+        raise ValueError(f"Unknown chart mode '{charts}', expected one of {CHART_MODES}")
+    
     # Initialize explainers
-    retrieval_explainer = SimpleRetrieverExplainer()
+    retrieval_explainer = SimpleRetrieverExplainer(models_directory)
     generation_explainer = SimpleGenerationExplainer()
     
-    # Create output directory
-    output_dir = "output"
-    os.makedirs(output_dir, exist_ok=True)
-    
     # Get retrieval explanation
     retrieval_explanation = retrieval_explainer.explain_retrieval(query, retrieved_chunks)
     
@@ -286,20 +426,33 @@ def create_simple_explanation(query, retrieved_chunks, answer):
     generation_explanation = generation_explainer.explain_answer(query, retrieved_chunks, answer)
     
     # Create visualizations
-    similarity_path = os.path.join(output_dir, "chunk_similarities.png")
-    retrieval_explainer.visualize_similarities(retrieval_explanation, similarity_path)
-    
-    term_path = os.path.join(output_dir, "term_importance.png")
-    retrieval_explainer.visualize_term_importance(retrieval_explanation, term_path)
+    paths = drawable_charts(retrieval_explanation, chart_paths(query, retrieved_chunks, output_dir))
+    if charts == "sync":
+        visualizations = render_charts(retrieval_explanation, paths)
+        status = "ready" if any(visualizations.values()) else "skipped"
+    elif charts == "background" and chart_key(paths) is None:
+        visualizations = paths
+        status = "skipped"
+    elif charts == "background":
+        # The paths are known now, the files appear once the worker is done
+        render_charts_in_background(retrieval_explanation, paths)
+        visualizations = paths
+        status = "pending"
+    else:
+        visualizations = {name: None for name in paths}
+        status = "none"
     
     # Highlight terms in chunks
+    highlighter = QueryHighlighter(query)
     highlighted_chunks = []
     for chunk in retrieved_chunks:
-        highlighted_text = retrieval_explainer.highlight_matched_terms(query, chunk["text"])
+        highlighted = highlighter.highlight(chunk["text"])
         highlighted_chunks.append({
-            "text": highlighted_text,
+            "text": highlighted["text"],
+            "matches": highlighted["matches"],
             "source": chunk["source"],
-            "score": chunk.get("score", 0)
+            "score": chunk.get("score", 0),
+            "rrf_score": chunk.get("rrf_score")
         })
     
     # Create a combined explanation
@@ -307,10 +460,10 @@ def create_simple_explanation(query, retrieved_chunks, answer):
         "retrieval": retrieval_explanation,
         "generation": generation_explanation,
         "highlighted_chunks": highlighted_chunks,
-        "visualizations": {
-            "similarity": similarity_path if os.path.exists(similarity_path) else None,
-            "term_importance": term_path if os.path.exists(term_path) else None
-        }
+        "visualizations": visualizations,
+        "chart_paths": paths,
+        "charts": charts,
+        "chart_status": status
     }
     
     return explanation
\ No newline at end of file
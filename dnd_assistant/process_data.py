@@ -1,7 +1,13 @@
 import os
 import re
+import bisect
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+from retrieval.chunk_format import CHUNKS_SUFFIX, LEGACY_CHUNKS_SUFFIX, chunks_path, make_record, write_record
+
 def read_text_file(file_path):
     """Read text from a text file."""
     with open(file_path, 'r', encoding='utf-8') as file:
@@ -23,8 +29,192 @@ def chunk_text(text, chunk_size=1000, chunk_overlap=200):
     chunks = text_splitter.split_text(text)
     return chunks
 
-def process_campaign_files(text_directory, output_directory):
-    """Process campaign text files and save chunked text."""
+def read_text_windows(file_path, window_size=1 << 20):
+    """Read a text file in windows of about window_size characters.
+    
+    Windows are cut at a paragraph break or whitespace, so no word is split
+    between two windows and large files never have to fit in memory.
+    
+    Yields:
+        Tuples of (byte offset of the window in the file, window text)
+    """
+    # newline='' keeps \r\n as-is, so byte offsets match the file on disk
+    with open(file_path, 'r', encoding='utf-8', newline='') as file:
+        pending = ""
+        offset = 0
+        while True:
+            block = file.read(window_size)
+            if not block:
+                break
+            text = pending + block
+            # Prefer a paragraph break in the second half of the window
+            cut = text.rfind("\n\n")
+            if cut < len(text) // 2:
+                cut = max(text.rfind(" "), text.rfind("\n"))
+            if cut <= 0:
+                cut = len(text)
+            pending = text[cut:]
+            yield offset, text[:cut]
+            offset += len(text[:cut].encode('utf-8'))
+        if pending.strip():
+            yield offset, pending
+
+def _word_positions(text):
+    """Start of every word in the cleaned text and in the raw text."""
+    cleaned_starts = []
+    raw_starts = []
+    position = 0
+    for match in re.finditer(r'\S+', text):
+        cleaned_starts.append(position)
+        raw_starts.append(match.start())
+        position += len(match.group()) + 1
+    return cleaned_starts, raw_starts
+
+def _byte_counter(text, byte_offset):
+    """Return a function converting increasing character positions to byte offsets.
+    
+    Only the text since the previous call is encoded, so a whole window of
+    lookups costs a single pass over the text.
+    """
+    cursor = {"char": 0, "byte": byte_offset}
+    
+    def to_bytes(char_position):
+        if char_position < cursor["char"]:
+            cursor["char"], cursor["byte"] = 0, byte_offset
+        cursor["byte"] += len(text[cursor["char"]:char_position].encode('utf-8'))
+        cursor["char"] = char_position
+        return cursor["byte"]
+    
+    return to_bytes
+
+def _chunk_window(task):
+    """Clean and chunk one window of a file (runs in a worker process).
+    
+    Chunk positions in the cleaned text are mapped back to the raw text to
+    record byte offsets in the source file.
+    """
+    source, byte_offset, raw_text, chunk_size, chunk_overlap = task
+    cleaned_text = clean_text(raw_text)
+    cleaned_starts, raw_starts = _word_positions(raw_text)
+    
+    def to_raw(position):
+        word = bisect.bisect_right(cleaned_starts, position) - 1
+        return raw_starts[word] + (position - cleaned_starts[word])
+    
+    start_bytes = _byte_counter(raw_text, byte_offset)
+    end_bytes = _byte_counter(raw_text, byte_offset)
+    chunks = []
+    search_from = 0
+    
+    for chunk in chunk_text(cleaned_text, chunk_size, chunk_overlap):
+        start = cleaned_text.find(chunk, search_from)
+        if start < 0:
+            chunks.append({"text": chunk, "source": source, "start": None, "end": None})
+            continue
+        search_from = start + 1
+        raw_start = to_raw(start)
+        raw_end = to_raw(start + len(chunk) - 1) + 1
+        chunks.append({"text": chunk, "source": source,
+                       "start": start_bytes(raw_start), "end": end_bytes(raw_end)})
+    return chunks
+
+def _window_tasks(text_directory, text_files, window_size, chunk_size, chunk_overlap):
+    """Yield one chunking task per window of every campaign file."""
+    for text_file in text_files:
+        overlap_text = ""
+        for byte_offset, window in read_text_windows(os.path.join(text_directory, text_file), window_size):
+            # Prepend the end of the previous window (it directly precedes
+            # this one in the file) so chunks overlap across windows too
+            start = byte_offset - len(overlap_text.encode('utf-8'))
+            yield (text_file, start, overlap_text + window, chunk_size, chunk_overlap)
+            overlap_text = window[-chunk_overlap:] if chunk_overlap else ""
+
+def _ordered_results(executor, function, tasks, max_pending):
+    """Map tasks over a process pool, in order, with a bounded number in flight."""
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(function, task))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def iter_campaign_chunks(text_directory, workers=None, window_size=1 << 20,
+                         chunk_size=1000, chunk_overlap=200):
+    """Yield chunk records from every .txt file in a directory.
+    
+    Files are read in bounded windows and the windows are cleaned and
+    chunked by a pool of worker processes, so ingestion scales with the
+    number of cores and memory use does not depend on file size. Records
+    (see retrieval/chunk_format.py) are yielded in file order and can go
+    straight to create_embeddings.
+    
+    Args:
+        text_directory: Directory with the campaign .txt files
+        workers: Number of worker processes (default: all cores, 1 runs inline)
+        window_size: Approximate number of characters read per window
+        chunk_size: Maximum chunk size in characters
+        chunk_overlap: Overlap between consecutive chunks in characters
+        
+    Yields:
+        Chunk records with id, source, byte offsets, hash, token count and text
+    """
+    text_files = sorted(f for f in os.listdir(text_directory) if f.endswith('.txt'))
+    tasks = _window_tasks(text_directory, text_files, window_size, chunk_size, chunk_overlap)
+    workers = workers or os.cpu_count() or 1
+    
+    if workers == 1 or len(text_files) == 0:
+        results = map(_chunk_window, tasks)
+        yield from _numbered_records(results)
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = _ordered_results(executor, _chunk_window, tasks, max_pending=2 * workers)
+        yield from _numbered_records(results)
+
+def _numbered_records(results):
+    """Give chunks their per-file sequence IDs, hashes and token counts."""
+    counters = {}
+    for chunks in results:
+        for chunk in chunks:
+            source = chunk["source"]
+            number = counters.get(source, 0)
+            counters[source] = number + 1
+            chunk_id = f"{os.path.splitext(source)[0]}-{number:06d}"
+            yield make_record(chunk_id, source, chunk["text"], chunk["start"], chunk["end"])
+
+def remove_stale_chunk_files(output_directory, current_paths):
+    """Delete chunk files that were not written by the latest processing run.
+    
+    Their campaign file was deleted (or is now empty), so create_embeddings
+    must stop indexing them. Legacy _chunks.txt files are removed too when
+    no .jsonl file was written for their source, since load_chunks would
+    still read them.
+    """
+    for filename in sorted(os.listdir(output_directory)):
+        path = os.path.join(output_directory, filename)
+        if filename.endswith(CHUNKS_SUFFIX):
+            current_path = path
+        elif filename.endswith(LEGACY_CHUNKS_SUFFIX):
+            source = filename[:-len(LEGACY_CHUNKS_SUFFIX)] + ".txt"
+            current_path = chunks_path(output_directory, source)
+        else:
+            continue
+        if current_path not in current_paths:
+            print(f"Removing {filename}: its campaign file no longer exists.")
+            os.remove(path)
+
+def process_campaign_files(text_directory, output_directory, workers=None, window_size=1 << 20):
+    """Process campaign text files and save chunk records as JSON Lines.
+    
+    Records are written as they are produced and not kept, so memory use
+    does not depend on the size of the campaign; stream them back with
+    create_embeddings.load_chunks. Chunk files left over from campaign
+    files that no longer exist are removed.
+    
+    Returns:
+        Number of chunks written
+    """
     os.makedirs(output_directory, exist_ok=True)
     
     # Get all text files in the directory
@@ -32,33 +222,29 @@ def process_campaign_files(text_directory, output_directory):
     
     if not text_files:
         print(f"No text files found in {text_directory}. Please add .txt files first.")
-        return []
+        remove_stale_chunk_files(output_directory, set())
+        return 0
     
-    all_chunks = []
+    num_chunks = 0
+    output_files = {}
     
-    for text_file in text_files:
-        file_path = os.path.join(text_directory, text_file)
-        print(f"Processing {text_file}...")
-        
-        # Extract and clean text
-        raw_text = read_text_file(file_path)
-        cleaned_text = clean_text(raw_text)
-        
-        # Split into chunks
-        chunks = chunk_text(cleaned_text)
-        
-        # Add source metadata
-        chunks_with_metadata = [{"text": chunk, "source": text_file} for chunk in chunks]
-        all_chunks.extend(chunks_with_metadata)
-        
-        # Save chunks to file
-        output_file = os.path.join(output_directory, f"{os.path.splitext(text_file)[0]}_chunks.txt")
-        with open(output_file, 'w', encoding='utf-8') as f:
-            for chunk in chunks:
-                f.write(chunk + "\n\n---\n\n")
-                
-    print(f"Processed {len(all_chunks)} chunks from {len(text_files)} files.")
-    return all_chunks
+    try:
+        for record in iter_campaign_chunks(text_directory, workers=workers, window_size=window_size):
+            text_file = record["source"]
+            if text_file not in output_files:
+                print(f"Processing {text_file}...")
+                output_files[text_file] = open(chunks_path(output_directory, text_file), 'w', encoding='utf-8')
+            
+            # Save chunks to file as they are produced
+            write_record(output_files[text_file], record)
+            num_chunks += 1
+    finally:
+        for f in output_files.values():
+            f.close()
+    
+    remove_stale_chunk_files(output_directory, {f.name for f in output_files.values()})
+    print(f"Processed {num_chunks} chunks from {len(text_files)} files.")
+    return num_chunks
 
 def create_sample_files(raw_directory):
     """Create sample campaign files if none exist."""
@@ -210,6 +396,121 @@ Quando um personagem é reduzido a 0 pontos de vida e não morre, sofre um ferim
         
         print("Sample files created successfully! Edit them with your campaign info or create new .txt files.")
 
+# Building blocks of the synthetic campaigns used by the benchmarks
+SYNTHETIC_SYLLABLES = ["va", "lo", "ri", "el", "dri", "th", "zy", "ros", "ka", "mar", "lyn", "thar",
+                       "gor", "bel", "ne", "quel", "dor", "fen", "ar", "is", "mo", "ra", "ul", "wen"]
+SYNTHETIC_WORDS = {
+    "place": ["Floresta", "Montanhas", "Cidade", "Pântano", "Vale", "Torre", "Ruínas", "Porto", "Deserto"],
+    "direction": ["norte", "sul", "leste", "oeste"],
+    "feature": ["suas árvores altas e densas", "suas muralhas de pedra", "suas nevascas constantes",
+                "seus mercados movimentados", "seus templos antigos", "suas cavernas de cristal"],
+    "creature": ["um dragão verde", "um lich esquecido", "uma bruxa da névoa", "um gigante de gelo",
+                 "um enxame de fadas", "um golem de pedra"],
+    "role": ["governante", "conselheira mágica", "mercador", "capitão da guarda", "sacerdotisa", "espião"],
+    "trait": ["sua justiça", "sua risada estrondosa", "sua ambição", "seus segredos", "sua coragem"],
+    "class": ["Guerreiro", "Maga", "Ladino", "Clérigo", "Bardo", "Patrulheiro", "Bruxo", "Paladino"],
+    "alignment": ["Leal e Bom", "Neutro", "Caótico e Neutro", "Leal e Mau", "Neutro e Bom"],
+    "item": ["Espada", "Amuleto", "Botas", "Anel", "Cajado", "Manto", "Escudo", "Elmo"],
+    "damage": ["fogo", "frio", "veneno", "necrótico", "radiante", "trovão", "ácido"],
+    "monster": ["Dragão", "Golem", "Assombração", "Hidra", "Basilisco", "Quimera", "Troll"],
+}
+SYNTHETIC_TEMPLATES = {
+    "regioes": """## {place} de {name}
+{place} de {name} fica ao {direction} de {other}. É conhecida por {feature}, e dizem que {creature} reside em seu coração. Viajantes relatam que as estradas ficam perigosas ao anoitecer.
+
+### Locais Importantes
+- Torre de {name2}: Uma torre de pedra abandonada
+- Mercado de {other}: Centro de comércio da região
+""",
+    "npcs": """## {name}
+{name} é {role} de {other}. Conhecido por {trait}, tem ligações antigas com {name2} e desconfia de estrangeiros.
+
+### Estatísticas
+- Nível: {level}
+- Classe: {class}
+- Alinhamento: {alignment}
+""",
+    "itens_magicos": """## {item} de {name}
+Um item lendário forjado em {other} por {name2}. Quem o empunha sente o poder de {creature}.
+
+### Propriedades
+- +{bonus} de bônus para acerto e dano
+- Causa 1d{die} de dano de {damage} adicional
+- {uses}x por dia pode lançar uma magia de {damage}
+""",
+    "monstros": """## {monster} {name}
+Uma criatura que habita os arredores de {other}. É astuta e territorial, e ataca caravanas que cruzam {place} de {name2}.
+
+### Estatísticas
+- CA: {armor}
+- PV: {hit_points} ({level}d10 + {bonus})
+- Imunidade a dano de {damage}
+""",
+    "sessoes": """## Sessão {number}
+Os aventureiros partiram de {other} em direção a {place} de {name}. No caminho enfrentaram {creature} e conheceram {name2}, que lhes ofereceu {item} de {name} em troca de informações sobre {trait}.
+""",
+}
+
+def _synthetic_name(rng):
+    return "".join(rng.choice(SYNTHETIC_SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+def _synthetic_section(rng, category, number):
+    values = {key: rng.choice(words) for key, words in SYNTHETIC_WORDS.items()}
+    values.update({
+        "name": _synthetic_name(rng), "name2": _synthetic_name(rng), "other": _synthetic_name(rng),
+        "level": rng.randint(1, 20), "bonus": rng.randint(1, 5), "die": rng.choice([4, 6, 8, 10]),
+        "uses": rng.randint(1, 3), "armor": rng.randint(10, 22), "hit_points": rng.randint(10, 400),
+        "number": number
+    })
+    return SYNTHETIC_TEMPLATES[category].format(**values) + "\n"
+
+def create_synthetic_campaign(raw_directory, num_chunks, chunk_size=1000, chunk_overlap=200,
+                              chunks_per_file=10000, seed=42):
+    """Write a synthetic campaign of roughly num_chunks chunks, for benchmarks.
+    
+    The files look like the sample files (regions, NPCs, items, monsters and
+    session logs with generated names) and are written section by section,
+    so even a million-chunk campaign is produced in constant memory. The
+    same seed always produces the same campaign.
+    
+    Args:
+        raw_directory: Directory for the .txt files (created if needed)
+        num_chunks: Approximate number of chunks process_campaign_files will produce
+        chunk_size: Chunk size the corpus will be split with
+        chunk_overlap: Chunk overlap the corpus will be split with
+        chunks_per_file: Approximate number of chunks per file
+        seed: Random seed
+        
+    Returns:
+        List of the file paths written
+    """
+    os.makedirs(raw_directory, exist_ok=True)
+    rng = random.Random(seed)
+    categories = list(SYNTHETIC_TEMPLATES)
+    
+    # Each chunk advances about chunk_size - chunk_overlap characters
+    characters_per_file = chunks_per_file * (chunk_size - chunk_overlap)
+    remaining = num_chunks * (chunk_size - chunk_overlap)
+    paths = []
+    section_number = 0
+    while remaining > 0:
+        category = categories[len(paths) % len(categories)]
+        path = os.path.join(raw_directory, f"{category}_{len(paths):04d}.txt")
+        budget = min(characters_per_file, remaining)
+        written = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"# {category.replace('_', ' ').title()} (gerado)\n\n")
+            while written < budget:
+                section_number += 1
+                section = _synthetic_section(rng, category, section_number)
+                f.write(section)
+                written += len(section)
+        remaining -= written
+        paths.append(path)
+    
+    print(f"Created a synthetic campaign of {len(paths)} files (~{num_chunks} chunks) in {raw_directory}")
+    return paths
+
 if __name__ == "__main__":
     # Update these paths to your actual directories
     raw_directory = "data/raw"
@@ -219,5 +520,5 @@ if __name__ == "__main__":
     create_sample_files(raw_directory)
     
     # Process the campaign files
-    chunks = process_campaign_files(raw_directory, output_directory)
-    print(f"Processed {len(chunks)} chunks from campaign files.")
\ No newline at end of file
+    num_chunks = process_campaign_files(raw_directory, output_directory)
+    print(f"Processed {num_chunks} chunks from campaign files.")
\ No newline at end of file
@@ -0,0 +1,462 @@
+"""
+Caches used by the retrieval pipeline.
+Players tend to repeat the same questions during a session, so the query
+embeddings are kept in memory and, optionally, on disk between runs. Answers
+generated from the same retrieved chunks are cached the same way, and the
+search results of recent queries are reused for rephrasings of them.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from retrieval.text import WORD, fold_accents
+
+
+def normalize_query(query):
+    """Collapse whitespace so trivially different spellings share a cache entry.
+
+    Case is kept: the embedding model is cased, so "Rei" and "rei" can encode
+    differently.
+    """
+    return " ".join(query.split())
+
+
+def query_key(query, model_name):
+    """Hash of the normalized query plus the model that encodes it."""
+    text = f"{model_name}\0{normalize_query(query)}"
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+class QueryEmbeddingCache:
+    """LRU cache of query embeddings with an optional on-disk tier.
+
+    The disk tier is split into shards of fixed-size records (20-byte key
+    followed by the float32 vector). Shards are append-only files read through
+    numpy memory maps, so cached embeddings survive restarts of the app. A
+    shard that reaches its share of max_disk_entries is compacted to its
+    newest half. The cache is shared by the server threads, so every access
+    takes a lock.
+    """
+
+    KEY_SIZE = 20
+    # Bumped whenever query_key changes, so shards with old keys are ignored
+    KEY_VERSION = 2
+
+    def __init__(self, model_name, max_size=1024, cache_directory=None, num_shards=16,
+                 max_disk_entries=100_000):
+        """Initialize the cache.
+
+        Args:
+            model_name: Name of the embedding model (part of every key)
+            max_size: Maximum number of embeddings kept in memory
+            cache_directory: Directory for the on-disk tier, or None to disable it
+            num_shards: Number of shard files used by the on-disk tier
+            max_disk_entries: Approximate maximum number of embeddings kept on disk
+        """
+        self.model_name = model_name
+        self.max_size = max_size
+        self.cache_directory = cache_directory
+        self.num_shards = num_shards
+        self.shard_capacity = max(2, -(-max_disk_entries // num_shards))
+        self.dimension = None
+
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+
+        # key -> (shard, row) for every record stored on disk
+        self.disk_index = {}
+        self.shard_maps = {}
+
+        if cache_directory:
+            os.makedirs(cache_directory, exist_ok=True)
+            self._load_disk_index()
+
+    def _file_prefix(self):
+        return f"{self.model_name.replace('/', '__')}.v{self.KEY_VERSION}"
+
+    def _shard_path(self, shard):
+        return os.path.join(self.cache_directory,
+                            f"{self._file_prefix()}-{self.dimension}d-{shard:02x}.bin")
+
+    def _record_dtype(self):
+        return np.dtype([("key", "u1", (self.KEY_SIZE,)), ("vector", "<f4", (self.dimension,))])
+
+    def _load_disk_index(self):
+        """Scan the shard files and index the keys they contain."""
+        prefix = self._file_prefix() + "-"
+        for filename in sorted(os.listdir(self.cache_directory)):
+            if not (filename.startswith(prefix) and filename.endswith(".bin")):
+                continue
+            dimension_part, shard_part = filename[len(prefix):-len(".bin")].split("-")
+            self.dimension = int(dimension_part.rstrip("d"))
+            shard = int(shard_part, 16)
+            records = self._shard_map(shard)
+            if records is None:
+                continue
+            for row, key in enumerate(records["key"]):
+                self.disk_index[key.tobytes()] = (shard, row)
+
+    def _shard_map(self, shard):
+        """Return a memory map over the complete records of a shard."""
+        if shard not in self.shard_maps:
+            path = self._shard_path(shard)
+            dtype = self._record_dtype()
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            rows = size // dtype.itemsize
+            if rows == 0:
+                return None
+            self.shard_maps[shard] = np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+        return self.shard_maps[shard]
+
+    def _remember(self, key, vector):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    def get(self, query):
+        """Return the cached embedding for a query, or None on a miss."""
+        key = query_key(query, self.model_name)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key]
+
+            if key in self.disk_index:
+                shard, row = self.disk_index[key]
+                vector = np.array(self._shard_map(shard)[row]["vector"], dtype="float32")
+                self._remember(key, vector)
+                self.hits += 1
+                self.disk_hits += 1
+                return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, query, vector):
+        """Store the embedding of a query in memory and on disk."""
+        key = query_key(query, self.model_name)
+        vector = np.asarray(vector, dtype="float32").reshape(-1)
+        with self.lock:
+            self._remember(key, vector)
+
+            if not self.cache_directory or key in self.disk_index:
+                return
+            if self.dimension is None:
+                self.dimension = vector.shape[0]
+            if vector.shape[0] != self.dimension:
+                return
+
+            shard = key[0] % self.num_shards
+            path = self._shard_path(shard)
+            record_size = self._record_dtype().itemsize
+            with open(path, "ab") as f:
+                size = f.tell()
+                if size % record_size:
+                    # Torn append of an interrupted run; drop it so the rows stay aligned
+                    size -= size % record_size
+                    f.truncate(size)
+                row = size // record_size
+                f.write(key + vector.astype("<f4").tobytes())
+            self.disk_index[key] = (shard, row)
+            # The shard grew, reopen the memory map on next read
+            self.shard_maps.pop(shard, None)
+            if row + 1 >= self.shard_capacity:
+                self._compact(shard)
+
+    def _compact(self, shard):
+        """Rewrite a full shard with its newest half; called with the lock held."""
+        records = self._shard_map(shard)
+        kept = np.array(records[len(records) // 2:])
+        self.shard_maps.pop(shard, None)
+        del records
+
+        path = self._shard_path(shard)
+        kept.tofile(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+        for key, (key_shard, _) in list(self.disk_index.items()):
+            if key_shard == shard:
+                del self.disk_index[key]
+        for row, key in enumerate(kept["key"]):
+            self.disk_index[key.tobytes()] = (shard, row)
+        self.disk_evictions += self.shard_capacity - len(kept)
+
+    def stats(self):
+        """Return hit/miss counters for the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_entries": len(self.disk_index),
+            "disk_evictions": self.disk_evictions
+        }
+
+
+def answer_key(query, chunk_ids, model_name, generation_params):
+    """Hash identifying a generated answer.
+
+    Args:
+        query: User query string (normalized before hashing)
+        chunk_ids: IDs of the retrieved chunks, in prompt order
+        model_name: Text generation model
+        generation_params: Dictionary of everything else that shapes the prompt
+            or the generation (context budget, max_length, ...)
+    """
+    text = json.dumps([normalize_query(query), [int(i) for i in chunk_ids], model_name,
+                       generation_params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """LRU cache of generated answers with a time-to-live.
+
+    Chunk IDs only identify the same text within one build of the index, so
+    every entry belongs to the fingerprint of the manifest it was generated
+    with; a disk copy saved with a different fingerprint is ignored at load
+    (and overwritten by the next answer). The optional disk copy
+    is a JSON file rewritten (atomically) after each new answer.
+    """
+
+    def __init__(self, fingerprint, max_size=256, ttl=24 * 3600, cache_path=None):
+        """Initialize the cache.
+
+        Args:
+            fingerprint: Fingerprint of the index manifest (see manifest_fingerprint)
+            max_size: Maximum number of answers kept
+            ttl: Seconds an answer stays valid, or None to keep it until evicted
+            cache_path: JSON file persisting the cache between runs, or None
+        """
+        self.fingerprint = fingerprint
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_path = cache_path
+
+        # key -> (entry dictionary, creation time); wall-clock time so it
+        # survives restarts
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+        if cache_path and os.path.exists(cache_path):
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable answer cache {self.cache_path}: {e}")
+            return
+        if data.get("fingerprint") != self.fingerprint:
+            # Built for another index, its chunk IDs mean nothing here
+            return
+        for key, entry, created in data.get("entries", []):
+            if not self._is_expired(created):
+                self.entries[key] = (entry, created)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def _save(self):
+        """Write the cache file; called with the lock held."""
+        data = {
+            "fingerprint": self.fingerprint,
+            "entries": [[key, entry, created] for key, (entry, created) in self.entries.items()]
+        }
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.cache_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(self.cache_path + ".tmp", self.cache_path)
+
+    def _is_expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key):
+        """Return the cached entry for an answer key, or None on a miss."""
+        with self.lock:
+            item = self.entries.get(key)
+            if item is not None and self._is_expired(item[1]):
+                del self.entries[key]
+                self.expired += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return dict(item[0])
+
+    def put(self, key, entry):
+        """Store an answer entry (a JSON-serializable dictionary)."""
+        with self.lock:
+            self.entries[key] = (dict(entry), time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            if self.cache_path:
+                self._save()
+
+    def clear(self):
+        """Drop every cached answer."""
+        with self.lock:
+            self.entries.clear()
+            if self.cache_path and os.path.exists(self.cache_path):
+                os.remove(self.cache_path)
+
+    def stats(self):
+        """Return hit/miss counters for the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries)
+        }
+
+
+def query_names(query, names):
+    """Campaign names a query mentions, accent-folded.
+
+    Args:
+        query: User query string
+        names: Accent-folded names known to the campaign (see
+            retrieval.text.NameVocabulary); every word of the query is looked
+            up, so a name opening the question counts too
+    """
+    return frozenset(word for word in WORD.findall(fold_accents(query)) if word in names)
+
+
+class SemanticQueryCache:
+    """Search results of recent queries, reused for near-duplicate queries.
+
+    Query embeddings are kept normalized in a fixed-size matrix and a new
+    query is compared with all of them with one matrix-vector product (a few
+    hundred rows, cheaper than a FAISS index that would need rebuilding on
+    every eviction). A hit needs a cosine similarity of at least the
+    threshold and the same campaign names, since questions about two
+    different NPCs can embed almost identically. Queries that mention no
+    known name are never reused nor stored: nothing tells apart what they
+    are about.
+    """
+
+    def __init__(self, names, max_size=256, threshold=0.95):
+        """Initialize the cache.
+
+        Args:
+            names: Accent-folded campaign names (see query_names)
+            max_size: Maximum number of queries remembered (least recently
+                used ones are evicted)
+            threshold: Minimum cosine similarity between two queries for the
+                cached results to be reused
+        """
+        self.names = frozenset(names)
+        self.max_size = max_size
+        self.threshold = threshold
+        self.vectors = None
+        # slot -> (query, names, top_k, hits); ordered from least to most recently used
+        self.entries = OrderedDict()
+        # Normalized query -> query whose results it reused
+        self.aliases = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _unit(self, embedding):
+        vector = np.asarray(embedding, dtype="float32").reshape(-1)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def get(self, query, embedding, top_k):
+        """Return the cached search hits of a similar query, or None on a miss.
+
+        Args:
+            query: User query string
+            embedding: Its embedding
+            top_k: Number of hits needed; only entries searched with the same
+                top_k match, since hybrid search fuses a pool that grows with it
+        """
+        names = query_names(query, self.names)
+        with self.lock:
+            if self.entries and names:
+                slots = np.fromiter(self.entries.keys(), dtype="int64")
+                similarities = self.vectors[slots] @ self._unit(embedding)
+                for position in np.argsort(-similarities):
+                    if similarities[position] < self.threshold:
+                        break
+                    slot = int(slots[position])
+                    cached_query, cached_names, cached_top_k, hits = self.entries[slot]
+                    if cached_names == names and cached_top_k == top_k:
+                        self.entries.move_to_end(slot)
+                        self._alias(query, cached_query)
+                        self.hits += 1
+                        return list(hits)
+            self.misses += 1
+            return None
+
+    def put(self, query, embedding, top_k, hits):
+        """Remember the search hits of a query that mentions a campaign name."""
+        names = query_names(query, self.names)
+        if not names:
+            return
+        vector = self._unit(embedding)
+        with self.lock:
+            if self.vectors is None:
+                self.vectors = np.zeros((self.max_size, vector.shape[0]), dtype="float32")
+            if len(self.entries) < self.max_size:
+                slot = len(self.entries)
+            else:
+                slot, _ = self.entries.popitem(last=False)
+                self.evictions += 1
+            self.vectors[slot] = vector
+            self.entries[slot] = (query, names, top_k, list(hits))
+
+    def _alias(self, query, cached_query):
+        self.aliases[normalize_query(query)] = cached_query
+        self.aliases.move_to_end(normalize_query(query))
+        while len(self.aliases) > self.max_size:
+            self.aliases.popitem(last=False)
+
+    def canonical_query(self, query):
+        """The query whose results were reused for this one, or the query itself.
+
+        Lets the answer cache treat a rephrased question as the original one.
+        """
+        with self.lock:
+            return self.aliases.get(normalize_query(query), query)
+
+    def clear(self):
+        """Forget every query."""
+        with self.lock:
+            self.entries.clear()
+            self.aliases.clear()
+
+    def stats(self):
+        """Return hit/miss counters for the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "evictions": self.evictions,
+            "threshold": self.threshold
+        }
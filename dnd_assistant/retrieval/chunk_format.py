@@ -0,0 +1,65 @@
+"""
+Chunk interchange format between process_data.py and create_embeddings.py.
+Chunks are stored as JSON Lines, one record per line, so both stages can
+stream them without loading the whole corpus. Each record holds:
+
+    id      stable chunk ID, "<file stem>-<sequence number>"
+    source  name of the campaign file
+    start   byte offset of the chunk in the source file
+    end     byte offset just past the chunk in the source file
+    hash    SHA-1 of the source and text (see content_hash)
+    tokens  approximate token count (words and punctuation marks)
+    text    chunk text
+"""
+
+import os
+import re
+import json
+import hashlib
+
+CHUNKS_SUFFIX = "_chunks.jsonl"
+# Chunk files of older versions, plain text separated by "\n\n---\n\n"
+LEGACY_CHUNKS_SUFFIX = "_chunks.txt"
+TOKEN = re.compile(r"\w+|[^\w\s]")
+
+def content_hash(source, text):
+    """Content hash identifying a chunk across rebuilds."""
+    content = f"{source}\0{text}"
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def count_tokens(text):
+    """Approximate token count, close to what BERT-style tokenizers pre-split."""
+    return len(TOKEN.findall(text))
+
+def make_record(chunk_id, source, text, start=None, end=None):
+    """Build a chunk record with its hash and token count."""
+    return {
+        "id": chunk_id,
+        "source": source,
+        "start": start,
+        "end": end,
+        "hash": content_hash(source, text),
+        "tokens": count_tokens(text),
+        "text": text
+    }
+
+def chunks_path(output_directory, source):
+    """Path of the chunk file for a campaign file."""
+    return os.path.join(output_directory, os.path.splitext(source)[0] + CHUNKS_SUFFIX)
+
+def write_record(f, record):
+    """Append one record to an open chunk file."""
+    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def read_chunks(path):
+    """Yield the records of a chunk file one at a time."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def iter_chunk_files(processed_directory):
+    """Yield the records of every chunk file in a directory, in file order."""
+    for filename in sorted(os.listdir(processed_directory)):
+        if filename.endswith(CHUNKS_SUFFIX):
+            yield from read_chunks(os.path.join(processed_directory, filename))
@@ -0,0 +1,178 @@
+"""
+Compact binary store for chunk texts and sources.
+Replaces chunks.pkl and index_to_chunk.json: the file is opened with mmap,
+so loading is constant time, pages are shared between processes and
+chunks are looked up directly by their integer index ID.
+
+File layout (little endian):
+    header   magic, number of ID slots, number of chunks,
+             offset of the source table, offset of the text blob
+    offsets  int64[slots + 1], start of each chunk text inside the blob
+    sources  uint32[slots], index into the source table (NO_CHUNK if unused)
+    table    UTF-8 JSON list with each distinct source name once
+    blob     UTF-8 chunk texts, back to back
+"""
+
+import os
+import mmap
+import json
+import struct
+import tempfile
+from array import array
+
+import numpy as np
+
+CHUNK_STORE_FILE = "chunks.bin"
+MAGIC = b"DNDCHNK1"
+HEADER = struct.Struct("<8sQQQQ")
+NO_CHUNK = 0xFFFFFFFF
+
+class ChunkStoreWriter:
+    """Write a chunk store one chunk at a time.
+
+    Texts are appended to a temporary file as they arrive, in any ID order,
+    and laid out by ID when the store is closed, so only a few integers per
+    chunk are kept in memory.
+    """
+
+    def __init__(self, path):
+        """Start a store.
+
+        Args:
+            path: Destination file path, written by close()
+        """
+        self.path = path
+        self._texts = tempfile.TemporaryFile(dir=os.path.dirname(path) or ".")
+        self._ids = array('q')
+        self._starts = array('q')
+        self._source_ids = array('q')
+        self._source_table = {}
+        self._position = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, chunk_id, chunk):
+        """Append a chunk with text and source under an integer index ID."""
+        encoded = chunk["text"].encode('utf-8')
+        self._texts.write(encoded)
+        self._ids.append(chunk_id)
+        self._starts.append(self._position)
+        self._source_ids.append(self._source_table.setdefault(chunk["source"], len(self._source_table)))
+        self._position += len(encoded)
+
+    def close(self):
+        """Write the store file and release the temporary texts."""
+        ids = np.asarray(self._ids, dtype='int64')
+        # Start of every text in arrival order, plus the end of the last one
+        starts = np.append(np.asarray(self._starts, dtype='int64'), self._position)
+        lengths = np.diff(starts)
+        if len(np.unique(ids)) != len(ids):
+            raise ValueError("Chunk IDs in a chunk store must be unique")
+
+        slots = int(ids.max()) + 1 if len(ids) else 0
+        length_of_id = np.zeros(slots, dtype='<i8')
+        length_of_id[ids] = lengths
+        offsets = np.zeros(slots + 1, dtype='<i8')
+        np.cumsum(length_of_id, out=offsets[1:])
+        source_ids = np.full(slots, NO_CHUNK, dtype='<u4')
+        if len(ids):
+            source_ids[ids] = np.asarray(self._source_ids, dtype='int64')
+
+        sources = json.dumps(list(self._source_table), ensure_ascii=False).encode('utf-8')
+        sources_offset = HEADER.size + offsets.nbytes + source_ids.nbytes
+        blob_offset = sources_offset + len(sources)
+
+        self._texts.flush()
+        texts = mmap.mmap(self._texts.fileno(), 0, access=mmap.ACCESS_READ) if self._position else b""
+        # Write next to the target and swap, so open readers keep a consistent file
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, slots, len(ids), sources_offset, blob_offset))
+                f.write(offsets.tobytes())
+                f.write(source_ids.tobytes())
+                f.write(sources)
+                for position in np.argsort(ids, kind='stable'):
+                    f.write(texts[starts[position]:starts[position + 1]])
+            os.replace(temp_path, self.path)
+        finally:
+            if self._position:
+                texts.close()
+            self._texts.close()
+
+    def abort(self):
+        """Discard the chunks added so far without writing the store."""
+        self._texts.close()
+
+def write_chunk_store(path, chunks_by_id):
+    """Write chunks to a store file.
+
+    Args:
+        path: Destination file path
+        chunks_by_id: Dictionary mapping integer index ID to a chunk with text and source
+    """
+    writer = ChunkStoreWriter(path)
+    for chunk_id, chunk in chunks_by_id.items():
+        writer.add(chunk_id, chunk)
+    writer.close()
+
+class ChunkStore:
+    """Read-only, memory-mapped view of a chunk store file."""
+
+    def __init__(self, path):
+        """Open a chunk store.
+
+        Args:
+            path: Path of a file written by write_chunk_store
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.slots, self.num_chunks, sources_offset, self.blob_offset = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a chunk store file")
+
+        self.offsets = np.frombuffer(self._mmap, dtype='<i8', count=self.slots + 1, offset=HEADER.size)
+        self.source_ids = np.frombuffer(self._mmap, dtype='<u4', count=self.slots,
+                                        offset=HEADER.size + self.offsets.nbytes)
+        self.sources = json.loads(self._mmap[sources_offset:self.blob_offset].decode('utf-8'))
+
+    def __len__(self):
+        return self.num_chunks
+
+    def __contains__(self, chunk_id):
+        return 0 <= chunk_id < self.slots and self.source_ids[chunk_id] != NO_CHUNK
+
+    def get(self, chunk_id):
+        """Return the chunk with the given index ID, or None if there is none."""
+        if chunk_id not in self:
+            return None
+        start = self.blob_offset + int(self.offsets[chunk_id])
+        end = self.blob_offset + int(self.offsets[chunk_id + 1])
+        return {
+            "text": self._mmap[start:end].decode('utf-8'),
+            "source": self.sources[self.source_ids[chunk_id]]
+        }
+
+    def items(self):
+        """Iterate over (index ID, chunk) pairs."""
+        for chunk_id in np.flatnonzero(self.source_ids != NO_CHUNK):
+            yield int(chunk_id), self.get(int(chunk_id))
+
+def migrate_legacy_files(models_directory):
+    """Convert index_to_chunk.json from older builds into a chunk store.
+
+    Returns:
+        Path of the new store, or None if there was nothing to migrate
+    """
+    legacy_path = os.path.join(models_directory, "index_to_chunk.json")
+    if not os.path.exists(legacy_path):
+        return None
+    with open(legacy_path, 'r', encoding='utf-8') as f:
+        index_to_chunk = json.load(f)
+    store_path = os.path.join(models_directory, CHUNK_STORE_FILE)
+    write_chunk_store(store_path, {int(idx): chunk for idx, chunk in index_to_chunk.items()})
+    return store_path
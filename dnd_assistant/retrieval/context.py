@@ -0,0 +1,124 @@
+"""
+Token-aware packing of retrieved chunks into the generation prompt.
+The generator only sees a few hundred tokens, so instead of concatenating
+whole chunks (and letting the pipeline truncate them), the best sentences
+are selected until a token budget is filled.
+"""
+
+import re
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+WORD = re.compile(r'\w+')
+
+def split_sentences(text):
+    """Split text into sentences on ., ! and ? followed by whitespace."""
+    return [sentence.strip() for sentence in SENTENCE_END.split(text) if sentence.strip()]
+
+def _normalize(text):
+    return " ".join(WORD.findall(text.lower()))
+
+def _is_fragment(fragment, sentence, starts_chunk, ends_chunk):
+    """Whether a normalized sentence is a piece of another, cut by a chunk boundary.
+
+    Only the first sentence of a chunk can be the end of a longer sentence,
+    and only the last one its beginning; whole words are compared.
+    """
+    if starts_chunk and ends_chunk:
+        return f" {fragment} " in f" {sentence} "
+    if starts_chunk:
+        return sentence.endswith(" " + fragment)
+    if ends_chunk:
+        return sentence.startswith(fragment + " ")
+    return False
+
+class ContextPacker:
+    """Selects the highest-scoring context sentences that fit a token budget."""
+
+    def __init__(self, max_tokens=256):
+        """Initialize the packer.
+
+        Args:
+            max_tokens: Maximum number of context tokens placed in the prompt
+        """
+        self.max_tokens = max_tokens
+
+    def count_tokens(self, text, tokenizer=None):
+        """Count tokens with the generator's tokenizer (or words without one)."""
+        if tokenizer is None:
+            return len(text.split())
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    def pack(self, query, retrieved_chunks, tokenizer=None):
+        """Pack the retrieved chunks into a context string.
+
+        Sentences repeated between chunks (chunk_text overlaps consecutive
+        chunks by 200 characters) are kept once, and so are the pieces of a
+        sentence that a chunk boundary cut. Each sentence is scored by
+        the rank of its chunk plus its word overlap with the query, and the
+        best ones are kept until the budget is full, in their original order.
+
+        Args:
+            query: User query string
+            retrieved_chunks: Chunks in retrieval order, best first
+            tokenizer: Tokenizer used to count tokens (optional)
+
+        Returns:
+            Dictionary with the packed text and token accounting
+        """
+        query_words = {word for word in WORD.findall(query.lower()) if len(word) > 3}
+
+        candidates = []
+        seen = set()
+        position = 0
+        duplicate_tokens = 0
+        for rank, chunk in enumerate(retrieved_chunks):
+            sentences = split_sentences(chunk["text"])
+            for i, sentence in enumerate(sentences):
+                normalized = _normalize(sentence)
+                tokens = self.count_tokens(sentence, tokenizer)
+                starts_chunk, ends_chunk = i == 0, i == len(sentences) - 1
+                # Overlap fragments are pieces of sentences already seen
+                if not normalized or normalized in seen or ((starts_chunk or ends_chunk) and any(
+                        _is_fragment(normalized, other, starts_chunk, ends_chunk) for other in seen)):
+                    duplicate_tokens += tokens
+                    continue
+                seen.add(normalized)
+
+                # A chunk cut mid-sentence leaves a fragment of this sentence
+                for previous in [c for c in candidates if _is_fragment(c["normalized"], normalized,
+                                                                       c["starts_chunk"], c["ends_chunk"])]:
+                    duplicate_tokens += previous["tokens"]
+                    candidates.remove(previous)
+
+                words = set(normalized.split())
+                overlap = len(words & query_words) / len(query_words) if query_words else 0.0
+                candidates.append({
+                    "position": position,
+                    "text": sentence,
+                    "normalized": normalized,
+                    "starts_chunk": starts_chunk,
+                    "ends_chunk": ends_chunk,
+                    "tokens": tokens,
+                    "score": 1.0 / (rank + 1) + overlap
+                })
+                position += 1
+
+        selected = []
+        tokens_used = 0
+        tokens_dropped = 0
+        for candidate in sorted(candidates, key=lambda c: c["score"], reverse=True):
+            if tokens_used + candidate["tokens"] <= self.max_tokens:
+                selected.append(candidate)
+                tokens_used += candidate["tokens"]
+            else:
+                tokens_dropped += candidate["tokens"]
+
+        selected.sort(key=lambda c: c["position"])
+        return {
+            "text": " ".join(candidate["text"] for candidate in selected),
+            "tokens_used": tokens_used,
+            "tokens_dropped": tokens_dropped,
+            "duplicate_tokens": duplicate_tokens,
+            "sentences_used": len(selected),
+            "sentences_dropped": len(candidates) - len(selected)
+        }
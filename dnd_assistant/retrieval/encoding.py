@@ -0,0 +1,266 @@
+"""
+CPU-parallel embedding of chunk texts for create_embeddings.py.
+Texts are read from an iterator in bounded windows and sorted by length
+within each window so each batch pads as little as possible, and the
+batches are encoded by a pool of worker processes, each with its own copy
+of the model and a fixed number of threads. Vectors are written into a
+disk-backed array as batches finish, so neither the texts nor the vectors
+of the whole corpus have to fit in memory.
+"""
+
+import os
+import json
+import time
+import tempfile
+import itertools
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+# "torch" runs sentence-transformers, "onnx" the exported int8 model
+# (see retrieval/onnx_encoder.py)
+ENCODER_BACKENDS = ("torch", "onnx")
+
+# Model loaded once per worker process by _init_worker
+_worker_model = None
+
+def default_workers(threads_per_worker):
+    """Number of worker processes that keeps every core busy."""
+    return max(1, (os.cpu_count() or 1) // threads_per_worker)
+
+def length_sorted_batches(texts, batch_size):
+    """Split text positions into batches of texts of similar length.
+
+    Returns:
+        List of int64 arrays of positions, longest texts first so the
+        slowest batches start early
+    """
+    order = np.argsort([-len(text) for text in texts], kind='stable')
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+def _windows(texts, size):
+    """Split an iterable of texts into lists of at most size texts."""
+    window = []
+    for text in texts:
+        window.append(text)
+        if len(window) == size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+def _batches(windows, batch_size):
+    """Yield (positions, texts) batches, length-sorted within each window."""
+    offset = 0
+    for window in windows:
+        for positions in length_sorted_batches(window, batch_size):
+            yield positions + offset, [window[i] for i in positions]
+        offset += len(window)
+
+def load_encoder(model_name, backend="torch", onnx_directory=None, threads=None):
+    """Load a sentence encoder.
+
+    Args:
+        model_name: Sentence-transformers model the vectors must come from
+        backend: One of ENCODER_BACKENDS
+        onnx_directory: Directory written by retrieval.onnx_encoder (onnx backend)
+        threads: Math library threads (default: library default)
+
+    Returns:
+        Object with encode(texts, batch_size=...) and get_sentence_embedding_dimension()
+
+    Raises:
+        ManifestMismatchError: If the ONNX export comes from another model
+    """
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}'. Choose one of: {', '.join(ENCODER_BACKENDS)}")
+
+    if backend == "onnx":
+        from retrieval.manifest import ManifestMismatchError
+        from retrieval.onnx_encoder import ONNXEncoder
+        encoder = ONNXEncoder(onnx_directory, threads=threads)
+        if encoder.model_name != model_name:
+            raise ManifestMismatchError(
+                f"The ONNX model in {onnx_directory} was exported from {encoder.model_name}, "
+                f"not {model_name}. Export it again with: python -m retrieval.onnx_encoder"
+            )
+        return encoder
+
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+def backend_label(backend, onnx_directory=None):
+    """Identify the vectors a backend produces, as recorded in the manifest.
+
+    Int8 and float32 ONNX vectors differ, so the label includes the
+    quantization of the exported model the backend loads by default.
+
+    Returns:
+        "torch", "onnx-int8" or "onnx-fp32"
+    """
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}'. Choose one of: {', '.join(ENCODER_BACKENDS)}")
+    if backend == "torch":
+        return backend
+
+    from retrieval.onnx_encoder import ONNX_CONFIG_FILE
+    config_path = os.path.join(onnx_directory, ONNX_CONFIG_FILE)
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"No ONNX export in {onnx_directory}. "
+                                f"Export it with: python -m retrieval.onnx_encoder")
+    with open(config_path, 'r', encoding='utf-8') as f:
+        quantized = json.load(f)["quantized"]
+    return f"onnx-{'int8' if quantized else 'fp32'}"
+
+THREAD_VARIABLES = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+@contextlib.contextmanager
+def _worker_thread_environment(threads):
+    """Set the math library thread variables while worker processes are spawned.
+
+    The variables are only read when numpy, BLAS and torch load, which in a
+    worker happens while unpickling the initializer, before it runs; spawned
+    workers inherit them from this environment instead.
+    """
+    previous = {variable: os.environ.get(variable) for variable in THREAD_VARIABLES}
+    os.environ.update({variable: str(threads) for variable in THREAD_VARIABLES})
+    try:
+        yield
+    finally:
+        for variable, value in previous.items():
+            if value is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = value
+
+def _init_worker(model_name, threads, backend, onnx_directory):
+    """Load the model in a worker process."""
+    global _worker_model
+    # The thread variables came with the environment (_worker_thread_environment);
+    # load_encoder also caps torch's intra-op threads
+    _worker_model = load_encoder(model_name, backend, onnx_directory, threads=threads)
+
+def _encode_batch(positions, texts):
+    """Encode one batch in a worker process."""
+    embeddings = _worker_model.encode(texts, batch_size=len(texts), show_progress_bar=False)
+    return positions, np.asarray(embeddings, dtype='float32')
+
+class _VectorWriter:
+    """Disk-backed float32 array filled by position as batches arrive.
+
+    The number of texts is not known up front, so the anonymous backing file
+    (removed by the OS when the array is released) grows as needed.
+    """
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.vectors = None
+        self.capacity = 0
+        self.count = 0
+
+    def write(self, positions, embeddings):
+        needed = int(positions.max()) + 1
+        if needed > self.capacity:
+            dimension = embeddings.shape[1]
+            self.capacity = max(needed, 2 * self.capacity, 1024)
+            self.file.truncate(self.capacity * dimension * 4)
+            self.vectors = np.memmap(self.file, dtype='float32', mode='r+', shape=(self.capacity, dimension))
+        self.vectors[positions] = embeddings
+        self.count = max(self.count, needed)
+
+    def result(self):
+        if self.vectors is None:
+            return np.empty((0, 0), dtype='float32')
+        self.vectors.flush()
+        return self.vectors[:self.count]
+
+class _Progress:
+    def __init__(self, total=None, interval=30):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.start_time = time.time()
+        self.last_report = self.start_time
+        self.next_report = 0.1
+
+    def update(self, count):
+        self.done += count
+        now = time.time()
+        rate = self.done / max(now - self.start_time, 1e-9)
+        if self.total and self.done / self.total >= self.next_report:
+            print(f"  {self.done}/{self.total} chunks encoded ({rate:.1f}/s)")
+            self.next_report += 0.1
+        elif not self.total and now - self.last_report >= self.interval:
+            print(f"  {self.done} chunks encoded ({rate:.1f}/s)")
+            self.last_report = now
+
+def encode_texts(texts, model_name, workers=None, threads_per_worker=2, batch_size=32,
+                 min_parallel_batches=4, backend="torch", onnx_directory=None, sort_window=8192,
+                 dimension=0):
+    """Encode texts with a pool of worker processes.
+
+    Args:
+        texts: Iterable of texts to encode; consumed lazily, so it can be a
+            generator over a corpus larger than memory
+        model_name: Sentence-transformers model
+        workers: Worker processes (default: cores / threads_per_worker;
+            1 encodes in this process)
+        threads_per_worker: Math library threads per worker
+        batch_size: Texts per batch
+        min_parallel_batches: Fewer batches than workers times this are
+            encoded in this process, starting workers would cost more
+        backend: One of ENCODER_BACKENDS
+        onnx_directory: Directory of the exported ONNX model (onnx backend)
+        sort_window: Texts read ahead and sorted by length together
+        dimension: Width of the empty array returned when there are no texts;
+            the model is not loaded then
+
+    Returns:
+        float32 array (memory-mapped) of shape (number of texts, dimension),
+        in the order of texts
+    """
+    workers = workers or default_workers(threads_per_worker)
+    windows = _windows(texts, sort_window)
+    first_window = next(windows, [])
+    if not first_window:
+        return np.empty((0, dimension), dtype='float32')
+    batches = _batches(itertools.chain([first_window], windows), batch_size)
+    writer = _VectorWriter()
+    progress = _Progress(len(texts) if hasattr(texts, "__len__") else None)
+
+    # Everything fit in the first window: the exact number of batches is known
+    num_batches = -(-len(first_window) // batch_size)
+    if workers == 1 or (len(first_window) < sort_window and num_batches < workers * min_parallel_batches):
+        model = load_encoder(model_name, backend, onnx_directory)
+        for positions, batch in batches:
+            embeddings = model.encode(batch, batch_size=len(batch), show_progress_bar=False)
+            writer.write(positions, np.asarray(embeddings, dtype='float32'))
+            progress.update(len(positions))
+    else:
+        print(f"Encoding with {workers} worker processes x {threads_per_worker} threads, "
+              f"batches of {batch_size}")
+        # Fresh interpreters: forked copies of a process that already used
+        # torch threads can deadlock
+        context = multiprocessing.get_context("spawn")
+        with _worker_thread_environment(threads_per_worker), \
+                ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                    initargs=(model_name, threads_per_worker, backend, onnx_directory)) as executor:
+            # Keep a couple of batches queued per worker, not the whole corpus
+            pending = set()
+            for positions, batch in batches:
+                pending.add(executor.submit(_encode_batch, positions, batch))
+                if len(pending) >= 2 * workers:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        writer.write(*future.result())
+                        progress.update(len(future.result()[0]))
+            for future in pending:
+                writer.write(*future.result())
+                progress.update(len(future.result()[0]))
+
+    return writer.result()
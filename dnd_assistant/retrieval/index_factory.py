@@ -0,0 +1,280 @@
+"""
+FAISS index construction for the campaign knowledge base.
+Supports brute-force and approximate nearest-neighbour index types so the
+search cost stays low as sourcebooks and session logs are added, and
+compressed storage so large collections fit in the memory of small hosts:
+
+    sq_fp16   vectors stored as float16 (2x smaller than flat)
+    sq_int8   8-bit scalar quantization (4x smaller)
+    binary    1 bit per dimension, Hamming search (32x smaller); the
+              shortlist is re-ranked with float vectors memory-mapped
+              from rerank_vectors.npy, so only those rows are read
+"""
+
+import os
+import math
+
+import numpy as np
+import faiss
+
+# Index types that can be selected when building embeddings
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "sq_fp16", "sq_int8", "binary")
+
+# Similarity measures: raw L2 distance (lower is closer) or cosine similarity
+# (higher is closer), computed as the inner product of L2-normalized vectors
+METRICS = ("l2", "cosine")
+
+# FAISS wants roughly this many training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+# Float vectors used to re-rank the binary index shortlist, one row per chunk ID
+RERANK_VECTORS_FILE = "rerank_vectors.npy"
+
+# The binary index returns this many times more candidates than requested
+DEFAULT_RERANK_FACTOR = 16
+
+def default_nlist(num_vectors):
+    """Number of IVF lists for a corpus, or 0 when it is too small for IVF."""
+    max_lists = num_vectors // MIN_POINTS_PER_CENTROID
+    if max_lists < 1:
+        return 0
+    return max(1, min(int(4 * math.sqrt(num_vectors)), max_lists))
+
+def normalize(embeddings):
+    """Return an L2-normalized float32 copy of a matrix of embeddings."""
+    embeddings = np.array(embeddings, dtype='float32', order='C', copy=True)
+    faiss.normalize_L2(embeddings)
+    return embeddings
+
+def factory_string(index_type, dimension, num_vectors, nlist=None, hnsw_m=32, pq_m=None):
+    """Build the faiss.index_factory description for an index type.
+
+    Args:
+        index_type: One of INDEX_TYPES
+        dimension: Embedding dimension
+        num_vectors: Number of vectors the index will be trained on
+        nlist: Number of IVF lists (default derived from num_vectors)
+        hnsw_m: Number of neighbours per HNSW node
+        pq_m: Number of PQ sub-quantizers (must divide the dimension)
+
+    Returns:
+        Tuple of (factory string, effective index type). The effective type
+        falls back to "flat" when the corpus is too small to train the index.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}'. Choose one of: {', '.join(INDEX_TYPES)}")
+
+    if index_type == "hnsw":
+        return f"IDMap,HNSW{hnsw_m}", index_type
+
+    if index_type == "sq_fp16":
+        return "IDMap,SQfp16", index_type
+
+    if index_type == "sq_int8":
+        return "IDMap,SQ8", index_type
+
+    if index_type == "binary":
+        # Sign bits of a random rotation (SimHash), compared by Hamming distance
+        return "IDMap,LSHr", index_type
+
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = nlist or default_nlist(num_vectors)
+        if nlist < 1:
+            print(f"Not enough vectors ({num_vectors}) to train {index_type}, using flat index.")
+            return "IDMap,Flat", "flat"
+
+        if index_type == "ivf_flat":
+            return f"IVF{nlist},Flat", index_type
+
+        pq_m = pq_m or next(m for m in (16, 8, 4, 2, 1) if dimension % m == 0)
+        if dimension % pq_m != 0:
+            raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dimension}")
+        # 8-bit codes need 256 centroids per sub-quantizer, 4-bit codes need 16
+        if num_vectors >= 256 * MIN_POINTS_PER_CENTROID:
+            nbits = 8
+        elif num_vectors >= 16 * MIN_POINTS_PER_CENTROID:
+            nbits = 4
+        else:
+            print(f"Not enough vectors ({num_vectors}) to train ivf_pq, using ivf_flat index.")
+            return f"IVF{nlist},Flat", "ivf_flat"
+        return f"IVF{nlist},PQ{pq_m}x{nbits}", index_type
+
+    return "IDMap,Flat", index_type
+
+def build_index(embeddings, ids, index_type="flat", nlist=None, hnsw_m=32, pq_m=None,
+                train_sample_size=50000, seed=42, metric="l2"):
+    """Create, train and fill a FAISS index with stable IDs.
+
+    Args:
+        embeddings: float32 array of shape (n, dimension)
+        ids: int64 array with one ID per embedding
+        index_type: One of INDEX_TYPES
+        metric: One of METRICS. With "cosine" the vectors are normalized
+            here and queries must be normalized before searching
+        nlist: Number of IVF lists (IVF types only)
+        hnsw_m: Number of neighbours per HNSW node (HNSW only)
+        pq_m: Number of PQ sub-quantizers (IVF-PQ only)
+        train_sample_size: Maximum number of vectors used to train the index
+        seed: Random seed for the training sample
+
+    Returns:
+        Tuple of (index, effective index type)
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'. Choose one of: {', '.join(METRICS)}")
+    if metric == "cosine":
+        embeddings = normalize(embeddings)
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    num_vectors, dimension = embeddings.shape
+    description, index_type = factory_string(index_type, dimension, num_vectors,
+                                             nlist=nlist, hnsw_m=hnsw_m, pq_m=pq_m)
+
+    # LSH always ranks by Hamming distance, FAISS only accepts it as an L2 index
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "cosine" and index_type != "binary" else faiss.METRIC_L2
+    index = faiss.index_factory(dimension, description, faiss_metric)
+
+    if not index.is_trained:
+        sample = embeddings
+        if num_vectors > train_sample_size:
+            rng = np.random.default_rng(seed)
+            sample = embeddings[rng.choice(num_vectors, train_sample_size, replace=False)]
+        print(f"Training {index_type} index on {len(sample)} vectors...")
+        index.train(sample)
+
+    # IVF indexes map IDs natively, the others are wrapped in IndexIDMap above
+    index.add_with_ids(embeddings, np.asarray(ids, dtype='int64'))
+    return index, index_type
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Apply query-time parameters to an index (ignored when not applicable)."""
+    params = faiss.ParameterSpace()
+    if nprobe is not None and faiss.try_extract_index_ivf(index) is not None:
+        params.set_index_parameter(index, "nprobe", nprobe)
+    if ef_search is not None and "HNSW" in type(_base_index(index)).__name__:
+        params.set_index_parameter(index, "efSearch", ef_search)
+
+def supports_removal(index_type):
+    """Whether vectors can be removed from an index of this type."""
+    return index_type != "hnsw"
+
+def _base_index(index):
+    """Return the index wrapped by an IndexIDMap, if any."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+class RerankedBinaryIndex:
+    """Binary index whose shortlist is re-scored with float vectors.
+
+    Exposes the part of the FAISS index interface CampaignRetriever uses
+    (d, ntotal, search), returning exact cosine similarities or L2
+    distances for the re-ranked results.
+    """
+
+    def __init__(self, index, vectors, metric="l2", rerank_factor=DEFAULT_RERANK_FACTOR):
+        """Wrap a binary index.
+
+        Args:
+            index: FAISS binary ("binary" type) index with chunk IDs
+            vectors: Array (usually memory-mapped) with the float vector of
+                every chunk ID, as stored in the index
+            metric: One of METRICS
+            rerank_factor: Candidates fetched per requested result
+        """
+        self.index = index
+        self.vectors = vectors
+        self.metric = metric
+        self.rerank_factor = rerank_factor
+        self.d = index.d
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    def search(self, queries, k):
+        """Search like faiss.Index.search, re-ranking rerank_factor * k candidates."""
+        queries = np.ascontiguousarray(queries, dtype='float32')
+        _, candidates = self.index.search(queries, k * self.rerank_factor)
+
+        cosine = self.metric == "cosine"
+        scores = np.full((len(queries), k), -np.inf if cosine else np.inf, dtype='float32')
+        indices = np.full((len(queries), k), -1, dtype='int64')
+        for i, query in enumerate(queries):
+            ids = candidates[i][candidates[i] >= 0]
+            if len(ids) == 0:
+                continue
+            # Sorted reads keep the memory-mapped access sequential
+            ids = np.sort(ids)
+            vectors = np.asarray(self.vectors[ids], dtype='float32')
+            if cosine:
+                exact = vectors @ query
+                order = np.argsort(-exact)[:k]
+            else:
+                exact = ((vectors - query) ** 2).sum(axis=1)
+                order = np.argsort(exact)[:k]
+            scores[i, :len(order)] = exact[order]
+            indices[i, :len(order)] = ids[order]
+        return scores, indices
+
+def vector_lookup(index):
+    """Return a function fetching the stored vectors of chunk IDs.
+
+    Used to score chunks the index search did not return (e.g. BM25-only
+    hits in hybrid mode). The vectors are the ones the index holds:
+    normalized for cosine indexes and approximate for the quantized types.
+
+    Args:
+        index: FAISS index with chunk IDs, or a RerankedBinaryIndex
+
+    Returns:
+        Function mapping a list of chunk IDs to a float32 array of vectors
+    """
+    if isinstance(index, RerankedBinaryIndex):
+        return lambda ids: np.asarray(index.vectors[np.asarray(ids, dtype='int64')], dtype='float32')
+
+    if isinstance(index, faiss.IndexIDMap):
+        # IndexIDMap can't reconstruct by ID, the wrapped index can by position
+        inner = _base_index(index)
+        id_map = faiss.vector_to_array(index.id_map)
+        order = np.argsort(id_map)
+        sorted_ids = id_map[order]
+
+        def lookup(ids):
+            positions = order[np.searchsorted(sorted_ids, np.asarray(ids, dtype='int64'))]
+            return np.asarray(inner.reconstruct_batch(positions), dtype='float32')
+        return lookup
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        # A hash table works with the arbitrary IDs left by removals
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return lambda ids: np.vstack([index.reconstruct(int(chunk_id)) for chunk_id in ids]).astype('float32')
+
+def write_rerank_vectors(models_directory, ids, vectors, slots, replace=False):
+    """Store float16 re-ranking vectors by chunk ID.
+
+    Args:
+        models_directory: Directory of the index
+        ids: Chunk IDs of the vectors
+        vectors: Vectors as added to the index (normalized for cosine)
+        slots: Number of chunk ID slots (highest ID + 1)
+        replace: Start from scratch instead of updating the existing file
+    """
+    path = os.path.join(models_directory, RERANK_VECTORS_FILE)
+    vectors = np.asarray(vectors, dtype='float16')
+    table = np.zeros((slots, vectors.shape[1]), dtype='float16')
+    if not replace and os.path.exists(path):
+        previous = np.load(path, mmap_mode='r')
+        rows = min(len(previous), slots)
+        table[:rows] = previous[:rows]
+        del previous
+    if len(ids):
+        table[np.asarray(ids, dtype='int64')] = vectors
+    # Replace instead of overwriting, running retrievers may have the file mapped
+    with open(path + ".tmp", 'wb') as f:
+        np.save(f, table)
+    os.replace(path + ".tmp", path)
+
+def load_rerank_vectors(models_directory):
+    """Memory-map the re-ranking vectors written by write_rerank_vectors."""
+    return np.load(os.path.join(models_directory, RERANK_VECTORS_FILE), mmap_mode='r')
@@ -0,0 +1,112 @@
+"""
+Metadata describing how the files in models/ were built.
+Written by create_embeddings.py and read by CampaignRetriever, which refuses
+to search an index whose vectors don't match the query encoder.
+
+Fields:
+    embedding_model        sentence-transformers model that encoded the chunks
+    encoder_backend        "torch", "onnx-int8" or "onnx-fp32" (ONNX export of
+                           the same model, see encoding.backend_label)
+    dimension              embedding dimension
+    normalized             whether vectors are L2-normalized
+    index_type             FAISS index type that was built
+    requested_index_type   index type asked for (small corpora may fall back)
+    chunk_count            number of vectors in the index
+    build_hash             hash of the model, the indexed chunk contents and
+                           the ID each chunk was assigned
+    metric                 "cosine" or "l2"
+    nprobe, ef_search      query-time search parameters
+    rerank_factor          candidates re-ranked per result (binary index)
+"""
+
+import os
+import json
+import hashlib
+
+MANIFEST_FILE = "manifest.json"
+
+# Model used when models/ was built before manifests existed
+DEFAULT_EMBEDDING_MODEL = "neuralmind/bert-base-portuguese-cased"
+
+class ManifestMismatchError(ValueError):
+    """The files in models/ don't match each other or the query encoder."""
+
+def load_manifest(models_directory):
+    """Load the build manifest, or None if the directory has none."""
+    path = os.path.join(models_directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(models_directory, manifest):
+    """Write the build manifest."""
+    path = os.path.join(models_directory, MANIFEST_FILE)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+def build_hash(model_name, hash_to_id):
+    """Hash identifying a build: the model and which chunk content has which ID.
+
+    The IDs are part of the hash because caches store chunk IDs: a full
+    rebuild renumbers the chunks, and must invalidate them even when the
+    contents are unchanged.
+
+    Args:
+        model_name: Embedding model the index was built with
+        hash_to_id: Mapping of chunk content hash to its ID in the index
+    """
+    digest = hashlib.sha1(model_name.encode('utf-8'))
+    for content_hash, chunk_id in sorted(hash_to_id.items()):
+        digest.update(b"\0" + content_hash.encode('ascii') + b":" + str(int(chunk_id)).encode('ascii'))
+    return digest.hexdigest()
+
+def manifest_fingerprint(manifest):
+    """Identify the index a manifest describes, for caches keyed by chunk IDs.
+
+    The build hash when the manifest has one, otherwise a hash of the whole
+    manifest (or None for models built before manifests existed).
+    """
+    if not manifest:
+        return None
+    if manifest.get("build_hash"):
+        return manifest["build_hash"]
+    text = json.dumps(manifest, sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def validate_manifest(manifest, index, chunk_count):
+    """Check that a loaded index and chunk store match their manifest.
+
+    Args:
+        manifest: Loaded manifest
+        index: Loaded FAISS index
+        chunk_count: Number of chunks in the chunk store
+
+    Raises:
+        ManifestMismatchError: Describing the first mismatch found
+    """
+    rebuild = "Rebuild the index with: python create_embeddings.py --full"
+    if manifest.get("dimension") != index.d:
+        raise ManifestMismatchError(
+            f"The FAISS index has dimension {index.d} but the manifest says "
+            f"{manifest.get('dimension')} ({manifest['embedding_model']}). {rebuild}"
+        )
+    if manifest.get("chunk_count") is not None:
+        if index.ntotal != manifest["chunk_count"] or chunk_count != manifest["chunk_count"]:
+            raise ManifestMismatchError(
+                f"The manifest lists {manifest['chunk_count']} chunks but the FAISS index holds "
+                f"{index.ntotal} vectors and the chunk store {chunk_count} chunks. {rebuild}"
+            )
+
+def check_model_dimension(manifest, model_dimension):
+    """Check the dimension of the query encoder against the manifest.
+
+    Raises:
+        ManifestMismatchError: If the encoder produces vectors of another size
+    """
+    if model_dimension is not None and model_dimension != manifest["dimension"]:
+        raise ManifestMismatchError(
+            f"{manifest['embedding_model']} produces {model_dimension}-dimensional vectors "
+            f"but the index holds {manifest['dimension']}-dimensional ones."
+        )
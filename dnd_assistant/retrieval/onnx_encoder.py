@@ -0,0 +1,178 @@
+"""
+Optional ONNX Runtime backend for the embedding model.
+The transformer is exported once to ONNX and its weights quantized to int8
+(dynamic quantization), then run by ONNX Runtime without PyTorch. ONNXEncoder
+has the encode interface of SentenceTransformer used by the rest of the code.
+
+Export the model used by the index (run from the dnd_assistant directory):
+
+    python -m retrieval.onnx_encoder --output models/onnx
+
+Requires onnxruntime (and onnx plus PyTorch for the export only).
+"""
+
+import os
+import json
+import argparse
+
+import numpy as np
+
+ONNX_DIRECTORY = "onnx"
+ONNX_CONFIG_FILE = "onnx_config.json"
+FLOAT_MODEL_FILE = "model.onnx"
+INT8_MODEL_FILE = "model_int8.onnx"
+
+class ONNXEncoder:
+    """Sentence encoder running an exported transformer with ONNX Runtime."""
+
+    def __init__(self, onnx_directory, quantized=None, threads=None):
+        """Load an exported model.
+
+        Args:
+            onnx_directory: Directory written by export_onnx
+            quantized: Use the int8 model instead of the float32 one
+                (default: int8 when it was exported)
+            threads: ONNX Runtime intra-op threads (default: all cores)
+        """
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(onnx_directory, ONNX_CONFIG_FILE), 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+        self.model_name = self.config["model_name"]
+        self.quantized = self.config["quantized"] if quantized is None else quantized
+        self.tokenizer = AutoTokenizer.from_pretrained(onnx_directory)
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = INT8_MODEL_FILE if self.quantized else FLOAT_MODEL_FILE
+        self.session = onnxruntime.InferenceSession(os.path.join(onnx_directory, model_file), options,
+                                                    providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dimension"]
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+        """Encode texts like SentenceTransformer.encode.
+
+        Returns:
+            float32 array of shape (len(texts), dimension)
+        """
+        if isinstance(texts, str):
+            return self.encode([texts], batch_size)[0]
+
+        embeddings = np.empty((len(texts), self.config["dimension"]), dtype='float32')
+        # Similar lengths in a batch keep the padding small
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        for start in range(0, len(texts), batch_size):
+            positions = order[start:start + batch_size]
+            embeddings[positions] = self._encode_batch([texts[i] for i in positions])
+        return embeddings
+
+    def _encode_batch(self, texts):
+        inputs = self.tokenizer(texts, padding=True, truncation=True,
+                                max_length=self.config["max_seq_length"], return_tensors="np")
+        feed = {name: np.asarray(values, dtype='int64') for name, values in inputs.items()
+                if name in self.input_names}
+        token_embeddings = self.session.run(None, feed)[0]
+        mask = inputs["attention_mask"].astype('float32')[:, :, None]
+
+        if self.config["pooling"] == "cls":
+            pooled = token_embeddings[:, 0]
+        elif self.config["pooling"] == "max":
+            pooled = np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+        else:
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.config["normalize"]:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype('float32')
+
+def _pooling_mode(model):
+    """Pooling mode of a SentenceTransformer ("mean", "cls" or "max")."""
+    for module in model:
+        if hasattr(module, "pooling_mode_cls_token"):
+            if module.pooling_mode_cls_token:
+                return "cls"
+            if module.pooling_mode_max_tokens:
+                return "max"
+    return "mean"
+
+def export_onnx(model_name, output_directory, quantize=True):
+    """Export a sentence-transformers model to ONNX and quantize it.
+
+    Args:
+        model_name: Sentence-transformers model (the one in models/manifest.json)
+        output_directory: Directory for the ONNX files, tokenizer and config
+        quantize: Also write the dynamically int8-quantized model
+
+    Returns:
+        Path of the exported directory
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_directory, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+
+    sample = tokenizer(["Quem é o mago de Valória?"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+    class TokenEmbeddings(torch.nn.Module):
+        """Only the last hidden state, pooling is done by ONNXEncoder."""
+
+        def __init__(self):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, *inputs):
+            return self.transformer(**dict(zip(input_names, inputs))).last_hidden_state
+
+    float_path = os.path.join(output_directory, FLOAT_MODEL_FILE)
+    print(f"Exporting {model_name} to {float_path}...")
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(), tuple(sample[name] for name in input_names), float_path,
+            input_names=input_names, output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes, opset_version=14
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        print("Quantizing weights to int8...")
+        quantize_dynamic(float_path, os.path.join(output_directory, INT8_MODEL_FILE),
+                         weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(output_directory)
+    config = {
+        "model_name": model_name,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "pooling": _pooling_mode(model),
+        "normalize": any(type(module).__name__ == "Normalize" for module in model),
+        "max_seq_length": model.max_seq_length,
+        "quantized": quantize
+    }
+    with open(os.path.join(output_directory, ONNX_CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    print(f"ONNX model saved to {output_directory}")
+    return output_directory
+
+if __name__ == "__main__":
+    from retrieval.manifest import DEFAULT_EMBEDDING_MODEL, load_manifest
+
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX (int8).")
+    parser.add_argument("--models-directory", default="models", help="Directory with the manifest")
+    parser.add_argument("--output", default=None, help="Output directory (default: <models>/onnx)")
+    parser.add_argument("--no-quantize", action="store_true", help="Only export the float32 model")
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.models_directory) or {}
+    export_onnx(manifest.get("embedding_model", DEFAULT_EMBEDDING_MODEL),
+                args.output or os.path.join(args.models_directory, ONNX_DIRECTORY),
+                quantize=not args.no_quantize)
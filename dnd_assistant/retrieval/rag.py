@@ -1,53 +1,307 @@
 import os
-import pickle
-import json
+import threading
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
-from transformers import pipeline
+
+from retrieval.cache import AnswerCache, QueryEmbeddingCache, SemanticQueryCache, answer_key
+from retrieval.context import ContextPacker
+from retrieval.encoding import backend_label, load_encoder
+from retrieval.chunk_store import CHUNK_STORE_FILE, ChunkStore, migrate_legacy_files
+from retrieval.index_factory import (DEFAULT_RERANK_FACTOR, RerankedBinaryIndex, load_rerank_vectors, normalize,
+                                     set_search_params, vector_lookup)
+from retrieval.manifest import (DEFAULT_EMBEDDING_MODEL, ManifestMismatchError, check_model_dimension,
+                                load_manifest, manifest_fingerprint, validate_manifest)
+from retrieval.onnx_encoder import ONNX_DIRECTORY
+from retrieval.sparse import SPARSE_INDEX_DIRECTORY, BM25Index, reciprocal_rank_fusion
+
+ANSWER_CACHE_FILE = "answer_cache.json"
+
+# Text generation model, and the one used when it can't be loaded
+GENERATOR_MODEL = "pierreguillou/gpt2-small-portuguese"
+FALLBACK_GENERATOR_MODEL = "gpt2"
+GENERATION_MAX_LENGTH = 512
 
 class CampaignRetriever:
-    def __init__(self, models_directory="models", top_k=5):
+    def __init__(self, models_directory="models", top_k=5, query_cache_size=1024,
+                 persist_query_cache=True, nprobe=None, ef_search=None, hybrid=True,
+                 hybrid_candidates=4, score_threshold=None, encoder_backend=None,
+                 semantic_cache_size=256, semantic_cache_threshold=0.95):
         """Initialize the campaign knowledge retriever.
         
         Args:
             models_directory: Directory containing the FAISS index and chunks
             top_k: Number of relevant chunks to retrieve
+            query_cache_size: Number of query embeddings kept in memory
+            persist_query_cache: Whether to keep query embeddings on disk between runs
+            nprobe: IVF lists visited per query (overrides the value in the manifest)
+            ef_search: HNSW search depth per query (overrides the value in the manifest)
+            hybrid: Fuse dense results with the BM25 index, when one was built
+            hybrid_candidates: In hybrid mode, each index returns top_k times this
+                many candidates before fusion
+            score_threshold: Minimum cosine similarity of the returned chunks
+                (cosine indexes only); fewer than top_k chunks are returned
+                when few are similar enough. In hybrid mode it applies to the
+                fused results, BM25 matches included
+            encoder_backend: "torch" (sentence-transformers) or "onnx" (the
+                model exported by retrieval.onnx_encoder to models/onnx).
+                Defaults to the backend the index was built with; another
+                one raises ManifestMismatchError
+            semantic_cache_size: Number of recent queries whose results are
+                reused for near-duplicate queries that name the same campaign
+                names (0 disables the cache)
+            semantic_cache_threshold: Minimum cosine similarity between two
+                queries for the results of one to be reused for the other
         """
         self.top_k = top_k
         self.models_directory = models_directory
         
         # Check if models exist
         faiss_path = os.path.join(models_directory, "faiss_index.bin")
-        chunks_path = os.path.join(models_directory, "chunks.pkl")
-        index_to_chunk_path = os.path.join(models_directory, "index_to_chunk.json")
+        chunks_path = os.path.join(models_directory, CHUNK_STORE_FILE)
         
-        if not (os.path.exists(faiss_path) and 
-                os.path.exists(chunks_path) and 
-                os.path.exists(index_to_chunk_path)):
+        # Models built by older versions only have index_to_chunk.json
+        if os.path.exists(faiss_path) and not os.path.exists(chunks_path):
+            migrate_legacy_files(models_directory)
+        
+        if not (os.path.exists(faiss_path) and os.path.exists(chunks_path)):
             raise FileNotFoundError(
                 "Model files not found. Please run process_data.py and create_embeddings.py first."
             )
         
-        # Load the embedding model
-        print("Loading embedding model...")
-        self.embedding_model = SentenceTransformer("pierreguillou/gpt2-small-portuguese")
-        
         # Load FAISS index
         print("Loading FAISS index...")
         self.index = faiss.read_index(faiss_path)
         
-        # Load chunks
-        print("Loading chunks...")
-        with open(chunks_path, 'rb') as f:
-            self.chunks = pickle.load(f)
+        # Models built before manifests existed always used the default model
+        manifest = load_manifest(models_directory) or {"index_type": "flat", "dimension": self.index.d}
+        manifest.setdefault("embedding_model", DEFAULT_EMBEDDING_MODEL)
+        manifest.setdefault("normalized", False)
+        manifest.setdefault("metric", "cosine" if manifest["normalized"] else "l2")
+        self.manifest = manifest
+        self.index_type = manifest["index_type"]
+        self.metric = manifest["metric"]
+        
+        # L2 distances are not comparable across queries, there is no sensible threshold
+        if score_threshold is not None and self.metric != "cosine":
+            print(f"score_threshold ignored: the index uses {self.metric} distances, not cosine similarities.")
+            score_threshold = None
+        self.score_threshold = score_threshold
+        
+        # Apply the query-time parameters the index was built with
+        set_search_params(
+            self.index,
+            nprobe=nprobe if nprobe is not None else manifest.get("nprobe"),
+            ef_search=ef_search if ef_search is not None else manifest.get("ef_search")
+        )
+        
+        # Binary codes only give a shortlist, re-ranked with the float vectors
+        if self.index_type == "binary":
+            self.index = RerankedBinaryIndex(
+                self.index, load_rerank_vectors(models_directory), self.metric,
+                rerank_factor=manifest.get("rerank_factor") or DEFAULT_RERANK_FACTOR
+            )
+        
+        # Queries must be encoded by the model and backend that encoded the
+        # chunks. The model is loaded on first use (or by warm_up)
+        self.embedding_model_name = manifest["embedding_model"]
+        index_backend = manifest.get("encoder_backend", "torch")
+        if encoder_backend is None:
+            encoder_backend = index_backend.split("-")[0]
+        self.encoder_backend = encoder_backend
+        self.encoder_label = backend_label(encoder_backend, os.path.join(models_directory, ONNX_DIRECTORY))
+        if self.encoder_label != index_backend:
+            raise ManifestMismatchError(
+                f"The index was encoded with the {index_backend} backend, queries would use {self.encoder_label}. "
+                f"Rebuild it with: python create_embeddings.py --full --encoder-backend {encoder_backend}"
+            )
+        self._embedding_model = None
+        self._model_lock = threading.Lock()
+        
+        # Cache of query embeddings, so repeated questions skip the model.
+        # ONNX vectors differ slightly (int8 more than fp32), they are cached separately
+        cache_directory = os.path.join(models_directory, "query_cache") if persist_query_cache else None
+        cache_model = self.embedding_model_name if self.encoder_label == "torch" else \
+            f"{self.embedding_model_name}+{self.encoder_label}"
+        self.query_cache = QueryEmbeddingCache(
+            cache_model,
+            max_size=query_cache_size,
+            cache_directory=cache_directory
+        )
+        
+        # Memory-map the chunk store, texts are read on lookup
+        self.chunk_store = ChunkStore(chunks_path)
+        
+        # Refuse to search files that don't belong together
+        validate_manifest(manifest, self.index, len(self.chunk_store))
+        
+        # Keyword index for exact names, fused with the dense results
+        self.hybrid_candidates = hybrid_candidates
+        sparse_index = BM25Index.load(os.path.join(models_directory, SPARSE_INDEX_DIRECTORY))
+        self.sparse_index = sparse_index if hybrid else None
+        
+        # Results of recent queries, reused when a player rephrases a question.
+        # Only queries naming the same campaign names match, so the cache
+        # needs the names collected with the BM25 index
+        self.semantic_cache = None
+        if semantic_cache_size:
+            if sparse_index is not None and sparse_index.names:
+                self.semantic_cache = SemanticQueryCache(sparse_index.names, max_size=semantic_cache_size,
+                                                         threshold=semantic_cache_threshold)
+            else:
+                print("No campaign names in the BM25 index, the semantic query cache is disabled. "
+                      "Rebuild the index to enable it.")
+        # Stored vectors, to score BM25-only hits; set up on first use
+        self._vector_lookup = None
+        self._vector_lookup_lock = threading.Lock()
+        
+        print(f"Loaded {len(self.chunk_store)} chunks and {self.index_type} FAISS index from {models_directory}")
+    
+    @property
+    def embedding_model(self):
+        """The query encoder, loaded on first access."""
+        if self._embedding_model is None:
+            with self._model_lock:
+                if self._embedding_model is None:
+                    print("Loading embedding model...")
+                    model = load_encoder(self.embedding_model_name, self.encoder_backend,
+                                         os.path.join(self.models_directory, ONNX_DIRECTORY))
+                    check_model_dimension(self.manifest, model.get_sentence_embedding_dimension())
+                    self._embedding_model = model
+        return self._embedding_model
+    
+    def warm_up(self):
+        """Load the embedding model now instead of on the first query."""
+        return self.embedding_model
+    
+    def encode_query(self, query):
+        """Return the embedding of a query, using the cache when possible.
+        
+        Args:
+            query: User query string
+            
+        Returns:
+            float32 numpy vector
+        """
+        return self.encode_queries([query])[0]
+    
+    def encode_queries(self, queries, batch_size=32):
+        """Return the embeddings of several queries as one float32 matrix.
+        
+        Cached queries are looked up, the rest are encoded in a single batched call.
+        
+        Args:
+            queries: List of query strings
+            batch_size: Batch size used by the embedding model
+            
+        Returns:
+            numpy array of shape (len(queries), dimension)
+        """
+        embeddings = [self.query_cache.get(query) for query in queries]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        
+        if missing:
+            encoded = self.embedding_model.encode([queries[i] for i in missing], batch_size=batch_size)
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = embedding.astype('float32')
+                self.query_cache.put(queries[i], embeddings[i])
         
-        # Load index to chunk mapping
-        print("Loading index mapping...")
-        with open(index_to_chunk_path, 'r', encoding='utf-8') as f:
-            self.index_to_chunk = json.load(f)
+        return np.vstack(embeddings).astype('float32')
+    
+    def _search(self, queries, query_embeddings, top_k):
+        """Search the dense index, and the sparse one in hybrid mode.
+        
+        "score" is always the dense score of the chunk (cosine similarity or
+        L2 distance), so it means the same with and without hybrid search.
+        Hybrid hits also carry "rrf_score", the value they were ranked by.
         
-        print(f"Loaded {len(self.chunks)} chunks and FAISS index from {models_directory}")
+        Returns:
+            For each query, a list of (chunk ID, scores dictionary) pairs, best first
+        """
+        if query_embeddings.shape[1] != self.index.d:
+            raise ManifestMismatchError(
+                f"Query embeddings have dimension {query_embeddings.shape[1]}, "
+                f"the FAISS index expects {self.index.d}"
+            )
+        
+        # Cosine indexes hold normalized vectors, queries must be normalized too
+        if self.manifest["normalized"]:
+            query_embeddings = normalize(query_embeddings)
+        
+        hybrid = self.sparse_index is not None
+        candidates = top_k * self.hybrid_candidates if hybrid else top_k
+        scores, indices = self.index.search(query_embeddings, candidates)
+        
+        threshold = self.score_threshold
+        results = []
+        for i, query in enumerate(queries):
+            dense_hits = [(int(idx), float(score)) for idx, score in zip(indices[i], scores[i]) if idx >= 0]
+            if hybrid:
+                fused = reciprocal_rank_fusion(dense_hits, self.sparse_index.search(query, candidates))
+                hits = self._with_dense_scores(fused, query_embeddings[i])
+            else:
+                hits = [(idx, {"score": score}) for idx, score in dense_hits]
+            if threshold is not None:
+                hits = [(idx, hit_scores) for idx, hit_scores in hits if hit_scores["score"] >= threshold]
+            results.append(hits[:top_k])
+        return results
+    
+    def _with_dense_scores(self, fused_hits, query_embedding):
+        """Set "score" of fused hits to their dense score.
+        
+        Chunks only the BM25 index found are scored against their vector in
+        the dense index.
+        """
+        missing = [idx for idx, hit_scores in fused_hits if hit_scores["dense_score"] is None]
+        computed = {}
+        if missing:
+            if self._vector_lookup is None:
+                with self._vector_lookup_lock:
+                    if self._vector_lookup is None:
+                        self._vector_lookup = vector_lookup(self.index)
+            vectors = self._vector_lookup(missing)
+            if self.metric == "cosine":
+                values = vectors @ query_embedding
+            else:
+                values = ((vectors - query_embedding) ** 2).sum(axis=1)
+            computed = dict(zip(missing, values.tolist()))
+        
+        for idx, hit_scores in fused_hits:
+            dense_score = hit_scores["dense_score"]
+            hit_scores["score"] = dense_score if dense_score is not None else computed[idx]
+        return fused_hits
+    
+    def _search_cached(self, queries, query_embeddings, top_k):
+        """_search, reusing the hits of near-duplicate recent queries."""
+        if self.semantic_cache is None:
+            return self._search(queries, query_embeddings, top_k)
+        
+        results = [self.semantic_cache.get(query, embedding, top_k)
+                   for query, embedding in zip(queries, query_embeddings)]
+        missing = [i for i, hits in enumerate(results) if hits is None]
+        if missing:
+            searched = self._search([queries[i] for i in missing], query_embeddings[missing], top_k)
+            for i, hits in zip(missing, searched):
+                self.semantic_cache.put(queries[i], query_embeddings[i], top_k, hits)
+                results[i] = hits
+        return results
+    
+    def canonical_query(self, query):
+        """The earlier query whose results were reused for this one, or the query itself."""
+        if self.semantic_cache is None:
+            return query
+        return self.semantic_cache.canonical_query(query)
+    
+    def _chunks_for_hits(self, hits, return_scores):
+        """Turn search hits into chunk dictionaries."""
+        results = []
+        for idx, scores in hits:
+            chunk = self.chunk_store.get(idx)
+            if chunk is not None:
+                chunk["id"] = idx
+                if return_scores:
+                    chunk.update(scores)
+                results.append(chunk)
+        return results
     
     def retrieve(self, query, return_scores=False):
         """Retrieve relevant chunks based on the query.
@@ -57,45 +311,65 @@ class CampaignRetriever:
             return_scores: Whether to return similarity scores
             
         Returns:
-            List of relevant chunks with their text and metadata
+            List of relevant chunks with their text, source and index ID
         """
         # Generate embedding for the query
-        query_embedding = self.embedding_model.encode([query])[0].reshape(1, -1).astype('float32')
-
-        # Print the dimensionality of the query embedding and the FAISS index
-        print(f"Query embedding dimensionality: {query_embedding.shape[1]}")
-        print(f"FAISS index dimensionality: {self.index.d}")
+        query_embedding = self.encode_query(query).reshape(1, -1)
         
-        # Search the FAISS index
-        scores, indices = self.index.search(query_embedding, self.top_k)
+        # Search the FAISS index (and the BM25 index in hybrid mode)
+        hits = self._search_cached([query], query_embedding, self.top_k)[0]
         
         # Get the actual chunks
-        results = []
-        for i, idx in enumerate(indices[0]):
-            idx_str = str(int(idx))  # Convert numpy int to string
-            if idx_str in self.index_to_chunk:
-                chunk = self.index_to_chunk[idx_str]
-                if return_scores:
-                    results.append({
-                        "text": chunk["text"],
-                        "source": chunk["source"],
-                        "score": float(scores[0][i])
-                    })
-                else:
-                    results.append({
-                        "text": chunk["text"],
-                        "source": chunk["source"]
-                    })
+        return self._chunks_for_hits(hits, return_scores)
+    
+    def retrieve_many(self, queries, top_k=None, return_scores=False):
+        """Retrieve relevant chunks for several queries at once.
+        
+        All queries are encoded in one batch and the queries asking for the
+        same number of chunks are searched with a single matrix search, which
+        is much faster than calling retrieve in a loop. Each query gets the
+        same chunks as retrieve with its top_k: in hybrid mode the candidate
+        pool grows with top_k, so a larger search cut down would fuse
+        differently.
+        
+        Args:
+            queries: List of user query strings
+            top_k: Number of chunks per query (defaults to self.top_k), or a
+                list with one number per query
+            return_scores: Whether to return similarity scores
+            
+        Returns:
+            List with one list of retrieved chunks per query
+        """
+        if not queries:
+            return []
         
+        queries = list(queries)
+        top_ks = list(top_k) if isinstance(top_k, (list, tuple)) else [top_k or self.top_k] * len(queries)
+        query_embeddings = self.encode_queries(queries)
+        
+        results = [None] * len(queries)
+        for k in sorted(set(top_ks)):
+            group = [i for i, query_top_k in enumerate(top_ks) if query_top_k == k]
+            hits = self._search_cached([queries[i] for i in group], query_embeddings[group], k)
+            for i, query_hits in zip(group, hits):
+                results[i] = self._chunks_for_hits(query_hits, return_scores)
         return results
 
 class CampaignAssistant:
-    def __init__(self, retriever=None, models_directory="models"):
+    def __init__(self, retriever=None, models_directory="models", context_token_budget=256,
+                 answer_cache_size=256, answer_cache_ttl=24 * 3600, persist_answer_cache=True):
         """Initialize the Campaign Assistant with RAG capabilities.
         
         Args:
             retriever: Instance of CampaignRetriever or None to create a new one
             models_directory: Directory for models
+            context_token_budget: Maximum number of context tokens in the prompt
+                (the generator is limited to 512 tokens, prompt and answer included)
+            answer_cache_size: Number of generated answers cached (0 disables the cache)
+            answer_cache_ttl: Seconds a cached answer stays valid, or None for no limit
+            persist_answer_cache: Keep the cached answers in models/answer_cache.json
+                between runs
         """
         # Initialize retriever
         if retriever is None:
@@ -107,33 +381,97 @@ class CampaignAssistant:
         else:
             self.retriever = retriever
         
-        # Initialize text generation model - using a small model that can run locally
+        # Selects the context sentences that fit the prompt
+        self.context_packer = ContextPacker(max_tokens=context_token_budget)
+        
+        # The text generation model is loaded on first use (or by warm_up)
+        self._generator = None
+        self._generator_lock = threading.Lock()
+        
+        # Answers already generated for the same question and the same chunks.
+        # Chunk IDs are only meaningful for the index that was loaded, so the
+        # cache belongs to its manifest; answers saved for another build are
+        # dropped here, once, when the cache file is loaded
+        self.answer_cache = None
+        if answer_cache_size and self.retriever is not None:
+            cache_path = os.path.join(self.retriever.models_directory, ANSWER_CACHE_FILE) \
+                if persist_answer_cache else None
+            self.answer_cache = AnswerCache(
+                manifest_fingerprint(self.retriever.manifest),
+                max_size=answer_cache_size,
+                ttl=answer_cache_ttl,
+                cache_path=cache_path
+            )
+    
+    @property
+    def generator(self):
+        """The text generation pipeline, loaded on first access."""
+        if self._generator is None:
+            with self._generator_lock:
+                if self._generator is None:
+                    self._generator = self._load_generator()
+        return self._generator
+    
+    def _load_generator(self):
+        """Load a small text generation model that can run locally."""
+        from transformers import pipeline
+        
         print("Loading text generation model... (this might take a moment)")
         # Inicializar com modelo português, se disponível
         try:
-            self.generator = pipeline(
+            generator = pipeline(
                 "text-generation",
-                model="pierreguillou/gpt2-small-portuguese",
-                max_length=512,
+                model=GENERATOR_MODEL,
+                max_length=GENERATION_MAX_LENGTH,
                 truncation=True
             )
             print("Modelo PT-BR carregado com sucesso!")
         except:
             # Fallback para o modelo padrão
             print("Modelo PT-BR não disponível, usando modelo padrão.")
-            self.generator = pipeline(
+            generator = pipeline(
                 "text-generation",
-                model="gpt2",
-                max_length=512
+                model=FALLBACK_GENERATOR_MODEL,
+                max_length=GENERATION_MAX_LENGTH
             )
+        
+        # GPT-2 has no padding token; batched generation (answer_many) pads
+        # prompts on the left with the end-of-text token
+        if generator.tokenizer.pad_token is None:
+            generator.tokenizer.pad_token = generator.tokenizer.eos_token
+        generator.tokenizer.padding_side = "left"
+        return generator
     
-    def answer_query(self, query, include_context=False, include_sources=True):
+    def warm_up(self, background=True):
+        """Load the models ahead of the first query.
+        
+        Args:
+            background: Load in a daemon thread so the caller can keep going;
+                a query arriving before loading finishes waits for it
+                
+        Returns:
+            The loading thread, or None when loading synchronously
+        """
+        def load():
+            if self.retriever is not None:
+                self.retriever.warm_up()
+            self.generator
+        
+        if not background:
+            load()
+            return None
+        thread = threading.Thread(target=load, name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
+    
+    def answer_query(self, query, include_context=False, include_sources=True, on_token=None):
         """Answer a campaign related query using RAG.
         
         Args:
             query: User query string
             include_context: Whether to include retrieved context in response
             include_sources: Whether to include source references
+            on_token: Optional callback receiving the answer text as it is generated
             
         Returns:
             Dictionary with answer and optional context/sources
@@ -148,6 +486,126 @@ class CampaignAssistant:
         # Retrieve relevant chunks
         retrieved_chunks = self.retriever.retrieve(query, return_scores=True)
         
+        return self.answer_from_chunks(query, retrieved_chunks,
+                                       include_context=include_context,
+                                       include_sources=include_sources,
+                                       on_token=on_token)
+    
+    def _answer_key(self, query, retrieved_chunks):
+        """Answer cache key of a query and its chunks, or None if it can't be cached.
+        
+        The key names the model that generates the answer, which is only known
+        once the generator has loaded (it may fall back to another model), so
+        there is no key before that.
+        """
+        if self.answer_cache is None or self._generator is None \
+                or any(chunk.get("id") is None for chunk in retrieved_chunks):
+            return None
+        
+        model_name = self._generator.model.name_or_path
+        generation_params = {
+            "max_length": GENERATION_MAX_LENGTH,
+            "context_token_budget": self.context_packer.max_tokens,
+            "prompt": self.build_prompt("{query}", "{context}")
+        }
+        # A rephrased question that reused another's chunks shares its answer
+        return answer_key(self.retriever.canonical_query(query), [chunk["id"] for chunk in retrieved_chunks],
+                          model_name, generation_params)
+    
+    def _cache_answer(self, key, answer, packed):
+        """Remember a generated answer and the context accounting it came with."""
+        if key is None:
+            return
+        self.answer_cache.put(key, {
+            "answer": answer,
+            "packed": {name: packed[name] for name in ("tokens_used", "tokens_dropped", "duplicate_tokens")}
+        })
+    
+    def _cached_response(self, key, retrieved_chunks, include_context, include_sources):
+        """Response built from a cached answer, or None on a miss."""
+        cached = self.answer_cache.get(key) if key is not None else None
+        if cached is None:
+            return None
+        response = self._build_response(cached["answer"], cached["packed"], retrieved_chunks,
+                                        include_context, include_sources)
+        response["cached"] = True
+        return response
+    
+    def pack_context(self, query, retrieved_chunks):
+        """Pack the retrieved chunks into the context token budget.
+        
+        Returns:
+            Output of ContextPacker.pack (text plus token accounting)
+        """
+        tokenizer = self.generator.tokenizer if self.generator else None
+        return self.context_packer.pack(query, retrieved_chunks, tokenizer=tokenizer)
+    
+    def build_prompt(self, query, context_text):
+        """Build the generation prompt from the query and packed context."""
+        return f"Answer about a D&D campaign:\nQuestion: {query}\nContext: {context_text}\nAnswer:"
+    
+    def stream_answer(self, query, retrieved_chunks):
+        """Generate an answer, yielding text pieces as the model produces them.
+        
+        Generation runs in a background thread feeding a TextIteratorStreamer,
+        so the first words can be shown long before the answer is complete.
+        Only newly generated text is yielded, never the prompt.
+        
+        Args:
+            query: User query string
+            retrieved_chunks: Chunks returned by CampaignRetriever.retrieve
+            
+        Yields:
+            Decoded text pieces
+        """
+        packed = self.pack_context(query, retrieved_chunks)
+        yield from self._stream_prompt(self.build_prompt(query, packed["text"]))
+    
+    def _stream_prompt(self, prompt):
+        """Yield the text generated for a prompt as it is produced."""
+        from transformers import TextIteratorStreamer
+        
+        generator = self.generator
+        streamer = TextIteratorStreamer(generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+        
+        def generate():
+            try:
+                generator(prompt, streamer=streamer)
+            except Exception as e:
+                errors.append(e)
+                streamer.end()  # Unblock the consumer
+        
+        thread = threading.Thread(target=generate, name="answer-generation", daemon=True)
+        thread.start()
+        for text in streamer:
+            if text:
+                yield text
+        thread.join()
+        
+        if errors:
+            raise errors[0]
+    
+    def answer_from_chunks(self, query, retrieved_chunks, include_context=False, include_sources=True,
+                           on_token=None):
+        """Answer a query from chunks that were already retrieved.
+        
+        Lets callers that need the retrieved chunks themselves (e.g. for
+        explanations) run a single retrieval and reuse it for generation.
+        
+        Args:
+            query: User query string
+            retrieved_chunks: Chunks returned by CampaignRetriever.retrieve
+            include_context: Whether to include retrieved context in response
+            include_sources: Whether to include source references
+            on_token: Optional callback receiving each piece of text as it is
+                generated; the full answer is still returned at the end
+            
+        Returns:
+            Dictionary with answer and optional context/sources. If generation
+            fails after text was streamed, "streaming_failed" is True and
+            "answer" is the fallback answer
+        """
         if not retrieved_chunks:
             return {
                 "answer": "I don't have enough information to answer that question about your campaign.",
@@ -155,26 +613,37 @@ class CampaignAssistant:
                 "sources": []
             }
         
-        # Prepare context for the generator
-        context_text = "\n\n".join([chunk["text"] for chunk in retrieved_chunks])
-        
         # Generate answer
+        packed = None
+        pieces = []
+        streaming_error = None
         if self.generator:
-            # Create prompt for the generator
-            prompt = f"Answer about a D&D campaign:\nQuestion: {query}\nContext: {context_text}\nAnswer:"
+            # The same question over the same chunks was already answered
+            key = self._answer_key(query, retrieved_chunks)
+            response = self._cached_response(key, retrieved_chunks, include_context, include_sources)
+            if response is not None:
+                if on_token is not None:
+                    on_token(response["answer"])
+                return response
             
-            # Generate answer
             try:
-                generated_text = self.generator(prompt)[0]["generated_text"]
+                # Keep the best context sentences that fit the token budget
+                packed = self.pack_context(query, retrieved_chunks)
+                prompt = self.build_prompt(query, packed["text"])
                 
-                # Extract just the answer part (after "Answer:")
-                answer_parts = generated_text.split("Answer:")
-                if len(answer_parts) > 1:
-                    answer = answer_parts[1].strip()
+                if on_token is not None:
+                    for text in self._stream_prompt(prompt):
+                        on_token(text)
+                        pieces.append(text)
+                    answer = "".join(pieces).strip()
                 else:
-                    answer = "Based on the information in your campaign: " + generated_text
+                    answer = self._extract_answer(self.generator(prompt)[0]["generated_text"])
+                self._cache_answer(key, answer, packed)
             except Exception as e:
                 print(f"Error in text generation: {str(e)}")
+                if pieces:
+                    # Part of the answer already reached the caller
+                    streaming_error = str(e)
                 # Fallback to a simple answer based on retrieved chunks
                 answer = f"Based on your campaign information: {retrieved_chunks[0]['text'][:200]}..."
         else:
@@ -184,9 +653,79 @@ class CampaignAssistant:
                 answer += f"- {chunk['text'][:150]}...\n\n"
             answer += "(Note: Using retrieved text directly as generation model is unavailable)"
         
-        # Prepare response
+        response = self._build_response(answer, packed, retrieved_chunks, include_context, include_sources)
+        if streaming_error is not None:
+            # The streamed text was cut short; "answer" holds the fallback instead
+            response["streaming_failed"] = True
+            response["generation_error"] = streaming_error
+        return response
+    
+    def answer_many(self, queries, retrieved_chunk_lists, include_context=False, include_sources=True):
+        """Answer several queries with a single batched generation call.
+        
+        Used by the HTTP server to generate the answers of concurrent
+        requests together. Cached answers are reused, queries without
+        chunks get the usual fallback answer; if the batch fails, each query
+        is answered on its own.
+        
+        Args:
+            queries: List of user query strings
+            retrieved_chunk_lists: Retrieved chunks for each query
+            include_context: Whether to include retrieved context in the responses
+            include_sources: Whether to include source references
+            
+        Returns:
+            List with one response dictionary per query, as answer_from_chunks
+        """
+        responses = [None] * len(queries)
+        keys = [None] * len(queries)
+        pending = [i for i, chunks in enumerate(retrieved_chunk_lists) if chunks]
+        
+        if pending and self.generator:
+            for i in pending:
+                keys[i] = self._answer_key(queries[i], retrieved_chunk_lists[i])
+                responses[i] = self._cached_response(keys[i], retrieved_chunk_lists[i],
+                                                     include_context, include_sources)
+            pending = [i for i in pending if responses[i] is None]
+            
+            if pending:
+                try:
+                    packed = {i: self.pack_context(queries[i], retrieved_chunk_lists[i]) for i in pending}
+                    prompts = [self.build_prompt(queries[i], packed[i]["text"]) for i in pending]
+                    outputs = self.generator(prompts, batch_size=len(prompts))
+                    for i, output in zip(pending, outputs):
+                        answer = self._extract_answer(output[0]["generated_text"])
+                        self._cache_answer(keys[i], answer, packed[i])
+                        responses[i] = self._build_response(answer, packed[i], retrieved_chunk_lists[i],
+                                                            include_context, include_sources)
+                except Exception as e:
+                    print(f"Error in batched text generation: {str(e)}")
+        
+        for i, response in enumerate(responses):
+            if response is None:
+                responses[i] = self.answer_from_chunks(queries[i], retrieved_chunk_lists[i],
+                                                       include_context=include_context,
+                                                       include_sources=include_sources)
+        return responses
+    
+    def _extract_answer(self, generated_text):
+        """Extract just the answer part (after "Answer:") of the generated text."""
+        answer_parts = generated_text.split("Answer:")
+        if len(answer_parts) > 1:
+            return answer_parts[1].strip()
+        return "Based on the information in your campaign: " + generated_text
+    
+    def _build_response(self, answer, packed, retrieved_chunks, include_context, include_sources):
+        """Assemble the response dictionary of an answer."""
         response = {"answer": answer}
         
+        if packed is not None:
+            response["context_tokens"] = {
+                "used": packed["tokens_used"],
+                "dropped": packed["tokens_dropped"],
+                "duplicates": packed["duplicate_tokens"]
+            }
+        
         if include_context:
             response["context"] = [chunk["text"] for chunk in retrieved_chunks]
         
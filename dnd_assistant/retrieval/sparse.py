@@ -0,0 +1,167 @@
+"""
+BM25 sparse index over the campaign chunks.
+Exact names ("Zephyros", "Eldrith IV", "Bola de Fogo") often get weak
+embedding matches; a keyword index finds them reliably. Results are fused
+with the dense FAISS results by reciprocal-rank fusion.
+
+The postings are stored in CSR form as .npy files in models/bm25 and loaded
+as memory maps:
+    vocabulary.json   term -> term ID, the BM25 parameters and the campaign
+                      names (see retrieval.text.NameVocabulary)
+    term_offsets.npy  int64[terms + 1], start of each term's postings
+    doc_ids.npy       int64, chunk IDs of every posting
+    term_freqs.npy    uint16, term frequency of every posting
+    doc_lengths.npy   float32[slots], number of terms per chunk ID
+"""
+
+import os
+import json
+import math
+from collections import Counter
+
+import numpy as np
+
+from retrieval.text import NameVocabulary, tokenize
+
+SPARSE_INDEX_DIRECTORY = "bm25"
+
+class BM25Index:
+    """Okapi BM25 over chunk IDs, backed by compact postings arrays."""
+
+    def __init__(self, vocabulary, term_offsets, doc_ids, term_freqs, doc_lengths, k1=1.5, b=0.75,
+                 names=()):
+        self.vocabulary = vocabulary
+        # Campaign names, for the semantic query cache; empty for indexes
+        # built before they were collected
+        self.names = frozenset(names)
+        self.term_offsets = term_offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.num_docs = int(np.count_nonzero(doc_lengths))
+        self.average_length = float(doc_lengths.sum() / self.num_docs) if self.num_docs else 0.0
+
+    @classmethod
+    def build(cls, chunks_by_id, k1=1.5, b=0.75):
+        """Build the index from chunk ID -> chunk pairs.
+
+        Args:
+            chunks_by_id: Dictionary or ChunkStore mapping chunk ID to chunk
+        """
+        postings = {}
+        lengths = {}
+        names = NameVocabulary()
+
+        for chunk_id, chunk in chunks_by_id.items():
+            names.add(chunk["text"])
+            terms = Counter(tokenize(chunk["text"]))
+            lengths[chunk_id] = sum(terms.values())
+            for term, count in terms.items():
+                postings.setdefault(term, []).append((chunk_id, count))
+
+        doc_lengths = np.zeros(max(lengths) + 1 if lengths else 0, dtype='float32')
+        doc_lengths[list(lengths)] = list(lengths.values())
+
+        vocabulary = {term: i for i, term in enumerate(sorted(postings))}
+        term_offsets = np.zeros(len(vocabulary) + 1, dtype='int64')
+        doc_ids = []
+        term_freqs = []
+        for term, term_id in vocabulary.items():
+            entries = postings[term]
+            term_offsets[term_id + 1] = term_offsets[term_id] + len(entries)
+            doc_ids.extend(chunk_id for chunk_id, _ in entries)
+            term_freqs.extend(min(count, 65535) for _, count in entries)
+
+        return cls(vocabulary, term_offsets, np.array(doc_ids, dtype='int64'),
+                   np.array(term_freqs, dtype='uint16'), doc_lengths, k1=k1, b=b, names=names.names())
+
+    def save(self, directory):
+        """Write the index files into a directory."""
+        os.makedirs(directory, exist_ok=True)
+        arrays = {
+            "term_offsets.npy": self.term_offsets,
+            "doc_ids.npy": self.doc_ids,
+            "term_freqs.npy": self.term_freqs,
+            "doc_lengths.npy": self.doc_lengths
+        }
+        # Replace files instead of overwriting them, running retrievers may have them mapped
+        for name, values in arrays.items():
+            path = os.path.join(directory, name)
+            with open(path + ".tmp", 'wb') as f:
+                np.save(f, values)
+            os.replace(path + ".tmp", path)
+        path = os.path.join(directory, "vocabulary.json")
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump({"k1": self.k1, "b": self.b, "terms": self.vocabulary, "names": sorted(self.names)},
+                      f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, directory):
+        """Load an index written by save, or None if the directory has none."""
+        vocabulary_path = os.path.join(directory, "vocabulary.json")
+        if not os.path.exists(vocabulary_path):
+            return None
+        with open(vocabulary_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        def array(name):
+            return np.load(os.path.join(directory, name), mmap_mode='r')
+
+        return cls(meta["terms"], array("term_offsets.npy"), array("doc_ids.npy"),
+                   array("term_freqs.npy"), array("doc_lengths.npy"), k1=meta["k1"], b=meta["b"],
+                   names=meta.get("names", ()))
+
+    def search(self, query, top_k):
+        """Score chunks against a query.
+
+        Returns:
+            List of (chunk ID, BM25 score) pairs, best first
+        """
+        scores = None
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            ids = self.doc_ids[start:end]
+            freqs = self.term_freqs[start:end].astype('float32')
+
+            idf = math.log(1 + (self.num_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[ids] / self.average_length)
+            if scores is None:
+                scores = np.zeros(len(self.doc_lengths), dtype='float32')
+            # A chunk appears once per term, so plain fancy-index addition is safe
+            scores[ids] += idf * freqs * (self.k1 + 1) / (freqs + norm)
+
+        if scores is None:
+            return []
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k)[:top_k]]
+        matched = matched[np.argsort(-scores[matched])]
+        return [(int(chunk_id), float(scores[chunk_id])) for chunk_id in matched]
+
+def reciprocal_rank_fusion(dense_hits, sparse_hits, top_k=None, k=60):
+    """Fuse two ranked lists of (chunk ID, score) pairs.
+
+    Each list contributes 1 / (k + rank) per chunk, summed in "rrf_score";
+    the original scores are kept alongside it ("dense_score" and
+    "bm25_score", None for a chunk missing from that list).
+
+    Args:
+        top_k: Number of fused hits returned (default: all of them)
+
+    Returns:
+        List of (chunk ID, scores dictionary) pairs, best first
+    """
+    fused = {}
+    for name, hits in (("dense_score", dense_hits), ("bm25_score", sparse_hits)):
+        for rank, (chunk_id, score) in enumerate(hits):
+            entry = fused.setdefault(chunk_id, {"rrf_score": 0.0, "dense_score": None, "bm25_score": None})
+            entry["rrf_score"] += 1.0 / (k + rank + 1)
+            entry[name] = score
+    ranked = sorted(fused.items(), key=lambda item: item[1]["rrf_score"], reverse=True)
+    return ranked[:top_k]
@@ -0,0 +1,69 @@
+"""
+Portuguese-aware text normalization shared by the sparse index, the caches
+and the explainers. Campaign names are matched regardless of case and accents
+("Valória" == "valoria") and simple plural forms are reduced.
+"""
+
+import re
+import unicodedata
+from collections import Counter
+
+WORD = re.compile(r'\w+')
+
+# Common Portuguese (and a few English) words, accent-folded, that carry no
+# meaning on their own
+STOPWORDS = frozenset("""
+a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela pelos
+pelas para pra com sem e ou mas que quem quando como onde qual quais quanto se
+ao aos sao ser foi era sua seu suas seus ele ela eles elas isso isto esse
+essa este esta nao sim mais menos muito ja ha tem ter sobre entre ate the an and
+or but is are was were be been being have has had do does did to at in on by
+with about for of
+""".split())
+
+def fold_accents(text):
+    """Lowercase text and strip diacritics."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+def stem(word):
+    """Reduce common Portuguese plural endings (regiões -> regiao, itens -> item)."""
+    if len(word) <= 3:
+        return word
+    for suffix, replacement in (("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ns", "m")):
+        if word.endswith(suffix):
+            return word[:-len(suffix)] + replacement
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+def tokenize(text):
+    """Split text into normalized, stemmed terms without stopwords."""
+    return [stem(word) for word in WORD.findall(fold_accents(text)) if word not in STOPWORDS]
+
+class NameVocabulary:
+    """Collects the campaign names (NPCs, places, items) found in chunk texts.
+
+    A name is a word, accent-folded, that the campaign writes capitalized more
+    often than not: "Zephyros" and "Gólgota" are names, while "Reino" is not
+    if "reino" is just as common in the middle of sentences.
+    """
+
+    def __init__(self):
+        self.capitalized = Counter()
+        self.lowercase = Counter()
+
+    def add(self, text):
+        """Count the capitalization of the words of a text."""
+        for word in WORD.findall(text):
+            folded = fold_accents(word)
+            if folded in STOPWORDS or not word[0].isalpha():
+                continue
+            if word[0].isupper():
+                self.capitalized[folded] += 1
+            else:
+                self.lowercase[folded] += 1
+
+    def names(self):
+        """Accent-folded names, sorted."""
+        return sorted(word for word, count in self.capitalized.items() if count > self.lowercase[word])
@@ -0,0 +1,361 @@
+"""
+HTTP server for the D&D Campaign Assistant.
+Loads the embedding and generation models once and serves every player at
+the table. Concurrent requests are grouped into micro-batches: queries that
+arrive within a few milliseconds are embedded together, and their answers
+are generated in one batched call.
+
+Endpoints (JSON bodies, run from the dnd_assistant directory):
+    POST /retrieve  {"query": "...", "top_k": 5}
+    POST /answer    {"query": "...", "include_context": false}
+    POST /explain   {"query": "...", "charts": "none"}
+    GET  /health
+
+    python server.py --port 8000
+"""
+
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from retrieval.encoding import ENCODER_BACKENDS
+from retrieval.rag import CampaignRetriever, CampaignAssistant
+
+MAX_BODY_BYTES = 64 * 1024
+HEADER_TIMEOUT = 10
+BODY_TIMEOUT = 10
+
+class HTTPError(Exception):
+    """Error answered with an HTTP status and a JSON message."""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+class MicroBatcher:
+    """Groups concurrent calls into batches processed by one worker thread.
+
+    The first item of a batch waits at most max_wait seconds for others to
+    join; a batch is processed as soon as it has max_batch_size items.
+    """
+
+    def __init__(self, process_batch, max_batch_size=16, max_wait=0.01, name="batch"):
+        """Create the batcher.
+
+        Args:
+            process_batch: Blocking function mapping a list of items to a list of results
+            max_batch_size: Maximum number of items per batch
+            max_wait: Seconds the first item of a batch waits for more
+            name: Name of the worker thread
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        # Models are not thread-safe, batches run one at a time on their own thread
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self.queue = None
+        self.worker = None
+        self.batches = 0
+        self.items = 0
+
+    def start(self):
+        """Start the batching task on the running event loop."""
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.create_task(self._run())
+
+    async def submit(self, item):
+        """Queue an item and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Requests whose client went away are dropped before the work starts
+            batch = [(item, future) for item, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = await loop.run_in_executor(self.executor, self.process_batch,
+                                                     [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        """Number of batches and items processed, and the mean batch size."""
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "queued": self.queue.qsize() if self.queue else 0
+        }
+
+class CampaignServer:
+    """asyncio HTTP front end sharing one retriever and one assistant."""
+
+    def __init__(self, models_directory="models", max_batch_size=16, batch_window_ms=10,
+                 max_pending=64, encoder_backend=None):
+        """Load the models and set up the batchers.
+
+        Args:
+            models_directory: Directory with the FAISS index and chunks
+            max_batch_size: Maximum queries per embedding or generation batch
+            batch_window_ms: Milliseconds a query waits for others to batch with
+            max_pending: Requests in progress before new ones are refused with 503
+            encoder_backend: Query encoder, "torch" or "onnx" (models/onnx);
+                default: the backend the index was built with
+        """
+        self.retriever = CampaignRetriever(models_directory=models_directory,
+                                           encoder_backend=encoder_backend)
+        self.assistant = CampaignAssistant(retriever=self.retriever)
+        self.assistant.warm_up(background=True)
+
+        window = batch_window_ms / 1000
+        self.retrieval_batcher = MicroBatcher(self._retrieve_batch, max_batch_size, window, "retrieval")
+        self.generation_batcher = MicroBatcher(self._generate_batch, max_batch_size, window, "generation")
+
+        self.max_pending = max_pending
+        self.pending = 0
+        self.routes = {
+            ("POST", "/retrieve"): self.handle_retrieve,
+            ("POST", "/answer"): self.handle_answer,
+            ("POST", "/explain"): self.handle_explain,
+            ("GET", "/health"): self.handle_health,
+        }
+
+    def _retrieve_batch(self, items):
+        """Retrieve chunks for a batch of (query, top_k) pairs with one encode call.
+
+        Each query is searched with its own top_k, so its results don't
+        depend on the other requests of the batch.
+        """
+        return self.retriever.retrieve_many([query for query, _ in items], top_k=[k for _, k in items],
+                                            return_scores=True)
+
+    def _generate_batch(self, items):
+        """Generate the answers of a batch of (query, chunks, include_context) items."""
+        # include_context only shapes the response, generate with it and drop it where not asked
+        responses = self.assistant.answer_many([query for query, _, _ in items],
+                                               [chunks for _, chunks, _ in items],
+                                               include_context=True)
+        for (_, _, include_context), response in zip(items, responses):
+            if not include_context:
+                response.pop("context", None)
+        return responses
+
+    async def _retrieve(self, query, top_k=None):
+        return await self.retrieval_batcher.submit((query, top_k or self.retriever.top_k))
+
+    async def handle_retrieve(self, body):
+        query, top_k = _query(body), body.get("top_k")
+        if top_k is not None and (not isinstance(top_k, int) or not 1 <= top_k <= 100):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "top_k must be an integer between 1 and 100")
+        start_time = time.time()
+        chunks = await self._retrieve(query, top_k)
+        return {"query": query, "chunks": chunks, "timings": {"retrieval": time.time() - start_time}}
+
+    async def _answer(self, body):
+        query = _query(body)
+        start_time = time.time()
+        chunks = await self._retrieve(query)
+        retrieval_time = time.time() - start_time
+
+        start_time = time.time()
+        response = await self.generation_batcher.submit((query, chunks, bool(body.get("include_context"))))
+        response["timings"] = {"retrieval": retrieval_time, "generation": time.time() - start_time}
+        return query, chunks, response
+
+    async def handle_answer(self, body):
+        _, _, response = await self._answer(body)
+        return response
+
+    async def handle_explain(self, body):
+        from explainer.xai_simple import CHART_MODES, create_simple_explanation
+
+        charts = body.get("charts", "none")
+        if charts not in CHART_MODES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"charts must be one of {', '.join(CHART_MODES)}")
+        query, chunks, response = await self._answer(body)
+
+        start_time = time.time()
+        response["explanations"] = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: create_simple_explanation(query, chunks, response["answer"],
+                                                    models_directory=self.retriever.models_directory,
+                                                    charts=charts)
+        )
+        response["timings"]["explanation"] = time.time() - start_time
+        return response
+
+    async def handle_health(self, body):
+        return {
+            "status": "ok",
+            "chunks": len(self.retriever.chunk_store),
+            "index_type": self.retriever.index_type,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "retrieval_batches": self.retrieval_batcher.stats(),
+            "generation_batches": self.generation_batcher.stats(),
+            "query_cache": self.retriever.query_cache.stats(),
+            "semantic_cache": self.retriever.semantic_cache.stats() if self.retriever.semantic_cache else None,
+            "answer_cache": self.assistant.answer_cache.stats() if self.assistant.answer_cache else None
+        }
+
+    async def handle_connection(self, reader, writer):
+        """Serve one request per connection."""
+        status, payload, headers = HTTPStatus.OK, None, {}
+        try:
+            method, path, body = await _read_request(reader)
+            handler = self.routes.get((method, path))
+            if handler is None:
+                known = {route_path for _, route_path in self.routes}
+                status = HTTPStatus.METHOD_NOT_ALLOWED if path in known else HTTPStatus.NOT_FOUND
+                raise HTTPError(status, f"{method} {path} is not available")
+
+            if path == "/health":
+                payload = await handler(body)
+            else:
+                # Backpressure: refuse work beyond the limit instead of queueing it without bound
+                if self.pending >= self.max_pending:
+                    raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Server busy, try again shortly",
+                                    headers={"Retry-After": "1"})
+                self.pending += 1
+                try:
+                    payload = await handler(body)
+                finally:
+                    self.pending -= 1
+        except HTTPError as e:
+            status, payload, headers = e.status, {"error": e.message}, e.headers
+        except Exception as e:
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+
+        try:
+            await _write_response(writer, status, payload, headers)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8000):
+        """Run the server until interrupted."""
+        self.retrieval_batcher.start()
+        self.generation_batcher.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Servidor do Assistente de Campanha ouvindo em http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+def _query(body):
+    query = body.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "query must be a non-empty string")
+    return query.strip()
+
+async def _read_request(reader):
+    """Read an HTTP/1.1 request.
+
+    Returns:
+        Tuple of (method, path, parsed JSON body or {})
+    """
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HEADER_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request")
+
+    lines = head.decode('latin-1').split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Body larger than {MAX_BODY_BYTES} bytes")
+
+    body = {}
+    if length:
+        try:
+            # A client sending less than Content-Length must not hold its slot forever
+            body = json.loads(await asyncio.wait_for(reader.readexactly(length), BODY_TIMEOUT))
+        except asyncio.TimeoutError:
+            raise HTTPError(HTTPStatus.REQUEST_TIMEOUT, f"Body not received within {BODY_TIMEOUT}s")
+        except (asyncio.IncompleteReadError, ValueError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be valid JSON")
+        if not isinstance(body, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+    return method.upper(), target.split("?", 1)[0], body
+
+def _json_default(value):
+    """Serialize numpy scalars and arrays found in explanations."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+async def _write_response(writer, status, payload, headers):
+    body = json.dumps(payload, ensure_ascii=False, default=_json_default).encode('utf-8')
+    head = [f"HTTP/1.1 {status.value} {status.phrase}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            "Connection: close"]
+    head += [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body)
+    await writer.drain()
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP server for the D&D Campaign Assistant.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--models-directory", default="models", help="Directory with the index")
+    parser.add_argument("--max-batch", type=int, default=16, help="Maximum queries per batch")
+    parser.add_argument("--batch-window-ms", type=float, default=10,
+                        help="Milliseconds a query waits for others to batch with")
+    parser.add_argument("--max-pending", type=int, default=64,
+                        help="Requests in progress before new ones get 503")
+    parser.add_argument("--encoder-backend", choices=ENCODER_BACKENDS, default=None,
+                        help="Encode queries with sentence-transformers or the ONNX export "
+                             "(default: the backend the index was built with)")
+    args = parser.parse_args()
+
+    server = CampaignServer(args.models_directory, max_batch_size=args.max_batch,
+                            batch_window_ms=args.batch_window_ms, max_pending=args.max_pending,
+                            encoder_backend=args.encoder_backend)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nServidor encerrado.")
+
+if __name__ == "__main__":
+    main()
@@ -47,26 +47,28 @@ def main():
     
     process_data = load_module("process_data.py", "process_data")
     process_data.create_sample_files("data/raw")
-    chunks = process_data.process_campaign_files("data/raw", "data/processed")
+    num_chunks = process_data.process_campaign_files("data/raw", "data/processed")
     
-    if not chunks:
+    if not num_chunks:
         print("No chunks were created. Please check your campaign files and try again.")
         sys.exit(1)
     
-    print(f"Successfully processed {len(chunks)} chunks from campaign files.")
+    print(f"Successfully processed {num_chunks} chunks from campaign files.")
     
     # Step 2: Create embeddings
     print("\nSTEP 2: CREATING EMBEDDINGS AND FAISS INDEX")
     print("-"*70)
     
     create_embeddings = load_module("create_embeddings.py", "create_embeddings")
-    embeddings, index = create_embeddings.create_and_save_embeddings(chunks, output_directory="models")
+    # Chunks are streamed back from the files written in step 1
+    chunks = create_embeddings.load_chunks("data/processed")
+    embeddings, index = create_embeddings.update_embeddings(chunks, output_directory="models")
     
     if embeddings is None or index is None:
         print("Failed to create embeddings. Please check the error messages above.")
         sys.exit(1)
     
-    print(f"Successfully created embeddings for {len(chunks)} chunks.")
+    print(f"Successfully created embeddings for {index.ntotal} chunks.")
     
     # Create directory for retrieval module if it doesn't exist
     if not os.path.exists("retrieval"):
@@ -101,11 +103,16 @@ def main():
             "Quais itens mágicos existem na campanha?"
         ]
         
-        for query in test_queries:
+        # Retrieve context for all test queries in one batch
+        start_time = time.time()
+        retrieved = retriever.retrieve_many(test_queries, return_scores=True)
+        print(f"Retrieved context for {len(test_queries)} queries in {time.time() - start_time:.2f} seconds")
+        
+        for query, chunks in zip(test_queries, retrieved):
             print(f"\nTesting query: \"{query}\"")
             
             start_time = time.time()
-            response = assistant.answer_query(query, include_sources=True)
+            response = assistant.answer_from_chunks(query, chunks, include_sources=True)
             elapsed_time = time.time() - start_time
             
             print(f"Response (in {elapsed_time:.2f} seconds):")
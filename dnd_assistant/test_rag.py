@@ -14,6 +14,7 @@ def main():
     
     try:
         assistant = CampaignAssistant()
+        assistant.warm_up(background=True)
         
         while True:
             # Get user input
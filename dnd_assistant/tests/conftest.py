@@ -0,0 +1,103 @@
+"""
+Shared fixtures for the test suite. Run from the dnd_assistant directory:
+
+    python -m pytest -q
+"""
+
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retrieval.text import WORD
+
+
+class HashingEncoder:
+    """Deterministic stand-in for the sentence encoder.
+
+    Each word gets a fixed random vector and a text is the normalized sum of
+    its words, so texts sharing words are similar without downloading a model.
+    """
+
+    def __init__(self, dimension=64):
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def _word_vector(self, word):
+        seed = zlib.crc32(word.lower().encode("utf-8"))
+        return np.random.default_rng(seed).standard_normal(self.dimension).astype("float32")
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+        if isinstance(texts, str):
+            return self.encode([texts])[0]
+        embeddings = np.zeros((len(texts), self.dimension), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in WORD.findall(text):
+                embeddings[row] += self._word_vector(word)
+            embeddings[row] /= max(float(np.linalg.norm(embeddings[row])), 1e-12)
+        return embeddings
+
+
+@pytest.fixture
+def encoder():
+    return HashingEncoder()
+
+
+@pytest.fixture
+def fake_encode_texts(monkeypatch, encoder):
+    """Make create_embeddings encode with the hashing encoder; returns the texts it encoded."""
+    import create_embeddings
+
+    encoded = []
+
+    def encode_texts(texts, model_name, **kwargs):
+        texts = list(texts)
+        encoded.extend(texts)
+        return encoder.encode(texts)
+
+    monkeypatch.setattr(create_embeddings, "encode_texts", encode_texts)
+    return encoded
+
+
+CAMPAIGN = [
+    {"text": "O Rei Eldrith IV governa o Reino de Valoria com justiça e compaixão.", "source": "npcs.txt"},
+    {"text": "A Arquimaga Lyra é a conselheira mágica do rei e protetora do reino.", "source": "npcs.txt"},
+    {"text": "Barakas, o Mercador, é o meio-orc mais rico de Valoria.", "source": "npcs.txt"},
+    {"text": "Zephyros é um dragão azul que dorme nas Montanhas Geladas.", "source": "npcs.txt"},
+    {"text": "A Floresta Sombria fica ao norte do reino e abriga criaturas feéricas.", "source": "regioes.txt"},
+    {"text": "As Montanhas Geladas separam Valoria das terras bárbaras do norte.", "source": "regioes.txt"},
+    {"text": "Gólgota é uma cidade em ruínas tomada por mortos-vivos.", "source": "regioes.txt"},
+    {"text": "Velyria é um porto tranquilo no litoral sul, conhecido pelos mercadores.", "source": "regioes.txt"},
+    {"text": "A Espada da Chama Eterna foi forjada no Vulcão Ardente.", "source": "itens.txt"},
+    {"text": "O Amuleto da Proteção Arcana protege contra magias hostis.", "source": "itens.txt"},
+]
+
+
+@pytest.fixture
+def models_directory(tmp_path, fake_encode_texts):
+    """Index of a small campaign built with the hashing encoder."""
+    from create_embeddings import create_and_save_embeddings
+
+    directory = str(tmp_path / "models")
+    create_and_save_embeddings(iter(CAMPAIGN), model_name="test-model", output_directory=directory)
+    return directory
+
+
+@pytest.fixture
+def retriever_factory(models_directory, monkeypatch, encoder):
+    """Build CampaignRetrievers over models_directory that encode with the hashing encoder."""
+    from retrieval import rag
+
+    monkeypatch.setattr(rag, "load_encoder", lambda *args, **kwargs: encoder)
+
+    def factory(**kwargs):
+        kwargs.setdefault("persist_query_cache", False)
+        return rag.CampaignRetriever(models_directory, **kwargs)
+
+    return factory
@@ -0,0 +1,101 @@
+"""Tests for the cache of generated answers."""
+
+import json
+from types import SimpleNamespace
+
+from retrieval.cache import AnswerCache, answer_key
+from retrieval.rag import GENERATION_MAX_LENGTH, GENERATOR_MODEL, CampaignAssistant
+
+
+def test_lru_eviction():
+    cache = AnswerCache("build-1", max_size=2)
+    cache.put("a", {"answer": "A"})
+    cache.put("b", {"answer": "B"})
+    cache.get("a")
+    cache.put("c", {"answer": "C"})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"answer": "A"}
+    assert cache.get("c") == {"answer": "C"}
+
+
+def test_expired_answers_are_dropped(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("retrieval.cache.time.time", lambda: now[0])
+    cache = AnswerCache("build-1", ttl=60)
+    cache.put("a", {"answer": "A"})
+
+    now[0] += 61
+    assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_persisted_answers_belong_to_their_index(tmp_path):
+    path = str(tmp_path / "answer_cache.json")
+    AnswerCache("build-1", cache_path=path).put("a", {"answer": "A"})
+
+    assert AnswerCache("build-1", cache_path=path).get("a") == {"answer": "A"}
+
+    # A rebuilt index ignores the old answers, and the next one replaces the file
+    rebuilt = AnswerCache("build-2", cache_path=path)
+    assert rebuilt.get("a") is None
+    rebuilt.put("b", {"answer": "B"})
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["fingerprint"] == "build-2"
+    assert [entry[0] for entry in data["entries"]] == ["b"]
+
+
+def test_answer_key_keeps_case_and_ignores_spacing():
+    params = {"max_length": 200}
+    key = answer_key("Quem é o Rei?", [1, 2], "gpt2", params)
+    assert answer_key("Quem  é o Rei? ", [1, 2], "gpt2", params) == key
+    assert answer_key("quem é o rei?", [1, 2], "gpt2", params) != key
+    assert answer_key("Quem é o Rei?", [2, 1], "gpt2", params) != key
+
+
+def test_assistant_reuses_generated_answers(retriever_factory):
+    retriever = retriever_factory(semantic_cache_size=0)
+    assistant = CampaignAssistant(retriever=retriever, persist_answer_cache=False)
+    assistant._generator = SimpleNamespace(tokenizer=None, model=SimpleNamespace(name_or_path="fake"))
+    prompts = []
+
+    def stream(prompt):
+        prompts.append(prompt)
+        yield "Um dragão azul."
+
+    assistant._stream_prompt = stream
+    query = "Quem é Zephyros?"
+    chunks = retriever.retrieve(query, return_scores=True)
+    first = assistant.answer_from_chunks(query, chunks, on_token=lambda text: None)
+    second = assistant.answer_from_chunks(query, chunks, on_token=lambda text: None)
+
+    assert len(prompts) == 1
+    assert second["cached"] is True
+    assert second["answer"] == first["answer"] == "Um dragão azul."
+
+
+def test_answer_key_names_the_model_that_loaded(retriever_factory):
+    retriever = retriever_factory(semantic_cache_size=0)
+    assistant = CampaignAssistant(retriever=retriever, persist_answer_cache=False)
+    query = "Quem é Zephyros?"
+    chunks = retriever.retrieve(query, return_scores=True)
+    # Nothing is looked up before the generator is loaded, its model may not be the preferred one
+    assert assistant._answer_key(query, chunks) is None
+
+    fallback = SimpleNamespace(tokenizer=None, model=SimpleNamespace(name_or_path="gpt2"))
+    assistant._load_generator = lambda: fallback
+    assistant._stream_prompt = lambda prompt: iter(["Um dragão azul."])
+    assistant.answer_from_chunks(query, chunks, on_token=lambda text: None)
+
+    assert list(assistant.answer_cache.entries) == [assistant._answer_key(query, chunks)]
+    generation_params = {
+        "max_length": GENERATION_MAX_LENGTH,
+        "context_token_budget": assistant.context_packer.max_tokens,
+        "prompt": assistant.build_prompt("{query}", "{context}")
+    }
+    chunk_ids = [chunk["id"] for chunk in chunks]
+    canonical = retriever.canonical_query(query)
+    assert answer_key(canonical, chunk_ids, "gpt2", generation_params) in assistant.answer_cache.entries
+    assert answer_key(canonical, chunk_ids, GENERATOR_MODEL, generation_params) \
+        not in assistant.answer_cache.entries
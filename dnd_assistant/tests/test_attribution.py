@@ -0,0 +1,54 @@
+from explainer.attribution import AttributionIndex
+from explainer.xai_simple import SimpleGenerationExplainer
+
+CONTEXT = [
+    {"id": 7, "text": "O Rei Eldrith governa Valória com justiça. Ele mora no castelo.", "source": "npcs.txt"},
+    {"id": 9, "text": "Zephyros é um dragão azul. Ele dorme nas Montanhas Geladas.", "source": "npcs.txt"},
+]
+
+
+def test_spans_point_to_chunk_and_sentence():
+    answer = "Sabemos que o rei Eldrith governa Valoria com justiça. E Zephyros é um dragão azul."
+    spans = AttributionIndex(CONTEXT).attribute(answer)
+
+    assert [(span["answer_text"], span["chunk_id"], span["sentence_index"], span["words"]) for span in spans] == [
+        ("o rei Eldrith governa Valoria com justiça", 7, 0, 7),
+        ("Zephyros é um dragão azul", 9, 0, 5),
+    ]
+    first = spans[0]
+    assert answer[first["answer_start"]:first["answer_end"]] == first["answer_text"]
+    assert CONTEXT[0]["text"][first["context_start"]:first["context_end"]] == \
+        "O Rei Eldrith governa Valória com justiça"
+    assert first["context_sentence"] == "O Rei Eldrith governa Valória com justiça."
+    assert first["answer_sentence"] == "Sabemos que o rei Eldrith governa Valoria com justiça."
+
+
+def test_spans_stop_at_sentence_boundaries():
+    # "com justiça. Ele mora" crosses a sentence boundary in the context
+    spans = AttributionIndex(CONTEXT).attribute("Governa Valória com justiça ele mora no castelo.")
+
+    assert [span["answer_text"] for span in spans] == ["Governa Valória com justiça", "ele mora no castelo"]
+    assert [span["sentence_index"] for span in spans] == [0, 1]
+
+
+def test_every_span_is_reported_and_ties_go_to_the_best_chunk():
+    context = CONTEXT + [{"id": 11, "text": "Zephyros é um dragão azul antigo.", "source": "lendas.txt"}]
+    answer = "Zephyros é um dragão azul. Ele dorme nas Montanhas Geladas."
+    spans = AttributionIndex(context).attribute(answer)
+
+    assert [(span["answer_text"], span["chunk_id"]) for span in spans] == [
+        ("Zephyros é um dragão azul", 9),
+        ("Ele dorme nas Montanhas Geladas", 9),
+    ]
+    assert AttributionIndex(context).attribute("Nada a ver aqui.") == []
+
+
+def test_generation_explanation():
+    answer = "Zephyros é um dragão azul. Ele dorme nas Montanhas Geladas. Não sei mais nada."
+    explanation = SimpleGenerationExplainer().explain_answer("Quem é Zephyros?", CONTEXT, answer)
+
+    assert len(explanation["attributions"]) == 2
+    assert [c["answer_text"] for c in explanation["connections"]] == [
+        "Zephyros é um dragão azul.", "Ele dorme nas Montanhas Geladas."]
+    assert explanation["coverage"] == 10 / 14
+    assert explanation["sources_by_usage"][0]["source"] == "npcs.txt"
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from benchmarks.quantization import run_benchmark
+from benchmarks.suite import _StreamedChunks, _bm25, _retrieve, _sample_chunks
+from conftest import CAMPAIGN
+from retrieval.chunk_format import chunks_path, make_record, write_record
+from retrieval.sparse import BM25Index
+
+
+@pytest.fixture
+def processed_directory(tmp_path):
+    directory = tmp_path / "processed"
+    directory.mkdir()
+    with open(chunks_path(str(directory), "campanha.txt"), "w", encoding="utf-8") as f:
+        for i, chunk in enumerate(CAMPAIGN):
+            write_record(f, make_record(i, chunk["source"], chunk["text"]))
+    return str(directory)
+
+
+@pytest.mark.parametrize("metric", ["cosine", "l2"])
+def test_quantization_recall_is_against_exact_search(metric):
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((1000, 32)).astype("float32")
+    queries = rng.standard_normal((20, 32)).astype("float32")
+
+    # A lossy type benchmarked first must not become the ground truth
+    results = run_benchmark(embeddings, queries, storage_types=("sq_int8", "flat"), metric=metric)
+    recall = {row["storage_type"]: row["recall_at_k"] for row in results}
+    assert recall["flat"] == 1.0
+    assert recall["sq_int8"] <= 1.0
+
+
+def test_sample_chunks(processed_directory):
+    sample = _sample_chunks(processed_directory, 4)
+    assert len(sample) == 4
+    # In corpus order, and the same for the same seed
+    assert [record["id"] for record in sample] == sorted(record["id"] for record in sample)
+    assert sample == _sample_chunks(processed_directory, 4)
+    assert len(_sample_chunks(processed_directory, 100)) == len(CAMPAIGN)
+
+
+def test_retrieve_stage(processed_directory, tmp_path, monkeypatch, encoder, fake_encode_texts):
+    from retrieval import rag
+
+    monkeypatch.setattr(rag, "load_encoder", lambda *args, **kwargs: encoder)
+    result = _retrieve(processed_directory, str(tmp_path / "models"), "test-model", sample_size=10,
+                       num_queries=5, top_k=3, index_type="flat", metric="cosine", score_threshold=None)
+
+    assert result["sample_size"] == 10
+    assert result["hybrid"] is True
+    assert result["results_per_query"] == 3
+    # The repeated queries hit the query embedding cache
+    assert result["query_cache_hit_rate"] == pytest.approx(5 / 15)
+    for name in ("search", "cached", "rephrased"):
+        assert result[f"{name}_ms_p95"] >= result[f"{name}_ms_p50"] > 0
+
+
+def test_bm25_stage_streams_the_corpus(processed_directory):
+    streamed = BM25Index.build(_StreamedChunks(processed_directory))
+    in_memory = BM25Index.build({i: chunk for i, chunk in enumerate(CAMPAIGN)})
+    assert streamed.vocabulary == in_memory.vocabulary
+    assert np.array_equal(streamed.doc_ids, in_memory.doc_ids)
+
+    result = _bm25(processed_directory, num_queries=5, top_k=3)
+    assert result["build_seconds"] > 0
+    assert result["search_ms_p95"] >= result["search_ms_p50"] > 0
@@ -0,0 +1,82 @@
+import os
+import time
+
+from explainer import xai_simple
+from explainer.xai_simple import (chart_paths, chart_status, create_simple_explanation, prune_charts,
+                                  render_charts_in_background)
+
+CHUNKS = [{"id": 0, "text": "O Rei Eldrith governa Valoria.", "source": "npcs.txt"}]
+
+
+def test_prune_charts_keeps_the_newest(tmp_path):
+    now = time.time()
+    for i in range(5):
+        for prefix in xai_simple.CHART_PREFIXES:
+            path = tmp_path / f"{prefix}{i}.png"
+            path.write_bytes(b"png")
+            os.utime(path, (now + i, now + i))
+    (tmp_path / "notes.png").write_bytes(b"not a chart")
+
+    assert prune_charts(str(tmp_path), max_charts=4) == 6
+    assert sorted(os.listdir(tmp_path)) == ["chunk_similarities_3.png", "chunk_similarities_4.png",
+                                            "notes.png", "term_importance_3.png", "term_importance_4.png"]
+
+
+def test_background_failure_is_reported(tmp_path, monkeypatch, capsys):
+    def failing_render(explanation, paths):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(xai_simple, "render_charts", failing_render)
+    paths = chart_paths("Quem é o rei?", CHUNKS, str(tmp_path))
+    future = render_charts_in_background({}, paths)
+
+    assert isinstance(future.exception(timeout=10), RuntimeError)
+    # The done callback may still be running
+    deadline = time.time() + 10
+    while chart_status(paths) == "pending" and time.time() < deadline:
+        time.sleep(0.01)
+    assert chart_status(paths) == "failed: disk full"
+    assert "disk full" in capsys.readouterr().out
+
+
+def test_background_render_becomes_ready(tmp_path, monkeypatch):
+    def render(explanation, paths):
+        for path in paths.values():
+            with open(path, "wb") as f:
+                f.write(b"png")
+        return paths
+
+    monkeypatch.setattr(xai_simple, "render_charts", render)
+    paths = chart_paths("Onde fica Valoria?", CHUNKS, str(tmp_path))
+    assert chart_status(paths) == "pending"
+    render_charts_in_background({}, paths).result(timeout=10)
+    assert chart_status(paths) == "ready"
+
+
+def test_nothing_to_draw_is_skipped(tmp_path, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(xai_simple, "render_charts_in_background", lambda *args: submitted.append(args))
+    monkeypatch.setattr(xai_simple.SimpleRetrieverExplainer, "explain_retrieval",
+                        lambda self, query, chunks: {"explanation": "Could not generate explanation."})
+
+    explanation = create_simple_explanation("Quem é o rei?", CHUNKS, "Eldrith.",
+                                            models_directory=str(tmp_path), output_dir=str(tmp_path))
+    assert not submitted
+    assert explanation["chart_status"] == "skipped"
+    assert explanation["visualizations"] == {"similarity": None, "term_importance": None}
+    assert chart_status(explanation["chart_paths"]) == "skipped"
+
+
+def test_only_charts_with_data_get_a_path(tmp_path):
+    explanation = {"chunk_similarities": [{"index": 0, "source": "npcs.txt", "similarity": 0.5}],
+                   "term_weights": []}
+    paths = xai_simple.drawable_charts(explanation, chart_paths("Quem?", CHUNKS, str(tmp_path)))
+    assert paths["term_importance"] is None
+
+    saved = render_charts_in_background(explanation, paths).result(timeout=30)
+    assert saved == paths
+    assert os.path.exists(paths["similarity"])
+    deadline = time.time() + 10
+    while chart_status(paths) == "pending" and time.time() < deadline:
+        time.sleep(0.01)
+    assert chart_status(paths) == "ready"
@@ -0,0 +1,46 @@
+from retrieval.context import ContextPacker
+
+
+def _chunks(*texts):
+    return [{"text": text, "source": "npcs.txt"} for text in texts]
+
+
+def test_budget_keeps_best_sentences_in_order():
+    chunks = _chunks("O dragão dorme nas Montanhas Geladas. Zephyros é um dragão azul.",
+                     "Barakas é um mercador rico. Ele vive em Valoria.")
+    packed = ContextPacker(max_tokens=11).pack("Onde dorme Zephyros?", chunks)
+
+    assert packed["text"] == "O dragão dorme nas Montanhas Geladas. Zephyros é um dragão azul."
+    assert packed["tokens_used"] == 11
+    assert packed["tokens_dropped"] == 9
+    assert packed["sentences_used"] == 2
+    assert packed["sentences_dropped"] == 2
+
+
+def test_repeated_sentences_and_overlap_fragments_are_kept_once():
+    # The second chunk starts with the last 200 characters of the first one
+    chunks = _chunks("O rei governa Valoria. A rainha Elara comanda a guarda real do castelo.",
+                     "comanda a guarda real do castelo. O rei governa Valoria. Lyra é a arquimaga.")
+    packed = ContextPacker(max_tokens=100).pack("Quem é Lyra?", chunks)
+
+    assert packed["text"] == ("O rei governa Valoria. A rainha Elara comanda a guarda real do castelo. "
+                              "Lyra é a arquimaga.")
+    assert packed["duplicate_tokens"] == 10
+
+
+def test_earlier_fragment_is_replaced_by_the_whole_sentence():
+    # The first chunk ends mid-sentence
+    chunks = _chunks("O rei governa Valoria. A rainha Elara comanda",
+                     "A rainha Elara comanda a guarda real do castelo.")
+    packed = ContextPacker(max_tokens=100).pack("Quem comanda a guarda?", chunks)
+
+    assert packed["text"] == "O rei governa Valoria. A rainha Elara comanda a guarda real do castelo."
+    assert packed["duplicate_tokens"] == 4
+
+
+def test_short_distinct_sentence_inside_a_longer_one_is_kept():
+    chunks = _chunks("O bardo contou que Ele morreu na batalha. Ele morreu. A guerra acabou.")
+    packed = ContextPacker(max_tokens=100).pack("O que aconteceu?", chunks)
+
+    assert "Ele morreu. A guerra" in packed["text"]
+    assert packed["duplicate_tokens"] == 0
@@ -0,0 +1,87 @@
+import os
+
+import faiss
+import pytest
+
+from create_embeddings import CHUNK_IDS_FILE, create_and_save_embeddings, update_embeddings
+from retrieval.chunk_store import CHUNK_STORE_FILE, ChunkStore
+from retrieval.manifest import load_manifest
+
+CHUNKS = [
+    {"text": "O Rei Eldrith IV governa o Reino de Valoria.", "source": "npcs.txt"},
+    {"text": "A Arquimaga Lyra aconselha o rei.", "source": "npcs.txt"},
+    {"text": "A Floresta Sombria fica ao norte de Valoria.", "source": "regioes.txt"},
+    {"text": "As Montanhas Geladas separam Valoria das terras bárbaras.", "source": "regioes.txt"},
+]
+
+
+def _stored(models):
+    store = ChunkStore(os.path.join(models, CHUNK_STORE_FILE))
+    return sorted(chunk["text"] for _, chunk in store.items())
+
+
+def test_create_streams_chunks_and_drops_duplicates(tmp_path, fake_encode_texts):
+    models = str(tmp_path)
+    chunks = (chunk for chunk in CHUNKS + CHUNKS[:2])
+    embeddings, index = create_and_save_embeddings(chunks, model_name="test-model", output_directory=models)
+
+    assert index.ntotal == len(CHUNKS) == embeddings.shape[0]
+    assert fake_encode_texts == [chunk["text"] for chunk in CHUNKS]
+    assert _stored(models) == sorted(chunk["text"] for chunk in CHUNKS)
+    assert load_manifest(models)["chunk_count"] == len(CHUNKS)
+    assert not [name for name in os.listdir(models) if name.endswith((".staged", ".update", ".tmp"))]
+
+
+def test_create_without_chunks(tmp_path, fake_encode_texts):
+    assert create_and_save_embeddings(iter([]), model_name="test-model", output_directory=str(tmp_path)) \
+        == (None, None)
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "binary"])
+def test_update_only_encodes_new_chunks(tmp_path, fake_encode_texts, index_type):
+    models = str(tmp_path)
+    update_embeddings(iter(CHUNKS[:3]), model_name="test-model", output_directory=models, index_type=index_type)
+    fake_encode_texts.clear()
+
+    new_chunk = {"text": "Barakas é o mercador mais rico de Valoria.", "source": "npcs.txt"}
+    embeddings, index = update_embeddings(iter(CHUNKS[1:] + [new_chunk]), model_name="test-model",
+                                          output_directory=models, index_type=index_type)
+    expected = sorted(chunk["text"] for chunk in CHUNKS[1:] + [new_chunk])
+    assert _stored(models) == expected
+    assert faiss.read_index(os.path.join(models, "faiss_index.bin")).ntotal == len(expected)
+    if index_type == "hnsw":
+        # HNSW cannot remove the first chunk, so everything is encoded again
+        assert sorted(fake_encode_texts) == expected
+    else:
+        assert sorted(fake_encode_texts) == sorted([CHUNKS[3]["text"], new_chunk["text"]])
+    assert not [name for name in os.listdir(models) if name.endswith((".staged", ".update", ".tmp"))]
+
+
+def test_update_without_changes(tmp_path, fake_encode_texts):
+    models = str(tmp_path)
+    update_embeddings(iter(CHUNKS), model_name="test-model", output_directory=models)
+    with open(os.path.join(models, CHUNK_IDS_FILE), encoding="utf-8") as f:
+        ids_before = f.read()
+    build_hash_before = load_manifest(models)["build_hash"]
+    fake_encode_texts.clear()
+
+    embeddings, index = update_embeddings(iter(CHUNKS), model_name="test-model", output_directory=models)
+    assert fake_encode_texts == []
+    assert embeddings.shape[0] == 0 and index.ntotal == len(CHUNKS)
+    with open(os.path.join(models, CHUNK_IDS_FILE), encoding="utf-8") as f:
+        assert f.read() == ids_before
+    assert load_manifest(models)["build_hash"] == build_hash_before
+
+
+def test_full_rebuild_that_renumbers_chunks_changes_build_hash(tmp_path, fake_encode_texts):
+    models = str(tmp_path)
+    create_and_save_embeddings(iter(CHUNKS), model_name="test-model", output_directory=models)
+    first = load_manifest(models)["build_hash"]
+
+    # Same contents in another order get other IDs, so cached answers must not carry over
+    create_and_save_embeddings(iter(CHUNKS[::-1]), model_name="test-model", output_directory=models)
+    assert load_manifest(models)["build_hash"] != first
+
+    create_and_save_embeddings(iter(CHUNKS), model_name="test-model", output_directory=models)
+    assert load_manifest(models)["build_hash"] == first
@@ -0,0 +1,66 @@
+"""Tests for recording and enforcing the encoder backend of an index."""
+
+import json
+import os
+
+import pytest
+
+from create_embeddings import update_embeddings
+from retrieval.encoding import backend_label
+from retrieval.manifest import ManifestMismatchError, load_manifest
+from retrieval.onnx_encoder import ONNX_CONFIG_FILE, ONNX_DIRECTORY
+
+from conftest import CAMPAIGN
+
+
+def write_onnx_export(models_directory, quantized):
+    directory = os.path.join(models_directory, ONNX_DIRECTORY)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ONNX_CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump({"quantized": quantized}, f)
+    return directory
+
+
+def test_backend_label_includes_quantization(tmp_path):
+    assert backend_label("torch") == "torch"
+    assert backend_label("onnx", write_onnx_export(str(tmp_path), quantized=True)) == "onnx-int8"
+    assert backend_label("onnx", write_onnx_export(str(tmp_path), quantized=False)) == "onnx-fp32"
+    with pytest.raises(FileNotFoundError):
+        backend_label("onnx", str(tmp_path / "missing"))
+    with pytest.raises(ValueError):
+        backend_label("tensorflow")
+
+
+def test_update_with_another_backend_rebuilds(models_directory, fake_encode_texts):
+    assert load_manifest(models_directory)["encoder_backend"] == "torch"
+    write_onnx_export(models_directory, quantized=True)
+    fake_encode_texts.clear()
+
+    update_embeddings(iter(CAMPAIGN), model_name="test-model", output_directory=models_directory,
+                      encoder_backend="onnx")
+
+    # Every chunk is re-encoded, none of the torch vectors is kept
+    assert len(fake_encode_texts) == len(CAMPAIGN)
+    assert load_manifest(models_directory)["encoder_backend"] == "onnx-int8"
+
+
+def test_retriever_defaults_to_the_index_backend(retriever_factory):
+    retriever = retriever_factory()
+    assert retriever.encoder_label == "torch"
+    assert retriever.query_cache.model_name == "test-model"
+
+
+def test_retriever_refuses_another_backend(models_directory, retriever_factory):
+    write_onnx_export(models_directory, quantized=True)
+    with pytest.raises(ManifestMismatchError):
+        retriever_factory(encoder_backend="onnx")
+
+
+def test_query_cache_is_keyed_by_quantization(models_directory, retriever_factory, fake_encode_texts):
+    write_onnx_export(models_directory, quantized=False)
+    update_embeddings(iter(CAMPAIGN), model_name="test-model", output_directory=models_directory,
+                      encoder_backend="onnx")
+
+    retriever = retriever_factory()
+    assert retriever.encoder_backend == "onnx"
+    assert retriever.query_cache.model_name == "test-model+onnx-fp32"
@@ -0,0 +1,36 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from retrieval import encoding
+
+
+def test_no_texts_returns_without_loading_the_model(monkeypatch):
+    def load_encoder(*args, **kwargs):
+        raise AssertionError("the model must not be loaded")
+
+    monkeypatch.setattr(encoding, "load_encoder", load_encoder)
+    embeddings = encoding.encode_texts(iter([]), "test-model", workers=4, dimension=64)
+    assert embeddings.shape == (0, 64)
+    assert embeddings.dtype == np.float32
+
+
+def test_encodes_in_input_order(monkeypatch, encoder):
+    monkeypatch.setattr(encoding, "load_encoder", lambda *args, **kwargs: encoder)
+    texts = [("palavra " * (i % 7 + 1)) + str(i) for i in range(50)]
+    # Small windows and batches, so the texts are reordered by length
+    embeddings = encoding.encode_texts(iter(texts), "test-model", workers=1, batch_size=4, sort_window=16)
+    np.testing.assert_allclose(embeddings, encoder.encode(texts), rtol=1e-6)
+
+
+def test_spawned_workers_inherit_the_thread_limits(monkeypatch):
+    monkeypatch.delenv("OMP_NUM_THREADS", raising=False)
+    context = multiprocessing.get_context("spawn")
+    with encoding._worker_thread_environment(3), \
+            ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        seen = executor.submit(os.getenv, "OMP_NUM_THREADS").result(timeout=60)
+    assert seen == "3"
+    # Restored in this process
+    assert "OMP_NUM_THREADS" not in os.environ
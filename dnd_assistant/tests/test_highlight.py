@@ -0,0 +1,30 @@
+from explainer.highlight import QueryHighlighter
+
+
+def test_accents_are_matched_both_ways():
+    text = "O Rei de Valória visitou a cidade de Gólgota."
+    matches = QueryHighlighter("Onde fica valoria e golgotá?").find(text)
+
+    assert [(text[m["start"]:m["end"]], m["term"]) for m in matches] == [("Valória", "valoria"),
+                                                                        ("Gólgota", "golgota")]
+
+
+def test_singular_and_plural_forms_match():
+    text = "As regiões do norte. A região sul. Os itens mágicos e o item amaldiçoado."
+    highlighter = QueryHighlighter("Quais regiões têm um item?")
+    found = [text[m["start"]:m["end"]] for m in highlighter.find(text)]
+
+    assert found == ["regiões", "região", "itens", "item"]
+
+
+def test_highlight_marks_the_original_text():
+    result = QueryHighlighter("Quem é Zephyros?").highlight("Zephyros, o dragão. ZEPHYROS dorme.")
+
+    assert result["text"] == "**Zephyros**, o dragão. **ZEPHYROS** dorme."
+    assert [(m["start"], m["end"]) for m in result["matches"]] == [(0, 8), (20, 28)]
+
+
+def test_whole_words_and_metacharacters():
+    highlighter = QueryHighlighter("rei (c++) .*")
+    assert highlighter.find("O reino e o rei.") == [{"start": 12, "end": 15, "term": "rei"}]
+    assert QueryHighlighter("o que é?").find("O que é isso?") == []
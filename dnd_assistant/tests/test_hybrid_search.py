@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from conftest import CAMPAIGN
+from retrieval.index_factory import RerankedBinaryIndex, build_index, normalize, vector_lookup
+from retrieval.sparse import BM25Index, reciprocal_rank_fusion
+
+
+def _cosine(encoder, query, text):
+    return float(encoder.encode([query])[0] @ encoder.encode([text])[0])
+
+
+def test_bm25_ranks_exact_names_first():
+    index = BM25Index.build({i: chunk for i, chunk in enumerate(CAMPAIGN)})
+    hits = index.search("Onde dorme Zephyros?", 3)
+    assert hits[0][0] == 3
+    # Accents and case are folded
+    assert index.search("GOLGOTA", 1)[0][0] == 6
+
+
+def test_bm25_save_and_load(tmp_path):
+    index = BM25Index.build({i * 2: chunk for i, chunk in enumerate(CAMPAIGN)})
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert loaded.search("Barakas mercador", 2) == index.search("Barakas mercador", 2)
+    assert loaded.search("Barakas", 1)[0][0] == 4
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([(1, 0.9), (2, 0.8)], [(3, 7.0), (1, 5.0)], k=60)
+    assert [chunk_id for chunk_id, _ in fused] == [1, 3, 2]
+    assert fused[0][1] == {"rrf_score": pytest.approx(1 / 61 + 1 / 62), "dense_score": 0.9, "bm25_score": 5.0}
+    assert fused[1][1]["dense_score"] is None
+    assert len(reciprocal_rank_fusion([(1, 0.9), (2, 0.8)], [(3, 7.0)], top_k=2)) == 2
+
+
+def test_hybrid_score_is_the_cosine(retriever_factory, encoder):
+    retriever = retriever_factory(top_k=4)
+    query = "Quem é Zephyros e onde ele dorme?"
+    chunks = retriever.retrieve(query, return_scores=True)
+
+    assert chunks[0]["text"] == CAMPAIGN[3]["text"]
+    for chunk in chunks:
+        assert chunk["score"] == pytest.approx(_cosine(encoder, query, chunk["text"]), abs=1e-5)
+        assert chunk["rrf_score"] > 0
+
+
+def test_bm25_only_hits_get_their_cosine(retriever_factory, encoder):
+    retriever = retriever_factory()
+    query = "Quem é Barakas?"
+    embedding = normalize(encoder.encode([query]))[0]
+    hits = retriever._with_dense_scores(
+        [(2, {"rrf_score": 0.02, "dense_score": None, "bm25_score": 3.0})], embedding)
+    assert hits[0][1]["score"] == pytest.approx(_cosine(encoder, query, CAMPAIGN[2]["text"]), abs=1e-5)
+
+
+def test_threshold_applies_to_fused_hits(retriever_factory):
+    unfiltered = retriever_factory(top_k=10).retrieve("Valoria", return_scores=True)
+    threshold = sorted(chunk["score"] for chunk in unfiltered)[len(unfiltered) // 2]
+
+    filtered = retriever_factory(top_k=10, score_threshold=threshold).retrieve("Valoria", return_scores=True)
+    assert filtered
+    assert all(chunk["score"] >= threshold for chunk in filtered)
+    assert len(filtered) < len(unfiltered)
+
+
+def test_dense_only_scores(retriever_factory, encoder):
+    chunks = retriever_factory(hybrid=False, top_k=3).retrieve("Montanhas Geladas", return_scores=True)
+    assert len(chunks) == 3
+    for chunk in chunks:
+        assert set(chunk) >= {"id", "text", "source", "score"} and "rrf_score" not in chunk
+        assert chunk["score"] == pytest.approx(_cosine(encoder, "Montanhas Geladas", chunk["text"]), abs=1e-5)
+
+
+@pytest.mark.parametrize("index_type,tolerance", [
+    ("flat", 1e-6), ("hnsw", 1e-6), ("sq_fp16", 1e-3), ("sq_int8", 0.05), ("ivf_flat", 1e-6), ("ivf_pq", None)
+])
+def test_vector_lookup(index_type, tolerance):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((1000, 16)).astype("float32")
+    ids = np.arange(1000) * 3 + 1
+    index, built_type = build_index(vectors, ids, index_type=index_type, metric="cosine", nlist=4)
+    assert built_type == index_type
+    if index_type != "hnsw":
+        # IDs are no longer contiguous positions after a removal
+        index.remove_ids(ids[:10])
+
+    rows = [10, 999, 250]
+    found = vector_lookup(index)(ids[rows])
+    expected = normalize(vectors[rows])
+    if tolerance is None:
+        # Product quantization only approximates the vectors
+        assert ((found * expected).sum(axis=1) > 0.8).all()
+    else:
+        np.testing.assert_allclose(found, expected, atol=tolerance)
+
+
+def test_vector_lookup_binary():
+    rng = np.random.default_rng(0)
+    vectors = normalize(rng.standard_normal((50, 16)))
+    index, _ = build_index(vectors, np.arange(50), index_type="binary", metric="cosine")
+    reranked = RerankedBinaryIndex(index, vectors.astype("float16"), "cosine")
+    np.testing.assert_allclose(vector_lookup(reranked)([3, 7]), vectors[[3, 7]], atol=1e-3)
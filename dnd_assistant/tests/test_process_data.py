@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+pytest.importorskip("langchain")
+
+import process_data
+from create_embeddings import load_chunks, update_embeddings
+from retrieval.chunk_store import CHUNK_STORE_FILE, ChunkStore
+
+
+def _write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_deleted_campaign_file_leaves_the_index(tmp_path, fake_encode_texts):
+    raw = tmp_path / "raw"
+    processed = tmp_path / "processed"
+    models = tmp_path / "models"
+    raw.mkdir()
+    _write(raw / "npcs.txt", "O Rei Eldrith governa Valoria com justiça. " * 5)
+    _write(raw / "locais.txt", "A Floresta Sombria fica ao norte de Valoria. " * 5)
+
+    num_chunks = process_data.process_campaign_files(str(raw), str(processed), workers=1)
+    assert num_chunks == sum(1 for _ in load_chunks(str(processed))) > 0
+    update_embeddings(load_chunks(str(processed)), model_name="test-model", output_directory=str(models))
+    store = ChunkStore(os.path.join(models, CHUNK_STORE_FILE))
+    assert {chunk["source"] for _, chunk in store.items()} == {"npcs.txt", "locais.txt"}
+
+    os.remove(raw / "locais.txt")
+    process_data.process_campaign_files(str(raw), str(processed), workers=1)
+    assert sorted(os.listdir(processed)) == ["npcs_chunks.jsonl"]
+
+    _, index = update_embeddings(load_chunks(str(processed)), model_name="test-model",
+                                 output_directory=str(models))
+    store = ChunkStore(os.path.join(models, CHUNK_STORE_FILE))
+    assert {chunk["source"] for _, chunk in store.items()} == {"npcs.txt"}
+    assert index.ntotal == len(store)
+
+
+def test_legacy_chunk_file_of_deleted_campaign_file_is_removed(tmp_path):
+    raw = tmp_path / "raw"
+    processed = tmp_path / "processed"
+    raw.mkdir()
+    processed.mkdir()
+    _write(raw / "locais.txt", "A Floresta Sombria fica ao norte de Valoria. " * 5)
+    # Written by an older version, for a campaign file that no longer exists
+    _write(processed / "npcs_chunks.txt", "O Rei Eldrith governa Valoria.\n\n---\n\nBarakas é um mercador.")
+    _write(processed / "locais_chunks.txt", "A Floresta Sombria fica ao norte.")
+
+    process_data.process_campaign_files(str(raw), str(processed), workers=1)
+    assert "npcs_chunks.txt" not in os.listdir(processed)
+    assert {chunk["source"] for chunk in load_chunks(str(processed))} == {"locais.txt"}
+
+    os.remove(raw / "locais.txt")
+    process_data.process_campaign_files(str(raw), str(processed), workers=1)
+    assert os.listdir(processed) == []
+    assert list(load_chunks(str(processed))) == []
+
+
+def test_byte_offsets_point_into_the_raw_file(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    paragraph = "Gólgota, a cidade em ruínas,\r\n  é tomada por mortos-vivos.  Ninguém sabe por quê.\r\n\r\n"
+    with open(raw / "regioes.txt", "w", encoding="utf-8", newline="") as f:
+        f.write(paragraph * 40)
+    content = (raw / "regioes.txt").read_bytes()
+
+    # Small windows, so chunks also cross window boundaries
+    records = list(process_data.iter_campaign_chunks(str(raw), workers=1, window_size=500,
+                                                     chunk_size=120, chunk_overlap=30))
+    assert len(records) > 10
+    for record in records:
+        assert record["start"] is not None
+        raw_text = content[record["start"]:record["end"]].decode("utf-8")
+        assert process_data.clean_text(raw_text) == record["text"]
@@ -0,0 +1,109 @@
+import threading
+
+import numpy as np
+
+from retrieval.cache import QueryEmbeddingCache, normalize_query, query_key
+
+
+def test_normalize_query_collapses_whitespace_but_keeps_case():
+    assert normalize_query("  Quem é   o Rei?\n") == "Quem é o Rei?"
+    assert query_key("Quem é o Rei?", "model") != query_key("quem é o rei?", "model")
+    assert query_key("Quem é  o Rei?", "model") == query_key("Quem é o Rei?", "model")
+
+
+def test_key_depends_on_model():
+    assert query_key("Zephyros", "model-a") != query_key("Zephyros", "model-b")
+
+
+def test_memory_lru_eviction():
+    cache = QueryEmbeddingCache("model", max_size=2)
+    cache.put("a", np.ones(4))
+    cache.put("b", np.ones(4) * 2)
+    assert cache.get("a") is not None  # "a" becomes the most recent
+    cache.put("c", np.ones(4) * 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["memory_entries"] == 2
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    cache = QueryEmbeddingCache("org/model", cache_directory=str(tmp_path), num_shards=4)
+    vectors = {f"Pergunta {i}": np.arange(8, dtype="float32") + i for i in range(20)}
+    for query, vector in vectors.items():
+        cache.put(query, vector)
+
+    reopened = QueryEmbeddingCache("org/model", cache_directory=str(tmp_path), num_shards=4)
+    for query, vector in vectors.items():
+        np.testing.assert_array_equal(reopened.get(query), vector)
+    assert reopened.stats()["disk_hits"] == len(vectors)
+    assert reopened.get("pergunta 1") is None
+
+    # Another model never reads these vectors
+    other = QueryEmbeddingCache("org/other", cache_directory=str(tmp_path), num_shards=4)
+    assert other.get("Pergunta 1") is None
+
+
+def test_shards_from_older_key_scheme_are_ignored(tmp_path):
+    record = b"\0" * QueryEmbeddingCache.KEY_SIZE + np.ones(8, dtype="<f4").tobytes()
+    (tmp_path / "model-8d-00.bin").write_bytes(record)
+
+    cache = QueryEmbeddingCache("model", cache_directory=str(tmp_path))
+    assert cache.stats()["disk_entries"] == 0
+
+
+def test_concurrent_puts_and_gets(tmp_path):
+    cache = QueryEmbeddingCache("model", max_size=64, cache_directory=str(tmp_path), num_shards=2)
+    errors = []
+
+    def worker(thread):
+        try:
+            for i in range(200):
+                query = f"Pergunta {thread}-{i % 50}"
+                if cache.get(query) is None:
+                    cache.put(query, np.full(8, i % 50, dtype="float32"))
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(cache.memory) <= 64
+    reopened = QueryEmbeddingCache("model", cache_directory=str(tmp_path), num_shards=2)
+    for thread in range(8):
+        for i in range(50):
+            np.testing.assert_array_equal(reopened.get(f"Pergunta {thread}-{i}"),
+                                          np.full(8, i, dtype="float32"))
+
+
+def test_disk_tier_is_capped(tmp_path):
+    cache = QueryEmbeddingCache("model", cache_directory=str(tmp_path), num_shards=1, max_disk_entries=10)
+    for i in range(25):
+        cache.put(f"Pergunta {i}", np.full(4, i, dtype="float32"))
+
+    assert cache.stats()["disk_entries"] <= 10
+    assert cache.stats()["disk_evictions"] > 0
+    reopened = QueryEmbeddingCache("model", cache_directory=str(tmp_path), num_shards=1, max_disk_entries=10)
+    # The newest embeddings survive compaction, at their new rows
+    np.testing.assert_array_equal(reopened.get("Pergunta 24"), np.full(4, 24, dtype="float32"))
+    assert reopened.get("Pergunta 0") is None
+    assert reopened.stats()["disk_entries"] == cache.stats()["disk_entries"]
+
+
+def test_torn_append_is_truncated(tmp_path):
+    cache = QueryEmbeddingCache("model", cache_directory=str(tmp_path), num_shards=1)
+    cache.put("Pergunta 1", np.ones(4, dtype="float32"))
+    shard = next(tmp_path.iterdir())
+    with open(shard, "ab") as f:
+        f.write(b"\1" * 7)  # Half-written record
+
+    reopened = QueryEmbeddingCache("model", cache_directory=str(tmp_path), num_shards=1)
+    reopened.put("Pergunta 2", np.full(4, 2, dtype="float32"))
+    again = QueryEmbeddingCache("model", cache_directory=str(tmp_path), num_shards=1)
+    np.testing.assert_array_equal(again.get("Pergunta 1"), np.ones(4, dtype="float32"))
+    np.testing.assert_array_equal(again.get("Pergunta 2"), np.full(4, 2, dtype="float32"))
@@ -0,0 +1,76 @@
+"""Tests for reusing the search results of rephrased queries."""
+
+import numpy as np
+
+from conftest import CAMPAIGN
+from retrieval.cache import SemanticQueryCache, query_names
+from retrieval.sparse import BM25Index
+from retrieval.text import NameVocabulary
+
+
+def test_name_vocabulary():
+    vocabulary = NameVocabulary()
+    for chunk in CAMPAIGN:
+        vocabulary.add(chunk["text"])
+    names = vocabulary.names()
+
+    assert {"zephyros", "golgota", "velyria", "barakas", "valoria"} <= set(names)
+    # Written lowercase just as often, or a stopword
+    assert "rei" not in names
+    assert "reino" not in names
+    assert "o" not in names
+
+
+def test_names_are_saved_with_the_bm25_index(tmp_path):
+    index = BM25Index.build({i: chunk for i, chunk in enumerate(CAMPAIGN)})
+    index.save(str(tmp_path))
+    assert BM25Index.load(str(tmp_path)).names == index.names
+    assert "zephyros" in index.names
+
+
+def test_query_names_include_the_first_word():
+    names = {"golgota", "velyria", "zephyros"}
+    assert query_names("Gólgota é perigoso?", names) == {"golgota"}
+    assert query_names("onde fica velyria?", names) == {"velyria"}
+    assert query_names("Quem governa o reino?", names) == frozenset()
+
+
+def test_queries_without_names_are_not_cached():
+    cache = SemanticQueryCache({"zephyros"}, threshold=0.5)
+    vector = np.ones(4, dtype="float32")
+    cache.put("Quem governa o reino?", vector, 5, [(1, {"score": 0.9})])
+
+    assert cache.stats()["entries"] == 0
+    assert cache.get("Quem governa o reino?", vector, 5) is None
+
+
+def test_rephrased_query_reuses_results(retriever_factory):
+    retriever = retriever_factory(top_k=3)
+    first = retriever.retrieve("Onde dorme o dragão Zephyros?", return_scores=True)
+    second = retriever.retrieve("Zephyros, o dragão, dorme onde?", return_scores=True)
+
+    assert retriever.semantic_cache.stats()["hits"] == 1
+    assert [chunk["id"] for chunk in second] == [chunk["id"] for chunk in first]
+    assert retriever.canonical_query("Zephyros, o dragão, dorme onde?") == "Onde dorme o dragão Zephyros?"
+
+
+def test_query_about_another_entity_misses(retriever_factory):
+    # Low enough that the two questions are "similar", only the names differ
+    retriever = retriever_factory(top_k=3, semantic_cache_threshold=0.3)
+    velyria = retriever.retrieve("Velyria é perigosa?", return_scores=True)
+    golgota = retriever.retrieve("Gólgota é perigosa?", return_scores=True)
+
+    assert retriever.semantic_cache.stats()["hits"] == 0
+    assert golgota[0]["text"].startswith("Gólgota")
+    assert velyria[0]["text"].startswith("Velyria")
+    assert retriever.canonical_query("Gólgota é perigosa?") == "Gólgota é perigosa?"
+
+
+def test_results_are_reused_for_the_same_top_k_only():
+    cache = SemanticQueryCache({"zephyros"}, threshold=0.5)
+    vector = np.ones(4, dtype="float32")
+    hits = [(i, {"score": 1.0 - i / 10}) for i in range(8)]
+    cache.put("Onde dorme Zephyros?", vector, 8, hits)
+
+    assert cache.get("Onde dorme Zephyros?", vector, 3) is None
+    assert cache.get("Onde dorme Zephyros?", vector, 8) == hits
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import server
+from retrieval import rag
+
+
+def test_micro_batcher_groups_concurrent_items():
+    batches = []
+
+    def process(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    async def run():
+        batcher = server.MicroBatcher(process, max_batch_size=3, max_wait=0.05)
+        batcher.start()
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        batcher.worker.cancel()
+        return results, batcher.stats()
+
+    results, stats = asyncio.run(run())
+    assert results == [0, 2, 4, 6, 8]
+    assert batches == [[0, 1, 2], [3, 4]]
+    assert stats["batches"] == 2 and stats["items"] == 5
+
+
+def test_micro_batcher_reports_errors_to_every_item():
+    def process(items):
+        raise RuntimeError("model crashed")
+
+    async def run():
+        batcher = server.MicroBatcher(process, max_wait=0.01)
+        batcher.start()
+        results = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+        batcher.worker.cancel()
+        return results
+
+    assert [str(result) for result in asyncio.run(run())] == ["model crashed", "model crashed"]
+
+
+@pytest.fixture
+def campaign_server(retriever_factory, monkeypatch):
+    """CampaignServer class; retriever_factory makes its retriever encode with the hashing encoder."""
+    monkeypatch.setattr(rag.CampaignAssistant, "warm_up", lambda self, background=True: None)
+
+    return server.CampaignServer
+
+
+async def _request(port, method, path, body=None, raw=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = json.dumps(body).encode("utf-8") if body is not None else b""
+    head = f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(payload)}\r\n\r\n"
+    writer.write(raw if raw is not None else head.encode("latin-1") + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b"\r\n\r\n")
+    status = int(head.split(b" ")[1])
+    return status, head.decode("latin-1"), json.loads(content)
+
+
+def _start(campaign):
+    async def start():
+        campaign.retrieval_batcher.start()
+        campaign.generation_batcher.start()
+        listener = await asyncio.start_server(campaign.handle_connection, "127.0.0.1", 0)
+        return listener, listener.sockets[0].getsockname()[1]
+    return start()
+
+
+def test_each_request_keeps_its_own_top_k(models_directory, campaign_server):
+    campaign = campaign_server(models_directory)
+    query = "Quem é Zephyros e onde fica Velyria?"
+    alone = campaign.retriever.retrieve_many([query], top_k=3, return_scores=True)[0]
+
+    # In hybrid mode the candidate pool grows with top_k, so each top_k is searched on its own
+    searched = []
+    search_cached = campaign.retriever._search_cached
+
+    def spy(queries, query_embeddings, top_k):
+        searched.append((list(queries), top_k))
+        return search_cached(queries, query_embeddings, top_k)
+
+    campaign.retriever._search_cached = spy
+    batched = campaign._retrieve_batch([(query, 3), ("Onde fica Gólgota?", 8), ("Quem é Barakas?", 3)])
+    assert searched == [([query, "Quem é Barakas?"], 3), (["Onde fica Gólgota?"], 8)]
+    assert [chunk["id"] for chunk in batched[0]] == [chunk["id"] for chunk in alone]
+    assert [len(chunks) for chunks in batched] == [3, 8, 3]
+
+
+def test_busy_server_answers_503(models_directory, campaign_server):
+    campaign = campaign_server(models_directory, max_pending=1, batch_window_ms=1)
+    release = threading.Event()
+    retrieve_batch = campaign.retrieval_batcher.process_batch
+
+    def slow_batch(items):
+        release.wait(10)
+        return retrieve_batch(items)
+
+    campaign.retrieval_batcher.process_batch = slow_batch
+
+    async def run():
+        listener, port = await _start(campaign)
+        first = asyncio.create_task(_request(port, "POST", "/retrieve", {"query": "Quem é Barakas?"}))
+        while campaign.pending == 0:
+            await asyncio.sleep(0.01)
+        busy = await _request(port, "POST", "/retrieve", {"query": "Onde fica Velyria?"})
+        health = await _request(port, "GET", "/health")
+        release.set()
+        done = await first
+        listener.close()
+        return busy, health, done
+
+    busy, health, done = asyncio.run(run())
+    assert busy[0] == 503
+    assert "Retry-After: 1" in busy[1]
+    assert health[0] == 200 and health[2]["pending"] == 1
+    assert done[0] == 200 and done[2]["chunks"][0]["text"].startswith("Barakas")
+
+
+def test_truncated_body_times_out(models_directory, campaign_server, monkeypatch):
+    monkeypatch.setattr(server, "BODY_TIMEOUT", 0.2)
+    campaign = campaign_server(models_directory)
+
+    async def run():
+        listener, port = await _start(campaign)
+        raw = b"POST /retrieve HTTP/1.1\r\nContent-Length: 100\r\n\r\n{\"query\""
+        start_time = time.time()
+        response = await _request(port, "POST", "/retrieve", raw=raw)
+        listener.close()
+        return response, time.time() - start_time
+
+    (status, _, payload), elapsed = asyncio.run(run())
+    assert status == 408
+    assert elapsed < 5
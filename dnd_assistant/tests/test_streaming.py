@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+from retrieval.rag import CampaignAssistant
+
+CHUNKS = [{"text": "O Rei Eldrith IV governa o Reino de Valoria.", "source": "npcs.txt", "score": 0.9}]
+
+
+def _assistant(tmp_path, stream):
+    assistant = CampaignAssistant(retriever=SimpleNamespace(models_directory=str(tmp_path)),
+                                  answer_cache_size=0)
+    assistant._generator = SimpleNamespace(tokenizer=None)
+    assistant._stream_prompt = stream
+    return assistant
+
+
+def test_streamed_answer(tmp_path):
+    def stream(prompt):
+        yield "O rei "
+        yield "é Eldrith."
+
+    received = []
+    response = _assistant(tmp_path, stream).answer_from_chunks("Quem é o rei?", CHUNKS,
+                                                                on_token=received.append)
+    assert received == ["O rei ", "é Eldrith."]
+    assert response["answer"] == "O rei é Eldrith."
+    assert "streaming_failed" not in response
+
+
+def test_generation_failing_mid_stream_is_flagged(tmp_path):
+    def stream(prompt):
+        yield "O rei "
+        raise RuntimeError("out of memory")
+
+    received = []
+    response = _assistant(tmp_path, stream).answer_from_chunks("Quem é o rei?", CHUNKS,
+                                                                on_token=received.append)
+    assert received == ["O rei "]
+    assert response["streaming_failed"] is True
+    assert response["generation_error"] == "out of memory"
+    assert response["answer"].startswith("Based on your campaign information")
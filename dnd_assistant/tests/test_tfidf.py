@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+
+from conftest import CAMPAIGN
+from explainer import tfidf
+from explainer.xai_simple import SimpleRetrieverExplainer
+
+
+def test_model_is_saved_with_the_index(models_directory):
+    model = tfidf.load_tfidf_model(models_directory)
+    assert model is not None
+    # Kept in memory until the file changes
+    assert tfidf.load_tfidf_model(models_directory) is model
+    assert "zephyro" in set(model["feature_names"])
+    assert tfidf.load_tfidf_model(os.path.join(models_directory, "missing")) is None
+
+
+def test_save_and_reload_after_a_rebuild(tmp_path):
+    directory = str(tmp_path)
+    tfidf.save_tfidf_model(tfidf.build_tfidf_model({i: chunk for i, chunk in enumerate(CAMPAIGN[:5])}), directory)
+    first = tfidf.load_tfidf_model(directory)
+    assert first["matrix"].shape[0] == 5
+
+    tfidf.save_tfidf_model(tfidf.build_tfidf_model({i: chunk for i, chunk in enumerate(CAMPAIGN)}), directory)
+    path = os.path.join(directory, tfidf.TFIDF_FILE)
+    os.utime(path, (os.path.getatime(path), os.path.getmtime(path) + 10))
+    assert tfidf.load_tfidf_model(directory)["matrix"].shape[0] == len(CAMPAIGN)
+
+
+def test_chunk_rows_match_a_fresh_transform():
+    # Sparse IDs, as left by incremental updates
+    model = tfidf.build_tfidf_model({i * 3: chunk for i, chunk in enumerate(CAMPAIGN)})
+    chunks = [dict(CAMPAIGN[4], id=12), dict(CAMPAIGN[0], id=0)]
+    expected = model["vectorizer"].transform([chunk["text"] for chunk in chunks]).toarray()
+
+    np.testing.assert_allclose(tfidf.chunk_rows(model, chunks).toarray(), expected, rtol=1e-6)
+    # Chunks without a precomputed row are transformed
+    np.testing.assert_allclose(tfidf.chunk_rows(model, [dict(CAMPAIGN[4], id=99), CAMPAIGN[0]]).toarray(),
+                               expected, rtol=1e-6)
+
+
+def test_explainer_uses_the_saved_model(retriever_factory, models_directory):
+    retriever = retriever_factory(top_k=3)
+    chunks = retriever.retrieve("Onde dorme Zephyros?", return_scores=True)
+    explanation = SimpleRetrieverExplainer(models_directory).explain_retrieval("Onde dorme Zephyros?", chunks)
+
+    assert "zephyro" in explanation["important_query_terms"]
+    best = explanation["chunk_similarities"][0]
+    assert chunks[best["index"]]["text"].startswith("Zephyros")